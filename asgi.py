@@ -0,0 +1,8 @@
+# ezasdf-users/asgi.py
+""" usage: hypercorn -b 0.0.0.0:5000 --keep-alive 75 asgi:app """
+
+
+from project.aio import asgi2, create_asgi_app
+
+
+app = asgi2(create_asgi_app())
@@ -1,15 +1,26 @@
 #!/bin/sh
 
 
-echo "Waiting for postgres..."
+case "$APP_SETTINGS" in
+    *Embedded*)
+        echo "Using the embedded database"
+        ;;
+    *)
+        echo "Waiting for postgres..."
 
-while ! nc -z users-db 5432;
-do
-    sleep 0.1
-done
+        while ! nc -z users-db 5432;
+        do
+            sleep 0.1
+        done
 
-echo "PostgreSQL started"
+        echo "PostgreSQL started"
+        ;;
+esac
 
 flask recreate_db
 flask seed_db
-gunicorn -b 0.0.0.0:5000 ezasdf_users:app
+if [ -n "$ASGI" ]; then
+    hypercorn -b 0.0.0.0:5000 --keep-alive 75 asgi:app
+else
+    gunicorn -b 0.0.0.0:5000 wsgi:app
+fi
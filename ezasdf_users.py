@@ -1,9 +1,10 @@
 # ezasdf-users/ezasdf_users.py
 
 
+import os
+import sys
 import unittest
 
-import coverage
 import click
 
 from flask_migrate import Migrate
@@ -12,14 +13,17 @@ from project import create_app, db
 from project.api.models import User
 
 
-COV = coverage.coverage(
-    branch=True,
-    include='project/*',
-    omit=[
-        'project/tests/*'
-    ]
-)
-COV.start()
+COV = None
+if os.getenv('FLASK_COVERAGE'):
+    import coverage
+    COV = coverage.coverage(
+        branch=True,
+        include='project/*',
+        omit=[
+            'project/tests/*'
+        ]
+    )
+    COV.start()
 
 
 app = create_app()
@@ -37,13 +41,20 @@ def make_shell_context():
 
 @app.cli.command()
 @click.option('--coverage/--no-coverage', default=False, help='Enable code coverage')
-def test(coverage):
+@click.option('--parallel', default=1, help='Number of worker processes, each with its own database')
+def test(coverage, parallel):
     """ Run the unit tests. """
 
+    if parallel > 1:
+        from project.tests.runner import run_parallel
+        sys.exit(run_parallel(parallel))
+    if coverage and not COV:
+        os.environ['FLASK_COVERAGE'] = '1'
+        os.execv(sys.executable, [sys.executable] + sys.argv)
     tests = unittest.TestLoader().discover('project/tests')
     result = unittest.TextTestRunner(verbosity=2).run(tests)
     if result.wasSuccessful():
-        if coverage:
+        if COV:
             COV.stop()
             COV.save()
             print('Coverage Summary:')
@@ -54,6 +65,105 @@ def test(coverage):
     return 1
 
 
+@app.cli.command('slow-queries')
+@click.option('--path', default=None, help='Slow query log, defaults to SLOW_QUERY_LOG')
+@click.option('--top', default=10, help='Number of statements to show')
+def slow_queries(path, top):
+    """ Summarizes the slow query log by statement. """
+
+    from project.api.slow_queries import summarize
+    for group in summarize(path or app.config.get('SLOW_QUERY_LOG'), top):
+        print('{count} x {mean_ms:.1f} ms mean, {max_ms:.1f} ms max, {total_ms:.1f} ms total {routes}'.format(**group))
+        print('    {statement}'.format(**group))
+        for line in group['explain'] or []:
+            print('        {line}'.format(line=line))
+
+
+@app.cli.command('dispatch-events')
+@click.option('--once', is_flag=True, help='Deliver one batch and exit')
+def dispatch_events(once):
+    """ Delivers outbox events to EVENTS_SINK. """
+
+    import time
+    from project.api.outbox import Dispatcher
+    dispatcher = Dispatcher.from_config(app.config)
+    while True:
+        delivered, failed = dispatcher.dispatch()
+        if delivered or failed:
+            print('{delivered} delivered, {failed} failed'.format(delivered=delivered, failed=failed))
+        if once:
+            return
+        if delivered + failed < dispatcher.batch_size:
+            time.sleep(app.config.get('EVENTS_POLL_SECONDS'))
+
+
+@app.cli.command()
+@click.option('--concurrency', default=None, type=int, help='Jobs run at once, defaults to JOBS_CONCURRENCY')
+@click.option('--once', is_flag=True, help='Exit once no job is due')
+def worker(concurrency, once):
+    """ Runs queued background jobs at JOBS_NICE priority. """
+
+    from project.api.jobs import Worker
+    if app.config.get('JOBS_NICE'):
+        os.nice(app.config.get('JOBS_NICE'))
+    Worker(
+        app,
+        concurrency or app.config.get('JOBS_CONCURRENCY'),
+        app.config.get('JOBS_POLL_SECONDS')
+    ).run(once)
+
+
+@app.cli.command('memory-report')
+@click.argument('path')
+@click.option('--since', default=None, help='Earlier snapshot to report growth from')
+@click.option('--top', default=20, help='Number of modules and sites to show')
+def memory_report(path, since, top):
+    """ Summarizes a dumped tracemalloc snapshot by project module and allocation site. """
+
+    import tracemalloc
+    from project.api.memory import report
+    result = report(
+        tracemalloc.Snapshot.load(path),
+        top,
+        tracemalloc.Snapshot.load(since) if since else None
+    )
+    print('{total} bytes traced'.format(total=result['total']))
+    for name in ('module', 'site'):
+        print('')
+        for row in result[name + 's']:
+            if since:
+                print('{size_diff:>+12} {count_diff:>+8} {key}'.format(key=row[name], **row))
+            else:
+                print('{size:>12} {count:>8} {key}'.format(key=row[name], **row))
+
+
+@app.cli.command('refresh-user-stats')
+def refresh_stats():
+    """ Recounts the maintained user stats. """
+
+    from project.api.models import refresh_user_stats
+    print(refresh_user_stats(db.session).to_json())
+    db.session.commit()
+
+
+@app.cli.command('partition-users')
+@click.option('--partitions', default=16, help='Number of hash partitions')
+@click.option('--dry-run', is_flag=True, help='Print the migration instead of running it')
+def partition_users(partitions, dry_run):
+    """ Migrates users to a table hash partitioned on id.
+    Set USERS_PARTITIONED afterwards so lookups go through user_identities.
+    """
+
+    from sqlalchemy import text
+    from project.api.partitioning import partition_statements
+    statements = partition_statements(partitions)
+    if dry_run:
+        print(statements)
+        return
+    db.session.execute(text(statements))
+    db.session.commit()
+
+
 @app.cli.command()
 def recreate_db():
     """ Recreates the database. """
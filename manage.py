@@ -1,8 +1,9 @@
 # asdf-users/manage.py
 
 
+import os
+import sys
 import unittest
-import coverage
 
 from flask_script import Manager
 from flask_migrate import Migrate, MigrateCommand
@@ -11,14 +12,17 @@ from project import create_app, db
 from project.api.models import User
 
 
-COV = coverage.coverage(
-    branch=True,
-    include='project/*',
-    omit=[
-        'project/tests/*'
-    ]
-)
-COV.start()
+COV = None
+if os.getenv('FLASK_COVERAGE'):
+    import coverage
+    COV = coverage.coverage(
+        branch=True,
+        include='project/*',
+        omit=[
+            'project/tests/*'
+        ]
+    )
+    COV.start()
 
 
 app = create_app()
@@ -32,13 +36,19 @@ manager.add_command('db', MigrateCommand)
 
 
 @manager.command
-def test(cov=False):
+def test(cov=False, parallel=1):
     """ Runs the unit tests without coverage. """
 
+    if parallel > 1:
+        from project.tests.runner import run_parallel
+        return run_parallel(parallel)
+    if cov and not COV:
+        os.environ['FLASK_COVERAGE'] = '1'
+        os.execv(sys.executable, [sys.executable] + sys.argv)
     tests = unittest.TestLoader().discover('project/tests', pattern='test*.py')
     result = unittest.TextTestRunner(verbosity=2).run(tests)
     if result.wasSuccessful():
-        if cov:
+        if COV:
             COV.stop()
             COV.save()
             print('Coverage Summary:')
@@ -4,11 +4,11 @@
 import os
 
 from flask import Flask
-from flask_cors import CORS
-from flask_sqlalchemy import SQLAlchemy
 from flask_bcrypt import Bcrypt
 
-db = SQLAlchemy()
+from project.routing import RoutingSQLAlchemy
+
+db = RoutingSQLAlchemy()
 bcrypt = Bcrypt()
 
 
@@ -18,15 +18,51 @@ def create_app():
     :return: Flask app
     """
 
+    from flask_cors import CORS
+
     app = Flask(__name__)
     app.config.from_object(os.getenv("APP_SETTINGS"))
     CORS(app)
     db.init_app(app)
     bcrypt.init_app(app)
 
+    from project.sqlite import init_sqlite
+    init_sqlite(app)
+
     from project.api.users import users_blueprint
     app.register_blueprint(users_blueprint)
     from project.api.auth import auth_blueprint
     app.register_blueprint(auth_blueprint)
+    from project.api.metrics import metrics_blueprint
+    app.register_blueprint(metrics_blueprint)
+    from project.api.jobs import jobs_blueprint
+    app.register_blueprint(jobs_blueprint)
+    from project.api.profiling import profiling_blueprint
+    app.register_blueprint(profiling_blueprint)
+    from project.api.memory import memory_blueprint
+    app.register_blueprint(memory_blueprint)
+
+    from project.api.access_log import init_access_log
+    init_access_log(app)
+    from project.api.tracing import init_tracing
+    init_tracing(app)
+    from project.api.slow_queries import init_slow_query_log
+    init_slow_query_log(app)
+    from project.api.compression import init_compression
+    init_compression(app)
+    from project.api.profiling import init_profiling
+    init_profiling(app)
+    from project.api.memory import init_memory
+    init_memory(app)
+    from project.api.coalescing import init_coalescing
+    init_coalescing(app)
+    from project.proxy import init_proxy_fix
+    init_proxy_fix(app)
+
+    from werkzeug.exceptions import RequestEntityTooLarge
+    from project.api.admission import Overloaded
+    from project.api.utils import overloaded_response, payload_too_large_response
+    app.register_error_handler(Overloaded, overloaded_response)
+    app.register_error_handler(RequestEntityTooLarge, payload_too_large_response)
 
     return app
@@ -0,0 +1,329 @@
+# ezasdf-users/project/aio.py
+""" Async deployment of the users and auth API.
+
+Only GET /auth/profile, the token verification hot path, is native: it
+reads its user with an asyncpg pool, so a request waiting on the database
+holds a coroutine instead of a worker thread. Its response is still
+rendered by the Flask app's hooks and helpers, so negotiation, compression,
+access logs, tracing, replica stickiness and CORS match the Flask route.
+
+Signin, signup and every other route are served by the Flask app in
+starlette's thread pool, so password hashing runs in those threads and
+never on the event loop, but those routes hold a thread while they wait.
+"""
+
+
+import itertools
+import time
+from contextlib import contextmanager
+
+import asyncpg
+from flask import g, request
+from sqlalchemy.engine.url import make_url
+from starlette.applications import Starlette
+from starlette.concurrency import run_in_threadpool
+from starlette.middleware.wsgi import WSGIMiddleware, build_environ
+from starlette.responses import Response
+from starlette.routing import Mount, Route
+
+from project import create_app
+from project.api.access_log import add_query_time
+from project.api.models import User
+from project.api.tracing import finish_span, start_span
+from project.api.utils import claims_fresh, error_response, success_response
+from project.proxy import trusted_environ
+from project.routing import use_replica
+
+
+USER_BY_ID = 'SELECT id, username, email, active, created_at FROM users WHERE id = $1'
+
+
+def asyncpg_dsn(uri):
+    """ Converts an SQLAlchemy database uri to an asyncpg dsn.
+
+    :param uri:
+    :return: str
+    """
+
+    url = make_url(uri)
+    url.drivername = 'postgresql'
+    return str(url)
+
+
+def asgi2(app):
+    """ Wraps an ASGI 3 app for servers that speak ASGI 2, like hypercorn 0.5.
+
+    :param app:
+    :return: ASGI 2 app
+    """
+
+    def instance(scope):
+        """ Binds the scope.
+
+        :param scope:
+        :return: coroutine function
+        """
+
+        async def call(receive, send):
+            await app(scope, receive, send)
+
+        return call
+
+    return instance
+
+
+class AsyncAPI:
+    """ Native async routes of the users and auth API. """
+
+    def __init__(self, flask_app):
+        """ __init__
+
+        :param flask_app: app serving config, rendering and the remaining routes
+        """
+
+        self.flask_app = flask_app
+        self.config = flask_app.config
+        self.pool = None
+        self.replica_pools = []
+        self.replicas = None
+
+    async def create_pool(self, uri):
+        """ Opens a connection pool to the database at uri.
+
+        :param uri:
+        :return: asyncpg Pool
+        """
+
+        return await asyncpg.create_pool(
+            asyncpg_dsn(uri),
+            min_size=self.config.get('ASYNC_POOL_MIN_SIZE'),
+            max_size=self.config.get('ASYNC_POOL_MAX_SIZE')
+        )
+
+    async def startup(self):
+        """ Opens the primary and replica connection pools. """
+
+        self.pool = await self.create_pool(self.config.get('SQLALCHEMY_DATABASE_URI'))
+        self.replica_pools = [await self.create_pool(uri) for uri in self.config.get('SQLALCHEMY_REPLICA_URIS') or ()]
+        self.replicas = itertools.cycle(self.replica_pools) if self.replica_pools else None
+
+    async def shutdown(self):
+        """ Closes the connection pools. """
+
+        for pool in [self.pool] + self.replica_pools:
+            await pool.close()
+
+    def pick_pool(self):
+        """ Picks the pool of the current request, a replica when use_replica allows.
+
+        :return: asyncpg Pool
+        """
+
+        if self.replicas is not None and use_replica():
+            return next(self.replicas)
+        return self.pool
+
+    @contextmanager
+    def flask_request(self, app_context, request_context):
+        """ Context manager
+        Enters the Flask contexts of a native request for one synchronous step.
+        The contexts are never held across an await, and g lives on the
+        app context, so it carries over between steps.
+
+        :param app_context:
+        :param request_context:
+        """
+
+        app_context.push()
+        request_context.push()
+        try:
+            yield
+        finally:
+            request_context.pop()
+            app_context.pop()
+
+    def respond(self, status, headers, body):
+        """ Generates a starlette response carrying exactly the given headers.
+
+        :param status: integer
+        :param headers: list of (name, value)
+        :param body: bytes
+        :return: starlette response
+        """
+
+        response = Response(body, status_code=status)
+        response.raw_headers = [
+            (name.lower().encode('latin-1'), value.encode('latin-1'))
+            for name, value in headers
+        ]
+        return response
+
+    def call_wsgi(self, environ):
+        """ Serves a request with the whole Flask WSGI stack.
+
+        :param environ:
+        :return: (status, headers, body)
+        """
+
+        started = {}
+
+        def start_response(status, headers, exc_info=None):
+            started['status'], started['headers'] = int(status.split(' ', 1)[0]), headers
+
+        app_iter = self.flask_app(environ, start_response)
+        try:
+            body = b''.join(app_iter)
+        finally:
+            if hasattr(app_iter, 'close'):
+                app_iter.close()
+        return started['status'], started['headers'], body
+
+    async def get_profile(self, request):
+        """ GET /auth/profile
+        Fetches the user's profile data.
+        Mirrors the Flask route: the before request hooks run first,
+        the user is read natively, and the response passes through the
+        after request hooks. The hooks may block on file writes, so both
+        steps run in the thread pool and only the read runs on the loop.
+        Requests asking to be profiled are served by the Flask app in a
+        thread, under the profiling middleware.
+
+        :param request:
+        :return: starlette response
+        """
+
+        started = time.time()
+        environ = build_environ(request.scope, b'')
+        environ['SERVER_PORT'] = str(environ['SERVER_PORT'])
+        if 'HTTP_X_PROFILE' in environ:
+            return self.respond(*await run_in_threadpool(self.call_wsgi, environ))
+        trusted_environ(environ, self.flask_app)
+        app_context = self.flask_app.app_context()
+        request_context = self.flask_app.request_context(environ)
+        response, claims, pool = await run_in_threadpool(self.before_read, app_context, request_context, started)
+        user = query_started = query_duration = None
+        if claims is not None:
+            query_started = time.time()
+            async with pool.acquire() as conn:
+                user = await conn.fetchrow(USER_BY_ID, claims['sub'])
+            query_duration = time.time() - query_started
+        return self.respond(*await run_in_threadpool(
+            self.after_read, app_context, request_context, response, claims, user, query_started, query_duration
+        ))
+
+    def before_read(self, app_context, request_context, started):
+        """ Runs the before request hooks and authenticates a native request.
+
+        :param app_context:
+        :param request_context:
+        :param started: time the request arrived
+        :return: (response|None, claims|None, pool|None)
+        """
+
+        with self.flask_request(app_context, request_context):
+            self.flask_app.try_trigger_before_first_request_functions()
+            response = self.flask_app.preprocess_request()
+            if response is not None:
+                return response, None, None
+            g.access_log_started = started
+            response, claims = self.authenticate()
+            return response, claims, self.pick_pool() if claims is not None else None
+
+    def after_read(self, app_context, request_context, response, claims, user, query_started, query_duration):
+        """ Records the read, renders the response and runs the after request hooks.
+
+        :param app_context:
+        :param request_context:
+        :param response: early response, if the request was answered before the read
+        :param claims:
+        :param user: asyncpg Record|None
+        :param query_started:
+        :param query_duration:
+        :return: (status, headers, body)
+        """
+
+        with self.flask_request(app_context, request_context):
+            if claims is not None:
+                add_query_time(None, None, USER_BY_ID, (claims['sub'],), False, query_started, query_duration)
+                child = start_span('db.query', statement=USER_BY_ID)
+                if child is not None:
+                    child.start = query_started
+                    finish_span(child)
+                response = self.profile(claims, user)
+            response = self.flask_app.process_response(self.flask_app.make_response(response))
+            return response.status_code, list(response.headers), response.get_data()
+
+    def authenticate(self):
+        """ Decodes the token in the header, as the authenticate decorator does.
+
+        :return: (error response|None, claims|None)
+        """
+
+        auth_header = request.headers.get('Authorization')
+        if not auth_header:
+            return (error_response('Provide a valid token.'), 403), None
+        claims = User.decode_jwt_claims(auth_header[7:])
+        if isinstance(claims, str):
+            return (error_response(claims), 401), None
+        g.token_claims = claims
+        g.user = None
+        return None, claims
+
+    def profile(self, claims, user):
+        """ Answers the profile route for a read user row.
+
+        :param claims:
+        :param user: asyncpg Record|None
+        :return: flask response
+        """
+
+        active = claims['active'] if claims_fresh(claims) else user is not None and user['active']
+        if user is None or not active:
+            return error_response(
+                'Something went wrong. Please contact us.'
+            ), 401
+        g.user_id = claims['sub']
+        return success_response(
+            "Fetched {email}'s profile data.".format(email=user['email']),
+            data={
+                'id': user['id'],
+                'username': user['username'],
+                'email': user['email'],
+                'active': user['active'],
+                'created_at': user['created_at']
+            }
+        ), 200
+
+    def wsgi(self, environ, start_response):
+        """ Serves a fallback request with the Flask app.
+        starlette passes SERVER_PORT as an int, werkzeug expects a str.
+
+        :param environ:
+        :param start_response:
+        :return: iterable
+        """
+
+        environ['SERVER_PORT'] = str(environ['SERVER_PORT'])
+        return self.flask_app(environ, start_response)
+
+    def routes(self, native=True):
+        """ Lists the native routes, ahead of the Flask fallback.
+
+        :param native: serve the native routes, or everything with the Flask app
+        :return: list of Route|Mount
+        """
+
+        routes = [Route('/auth/profile', self.get_profile, methods=['GET'])] if native else []
+        return routes + [Mount('', app=WSGIMiddleware(self.wsgi))]
+
+
+def create_asgi_app(flask_app=None, native=True):
+    """ Create the ASGI app.
+
+    :param flask_app: defaults to a new Flask app
+    :param native: serve the native routes, or everything with the Flask app
+    :return: ASGI 3 app
+    """
+
+    api = AsyncAPI(flask_app or create_app())
+    return Starlette(routes=api.routes(native), on_startup=[api.startup], on_shutdown=[api.shutdown])
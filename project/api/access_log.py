@@ -0,0 +1,148 @@
+# ezasdf-users/project/api/access_log.py
+
+
+import atexit
+import datetime
+import json
+import logging
+import queue
+import random
+import sys
+import threading
+import time
+from logging.handlers import QueueHandler, QueueListener
+
+from flask import current_app, g, has_request_context, request
+
+from project.api.query_timing import on_query
+
+
+logger = logging.getLogger('project.access')
+logger.propagate = False
+listener = None
+listener_lock = threading.Lock()
+
+
+class JSONFormatter(logging.Formatter):
+    """ Formats access records as one JSON object per line. """
+
+    def format(self, record):
+        """ Formats the record's access dict.
+
+        :param record:
+        :return: str
+        """
+
+        return json.dumps(record.msg, default=str, separators=(',', ':'))
+
+
+class DroppingQueueHandler(QueueHandler):
+    """ Queue handler that leaves formatting to the listener thread
+    and drops records instead of blocking when the queue is full.
+    """
+
+    dropped = 0
+
+    def prepare(self, record):
+        """ Enqueues the record as is so formatting happens off the request thread.
+
+        :param record:
+        :return: record
+        """
+
+        return record
+
+    def enqueue(self, record):
+        """ Enqueues the record unless the queue is full.
+
+        :param record:
+        """
+
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+def get_listener(queue_size):
+    """ Starts the process wide access log listener on first use.
+
+    :param queue_size:
+    :return: QueueListener
+    """
+
+    global listener
+    if listener is None:
+        with listener_lock:
+            if listener is None:
+                records = queue.Queue(queue_size)
+                handler = logging.StreamHandler(sys.stdout)
+                handler.setFormatter(JSONFormatter())
+                logger.addHandler(DroppingQueueHandler(records))
+                logger.setLevel(logging.INFO)
+                listener = QueueListener(records, handler)
+                listener.start()
+                atexit.register(listener.stop)
+    return listener
+
+
+@on_query
+def add_query_time(conn, cursor, statement, parameters, executemany, started, duration):
+    """ Adds a statement's duration to the request's database time. """
+
+    if has_request_context() and 'access_log_started' in g:
+        g.db_seconds += duration
+        g.db_queries += 1
+
+
+def start_request_timer():
+    """ Before request hook
+    Starts timing the request.
+    """
+
+    g.access_log_started = time.time()
+    g.user_id = None
+    g.db_seconds = 0
+    g.db_queries = 0
+
+
+def log_request(response):
+    """ After request hook
+    Logs the request unless it is sampled out.
+    Error responses are always logged.
+
+    :param response:
+    :return: flask response
+    """
+
+    config = current_app.config
+    if not config.get('ACCESS_LOG_ENABLED') or 'access_log_started' not in g:
+        return response
+    sample_rate = config.get('ACCESS_LOG_SAMPLE_RATES').get(request.endpoint, 1.0)
+    if response.status_code < 400 and random.random() >= sample_rate:
+        return response
+    get_listener(config.get('ACCESS_LOG_QUEUE_SIZE'))
+    logger.info({
+        'time': datetime.datetime.utcnow().isoformat() + 'Z',
+        'method': request.method,
+        'route': request.url_rule.rule if request.url_rule else None,
+        'path': request.path,
+        'status': response.status_code,
+        'duration_ms': round((time.time() - g.access_log_started) * 1000, 3),
+        'db_ms': round(g.db_seconds * 1000, 3),
+        'queries': g.db_queries,
+        'user_id': g.get('user_id'),
+        'remote_addr': request.remote_addr,
+        'sample_rate': sample_rate
+    })
+    return response
+
+
+def init_access_log(app):
+    """ Registers the access log hooks on the app.
+
+    :param app:
+    """
+
+    app.before_request(start_request_timer)
+    app.after_request(log_request)
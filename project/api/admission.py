@@ -0,0 +1,219 @@
+# ezasdf-users/project/api/admission.py
+
+
+import fcntl
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+from flask import current_app
+
+
+class Overloaded(Exception):
+    """ Raised when work is not admitted. """
+
+    def __init__(self, retry_after):
+        """ __init__
+
+        :param retry_after: seconds the client should wait
+        """
+
+        super().__init__('Overloaded.')
+        self.retry_after = retry_after
+
+
+class HostSlots:
+    """ Slots shared by every process on the host, one lock file each.
+    The kernel drops the locks of a process that dies, so a crashed
+    worker never leaks a slot.
+    """
+
+    def __init__(self, directory, count, poll_seconds=0.005):
+        """ __init__
+
+        :param directory: where the lock files live
+        :param count: slots on the host
+        :param poll_seconds: seconds between attempts while every slot is taken
+        """
+
+        self.directory = directory
+        self.count = count
+        self.poll_seconds = poll_seconds
+        os.makedirs(directory, exist_ok=True)
+
+    def try_lock(self, index):
+        """ Takes the slot at index if it is free.
+        Each attempt opens its own file, so threads of one process
+        never share a lock.
+
+        :param index:
+        :return: file descriptor|None
+        """
+
+        fd = os.open(os.path.join(self.directory, '{index}.lock'.format(index=index)), os.O_RDWR | os.O_CREAT)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            os.close(fd)
+            return None
+        return fd
+
+    def acquire(self, timeout):
+        """ Waits for a free slot.
+
+        :param timeout: seconds
+        :return: file descriptor|None if the deadline passed
+        """
+
+        deadline = time.time() + timeout
+        first = os.getpid() % max(self.count, 1)
+        while True:
+            for offset in range(self.count):
+                fd = self.try_lock((first + offset) % self.count)
+                if fd is not None:
+                    return fd
+            if time.time() >= deadline:
+                return None
+            time.sleep(self.poll_seconds)
+
+    @staticmethod
+    def release(fd):
+        """ Frees a slot.
+
+        :param fd:
+        """
+
+        os.close(fd)
+
+
+class AdmissionLimiter:
+    """ Limits concurrent work with a bounded, deadline aware wait queue.
+    With host slots, admitted work also waits for one of the slots
+    every process on the host shares.
+    """
+
+    def __init__(self, concurrency, queue_size, timeout, retry_after=1, host_slots=None):
+        """ __init__
+
+        :param concurrency: work allowed to run at once in this process
+        :param queue_size: work allowed to wait for a slot in this process
+        :param timeout: seconds work may wait for a slot
+        :param retry_after: seconds rejected clients should wait
+        :param host_slots: HostSlots|None
+        """
+
+        self.concurrency = concurrency
+        self.queue_size = queue_size
+        self.timeout = timeout
+        self.retry_after = retry_after
+        self.host_slots = host_slots
+        self.condition = threading.Condition()
+        self.active = 0
+        self.waiting = 0
+        self.admitted = 0
+        self.rejected = 0
+        self.timed_out = 0
+
+    def acquire(self):
+        """ Waits for a slot.
+
+        :raises Overloaded: if the queue is full or the deadline passes
+        """
+
+        with self.condition:
+            if self.active >= self.concurrency or self.waiting:
+                if self.waiting >= self.queue_size:
+                    self.rejected += 1
+                    raise Overloaded(self.retry_after)
+                deadline = time.time() + self.timeout
+                self.waiting += 1
+                try:
+                    while self.active >= self.concurrency:
+                        remaining = deadline - time.time()
+                        if remaining <= 0:
+                            self.timed_out += 1
+                            raise Overloaded(self.retry_after)
+                        self.condition.wait(remaining)
+                finally:
+                    self.waiting -= 1
+            self.active += 1
+            self.admitted += 1
+
+    def release(self):
+        """ Frees a slot and wakes the next waiter. """
+
+        with self.condition:
+            self.active -= 1
+            self.condition.notify()
+
+    @contextmanager
+    def slot(self):
+        """ Context manager
+        Runs the block in an admitted slot.
+        """
+
+        start = time.time()
+        self.acquire()
+        try:
+            if self.host_slots is None:
+                yield
+                return
+            fd = self.host_slots.acquire(self.timeout - (time.time() - start))
+            if fd is None:
+                with self.condition:
+                    self.timed_out += 1
+                raise Overloaded(self.retry_after)
+            try:
+                yield
+            finally:
+                self.host_slots.release(fd)
+        finally:
+            self.release()
+
+    def stats(self):
+        """ Reports the limiter's queue depth and counters.
+
+        :return: dict
+        """
+
+        with self.condition:
+            return {
+                'concurrency': self.concurrency,
+                'host_slots': self.host_slots.count if self.host_slots is not None else None,
+                'active': self.active,
+                'queue_depth': self.waiting,
+                'admitted': self.admitted,
+                'rejected': self.rejected,
+                'timed_out': self.timed_out
+            }
+
+
+def get_hashing_limiter():
+    """ Fetches the app's password hashing limiter, creating it from config.
+    HASH_CONCURRENCY hashes run at once across every process sharing
+    HASH_SLOTS_DIR, and within this process.
+
+    :return: AdmissionLimiter
+    """
+
+    limiter = current_app.extensions.get('hashing_limiter')
+    if limiter is None:
+        directory = current_app.config.get('HASH_SLOTS_DIR')
+        limiter = current_app.extensions['hashing_limiter'] = AdmissionLimiter(
+            current_app.config.get('HASH_CONCURRENCY'),
+            current_app.config.get('HASH_QUEUE_SIZE'),
+            current_app.config.get('HASH_QUEUE_TIMEOUT'),
+            current_app.config.get('HASH_RETRY_AFTER'),
+            HostSlots(directory, current_app.config.get('HASH_CONCURRENCY')) if directory else None
+        )
+    return limiter
+
+
+def hashing_slot():
+    """ Admits one password hash or verify.
+
+    :return: context manager
+    """
+
+    return get_hashing_limiter().slot()
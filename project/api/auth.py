@@ -1,17 +1,32 @@
 # ezasdf-users/project/api/auth.py
 
 
-from flask import Blueprint, request
+from flask import Blueprint, current_app, request
 from sqlalchemy import exc, or_
 
 from project import db, bcrypt
+from project.api.admission import Overloaded, hashing_slot
+from project.api.availability import build_availability_index, get_availability_index
 from project.api.models import User
-from project.api.utils import add_user, error_response, success_response, authenticate
+from project.api.partitioning import identity_clause
+from project.api.ratelimit import signin_retry_after
+from project.api.tracing import span
+from project.api.utils import (
+    add_user,
+    error_response,
+    success_response,
+    authenticate,
+    current_user,
+    verify_tokens
+)
+from project.api.validation import SIGNIN, SIGNUP, VERIFY_BATCH, limit_body_size
 
 auth_blueprint = Blueprint('auth', __name__)
+auth_blueprint.before_app_first_request(build_availability_index)
 
 
 @auth_blueprint.route('/auth/signup', methods=['POST'])
+@limit_body_size('MAX_BODY_SIZE')
 def post_signup():
     """ POST /auth/signup
     Signs up the new user.
@@ -24,15 +39,17 @@ def post_signup():
     :return: flask response
     """
 
-    data = request.get_json()
+    data = request.get_json(silent=True)
     if not data:
         return error_response(), 400
-    # TODO validate
+    errors = SIGNUP.validate(data)
+    if errors:
+        return error_response(errors=errors), 400
     username = data.get('username')
     email = data.get('email')
     password = data.get('password')
     try:
-        if not User.query.filter(or_(User.username == username, User.email == email)).first():
+        if not User.query.filter(or_(identity_clause('username', username), identity_clause('email', email))).first():
             new_user = add_user(username, email, password)
             token = new_user.encode_jwt(new_user.id)
             return success_response(
@@ -47,7 +64,29 @@ def post_signup():
         return error_response(), 400
 
 
+@auth_blueprint.route('/auth/available', methods=['GET'])
+def get_available():
+    """ GET /auth/available
+    Checks if a username and/or email can be signed up with.
+    requires one of:
+        username,
+        email
+
+    :return: Flask Response
+    """
+
+    fields = {field: request.args.get(field) for field in ('username', 'email') if request.args.get(field)}
+    if not fields:
+        return error_response(), 400
+    index = get_availability_index()
+    return success_response(
+        'Availability checked.',
+        data={field: index.available(field, value) for field, value in fields.items()}
+    ), 200
+
+
 @auth_blueprint.route('/auth/signin', methods=['POST'])
+@limit_body_size('MAX_BODY_SIZE')
 def post_signin():
     """ POST /auth/get_jwt
     Signs in the user and fetches the user's token.
@@ -58,30 +97,73 @@ def post_signin():
     :return: A Flask Response
     """
 
-    data = request.get_json()
+    data = request.get_json(silent=True)
     if not data:
         return error_response(), 400
+    errors = SIGNIN.validate(data)
+    if errors:
+        return error_response(errors=errors), 400
     email = data.get('email')
     password = data.get('password')
+    retry_after = signin_retry_after(email)
+    if retry_after:
+        return error_response(
+            'Too many signin attempts. Try again later.'
+        ), 429, {'Retry-After': str(retry_after)}
     try:
-        user = User.query.filter_by(email=email).first()
-        if user and bcrypt.check_password_hash(user.password, password):
-            token = user.encode_jwt(user.id)
-            if token:
-                return success_response(
-                    '{email} signed in.'.format(email=email),
-                    data={'token': token.decode()}
-                ), 200
+        with span('db.user_lookup'):
+            user = User.query.filter(identity_clause('email', email)).first()
+        if user:
+            with span('bcrypt.verify'), hashing_slot():
+                verified = bcrypt.check_password_hash(user.password, password)
+            if verified:
+                token = user.encode_jwt(user.id)
+                if token:
+                    return success_response(
+                        '{email} signed in.'.format(email=email),
+                        data={'token': token.decode()}
+                    ), 200
         return error_response(
             'User does not exist.'
         ), 404
-    except Exception as e:
-        print(e)
+    except Overloaded:
+        raise
+    except Exception:
+        current_app.logger.exception('Signin failed.')
         return error_response(
             'Try again.'
         ), 500
 
 
+@auth_blueprint.route('/auth/verify-batch', methods=['POST'])
+@limit_body_size('VERIFY_BATCH_MAX_BODY_SIZE')
+def post_verify_batch():
+    """ POST /auth/verify-batch
+    Verifies up to VERIFY_BATCH_MAX_TOKENS tokens at once.
+    The body limit leaves room for a full batch of the longest tokens accepted.
+    requires: {
+        tokens: ['token', ...]
+    }
+
+    :return: Flask Response
+    """
+
+    data = request.get_json(silent=True)
+    if not data:
+        return error_response(), 400
+    errors = VERIFY_BATCH.validate(data)
+    if not errors and len(data['tokens']) > current_app.config.get('VERIFY_BATCH_MAX_TOKENS'):
+        errors = {'tokens': 'Must be at most {count} tokens.'.format(
+            count=current_app.config.get('VERIFY_BATCH_MAX_TOKENS')
+        )}
+    if errors:
+        return error_response(errors=errors), 400
+    return success_response(
+        'Tokens verified.',
+        data={'results': verify_tokens(data['tokens'])}
+    ), 200
+
+
 @auth_blueprint.route('/auth/signout', methods=['GET'])
 @authenticate
 def get_signout(user_id):
@@ -92,7 +174,11 @@ def get_signout(user_id):
     :return: Flask Response
     """
 
-    user = User.query.filter_by(id=user_id).first()
+    user = current_user()
+    if user is None:
+        return error_response(
+            'Something went wrong. Please contact us.'
+        ), 401
     return success_response(
         '{email} signed out.'.format(email=user.email)
     ), 200
@@ -108,7 +194,11 @@ def get_profile(user_id):
     :return: Flask Response
     """
 
-    user = User.query.filter_by(id=user_id).first()
+    user = current_user()
+    if user is None:
+        return error_response(
+            'Something went wrong. Please contact us.'
+        ), 401
     return success_response(
         "Fetched {email}'s profile data.".format(email=user.email),
         data={
@@ -0,0 +1,272 @@
+# ezasdf-users/project/api/availability.py
+
+
+import hashlib
+import math
+import threading
+import time
+
+from flask import current_app, has_app_context
+from sqlalchemy import event
+from sqlalchemy.exc import SQLAlchemyError
+
+from project import db
+from project.api.models import User
+from project.api.partitioning import identity_clause
+
+
+class BloomFilter:
+    """ Bloom filter over strings. """
+
+    def __init__(self, capacity, error_rate):
+        """ __init__
+
+        :param capacity: number of items the error rate holds for
+        :param error_rate: false positive probability at capacity
+        """
+
+        self.capacity = capacity
+        self.size = max(8, int(math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2)))
+        self.hashes = max(1, int(round(self.size / capacity * math.log(2))))
+        self.bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+
+    def positions(self, value):
+        """ Calculates the bit positions of value by double hashing.
+
+        :param value:
+        :return: generator of integers
+        """
+
+        digest = hashlib.sha256(value.encode()).digest()
+        h1 = int.from_bytes(digest[:8], 'little')
+        h2 = int.from_bytes(digest[8:16], 'little') | 1
+        return ((h1 + i * h2) % self.size for i in range(self.hashes))
+
+    def add(self, value):
+        """ Adds value to the filter.
+
+        :param value:
+        """
+
+        for position in self.positions(value):
+            self.bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def __contains__(self, value):
+        """ Determine if value may have been added.
+
+        :param value:
+        :return: boolean
+        """
+
+        return all(self.bits[position >> 3] & (1 << (position & 7)) for position in self.positions(value))
+
+
+class AvailabilityIndex:
+    """ Per worker Bloom filter of taken usernames and emails.
+
+    Users inserted by this worker are added as they are flushed, and users
+    inserted by other workers are pulled in by id every refresh interval.
+    The filter is rebuilt every rebuild interval to pick up ids that
+    committed out of order. Rebuilds run in a background thread while the
+    old filter keeps serving. A value missing from the filter is definitely
+    available; a hit, or any value before the first build, is confirmed
+    against the database.
+    """
+
+    FIELDS = ('username', 'email')
+
+    def __init__(self, capacity, error_rate, refresh_seconds, rebuild_seconds, background=True):
+        """ __init__
+
+        :param capacity: minimum filter capacity
+        :param error_rate:
+        :param refresh_seconds:
+        :param rebuild_seconds:
+        :param background: rebuild in a background thread rather than the caller's
+        """
+
+        self.min_capacity = capacity
+        self.error_rate = error_rate
+        self.refresh_seconds = refresh_seconds
+        self.rebuild_seconds = rebuild_seconds
+        self.background = background
+        self.lock = threading.Lock()
+        self.filter = None
+        self.last_id = 0
+        self.refreshed_at = 0
+        self.built_at = 0
+        self.rebuilding = False
+        self.lookups = 0
+        self.false_positives = 0
+
+    def add(self, username, email):
+        """ Marks a user's username and email as taken.
+
+        :param username:
+        :param email:
+        """
+
+        if self.filter is not None:
+            self.filter.add('username:{value}'.format(value=username))
+            self.filter.add('email:{value}'.format(value=email))
+
+    def scan(self):
+        """ Reads every user into a new filter.
+
+        :return: (BloomFilter, largest id read)
+        """
+
+        count = db.session.query(db.func.count(User.id)).scalar()
+        bloom = BloomFilter(max(self.min_capacity, 2 * count * len(self.FIELDS)), self.error_rate)
+        last_id = 0
+        for user_id, username, email in db.session.query(User.id, User.username, User.email).yield_per(10000):
+            bloom.add('username:{value}'.format(value=username))
+            bloom.add('email:{value}'.format(value=email))
+            last_id = max(last_id, user_id)
+        return bloom, last_id
+
+    def pull(self):
+        """ Reads the users inserted since the last refresh.
+
+        :return: list of (id, username, email)
+        """
+
+        return db.session.query(User.id, User.username, User.email).filter(User.id > self.last_id).all()
+
+    def rebuild(self):
+        """ Rebuilds the filter from every user, then swaps it in. """
+
+        bloom, last_id = self.scan()
+        with self.lock:
+            self.filter, self.last_id = bloom, last_id
+            self.refreshed_at = self.built_at = time.time()
+
+    def rebuild_in_background(self, app):
+        """ Thread target
+        Rebuilds the filter in its own app context and session.
+
+        :param app:
+        """
+
+        with app.app_context():
+            try:
+                self.rebuild()
+            except SQLAlchemyError as e:
+                app.logger.warning('Availability index not built: %s', e)
+            finally:
+                db.session.remove()
+                self.rebuilding = False
+
+    def refresh(self):
+        """ Pulls in users inserted since the last refresh,
+        and starts a rebuild when the filter is missing, full or old.
+        Only the first caller past the refresh interval does either.
+        """
+
+        with self.lock:
+            now = time.time()
+            if now - self.refreshed_at <= self.refresh_seconds:
+                return
+            self.refreshed_at = now
+            if self.filter is not None:
+                for user_id, username, email in self.pull():
+                    self.add(username, email)
+                    self.last_id = max(self.last_id, user_id)
+            start = not self.rebuilding and (
+                self.filter is None or self.filter.count >= self.filter.capacity or
+                now - self.built_at > self.rebuild_seconds
+            )
+            self.rebuilding = self.rebuilding or start
+        if not start:
+            return
+        if self.background:
+            threading.Thread(
+                target=self.rebuild_in_background,
+                args=(current_app._get_current_object(),),
+                daemon=True
+            ).start()
+            return
+        try:
+            self.rebuild()
+        finally:
+            self.rebuilding = False
+
+    def available(self, field, value):
+        """ Determine if value is not taken by any user's field.
+
+        :param field: username|email
+        :param value:
+        :return: boolean
+        """
+
+        if time.time() - self.refreshed_at > self.refresh_seconds:
+            self.refresh()
+        bloom = self.filter
+        if bloom is not None:
+            if '{field}:{value}'.format(field=field, value=value) not in bloom:
+                return True
+            self.lookups += 1
+        taken = db.session.query(User.id).filter(identity_clause(field, value)).first() is not None
+        if bloom is not None and not taken:
+            self.false_positives += 1
+        return not taken
+
+    def stats(self):
+        """ Reports the filter's size and lookup counters.
+
+        :return: dict
+        """
+
+        return {
+            'items': self.filter.count if self.filter is not None else 0,
+            'capacity': self.filter.capacity if self.filter is not None else 0,
+            'rebuilding': self.rebuilding,
+            'lookups': self.lookups,
+            'false_positives': self.false_positives
+        }
+
+
+def get_availability_index():
+    """ Fetches the app's availability index, creating it from config.
+
+    :return: AvailabilityIndex
+    """
+
+    index = current_app.extensions.get('availability_index')
+    if index is None:
+        index = current_app.extensions['availability_index'] = AvailabilityIndex(
+            current_app.config.get('AVAILABILITY_CAPACITY'),
+            current_app.config.get('AVAILABILITY_ERROR_RATE'),
+            current_app.config.get('AVAILABILITY_REFRESH_SECONDS'),
+            current_app.config.get('AVAILABILITY_REBUILD_SECONDS'),
+            current_app.config.get('AVAILABILITY_BACKGROUND_REBUILD')
+        )
+    return index
+
+
+def build_availability_index():
+    """ Before first request hook
+    Starts building the worker's availability index at boot.
+    """
+
+    try:
+        get_availability_index().refresh()
+    except SQLAlchemyError as e:
+        current_app.logger.warning('Availability index not built: %s', e)
+
+
+@event.listens_for(User, 'after_insert')
+def add_inserted_user(mapper, connection, user):
+    """ Marks an inserted user's username and email as taken.
+
+    :param mapper:
+    :param connection:
+    :param user:
+    """
+
+    if has_app_context():
+        index = current_app.extensions.get('availability_index')
+        if index is not None:
+            index.add(user.username, user.email)
@@ -0,0 +1,172 @@
+# ezasdf-users/project/api/coalescing.py
+
+
+import threading
+from functools import wraps
+
+from flask import current_app, request
+
+from project.api.utils import wants_msgpack
+from project.routing import use_replica
+
+
+class Call:
+    """ One in flight computation and the callers waiting on it. """
+
+    def __init__(self):
+        """ __init__ """
+
+        self.done = threading.Event()
+        self.waiters = 0
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """ Shares one in flight computation among concurrent identical calls.
+
+    The first caller for a key runs the computation, callers arriving
+    while it runs wait for its result instead of repeating the work.
+    Nothing is kept once the computation finishes.
+    """
+
+    def __init__(self, timeout):
+        """ __init__
+
+        :param timeout: seconds a waiter waits before computing on its own
+        """
+
+        self.timeout = timeout
+        self.lock = threading.Lock()
+        self.calls = {}
+        self.leaders = 0
+        self.coalesced = 0
+        self.timed_out = 0
+        self.errors = 0
+        self.max_waiters = 0
+
+    def do(self, key, f):
+        """ Calls f, or waits for the identical call already in flight.
+
+        :param key: hashable
+        :param f: callable
+        :return: the result of f
+        :raises: whatever f raised for the caller that ran it
+        """
+
+        with self.lock:
+            call = self.calls.get(key)
+            if call is None:
+                call = self.calls[key] = Call()
+                self.leaders += 1
+                leader = True
+            else:
+                call.waiters += 1
+                self.coalesced += 1
+                self.max_waiters = max(self.max_waiters, call.waiters)
+                leader = False
+        if not leader:
+            if not call.done.wait(self.timeout):
+                with self.lock:
+                    self.timed_out += 1
+                return f()
+            if call.error is not None:
+                raise call.error
+            return call.result
+        try:
+            call.result = f()
+        except Exception as e:
+            call.error = e
+            with self.lock:
+                self.errors += 1
+            raise
+        finally:
+            with self.lock:
+                del self.calls[key]
+            call.done.set()
+        return call.result
+
+    def stats(self):
+        """ Reports the calls in flight and the coalescing counters.
+
+        :return: dict
+        """
+
+        with self.lock:
+            return {
+                'in_flight': len(self.calls),
+                'waiting': sum(call.waiters for call in self.calls.values()),
+                'leaders': self.leaders,
+                'coalesced': self.coalesced,
+                'max_waiters': self.max_waiters,
+                'timed_out': self.timed_out,
+                'errors': self.errors
+            }
+
+
+def get_single_flight():
+    """ Fetches the app's single flight group.
+
+    :return: SingleFlight
+    """
+
+    return current_app.extensions['single_flight']
+
+
+def freeze(response):
+    """ Copies what a response sends, so other threads can rebuild it.
+
+    :param response: flask response
+    :return: (body, status, headers)
+    """
+
+    return response.get_data(), response.status_code, list(response.headers)
+
+
+def coalesce(f):
+    """ Decorator
+    Coalesces concurrent identical requests to a read handler in this worker.
+    Requests are identical when the endpoint, view arguments, query string,
+    negotiated serialization and database routing match, so a client pinned
+    to the primary never gets a replica's answer. Only the body, status and headers
+    are shared, each request still runs its own after request hooks.
+
+    :param f:
+    :return: decorated_function
+    """
+
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        """ Wrapper
+
+        :param args:
+        :param kwargs:
+        :return: flask response
+        """
+
+        if not current_app.config.get('COALESCING_ENABLED'):
+            return f(*args, **kwargs)
+        key = (
+            request.endpoint,
+            tuple(sorted(request.view_args.items())),
+            tuple(sorted(request.args.items(multi=True))),
+            wants_msgpack(),
+            use_replica()
+        )
+        body, status, headers = get_single_flight().do(
+            key,
+            lambda: freeze(current_app.make_response(f(*args, **kwargs)))
+        )
+        return current_app.response_class(body, status=status, headers=headers)
+
+    return decorated_function
+
+
+def init_coalescing(app):
+    """ Creates the app's single flight group up front,
+    so concurrent first requests share it.
+
+    :param app:
+    """
+
+    app.extensions['single_flight'] = SingleFlight(app.config.get('COALESCING_TIMEOUT'))
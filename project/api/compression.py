@@ -0,0 +1,102 @@
+# ezasdf-users/project/api/compression.py
+
+
+import zlib
+
+from flask import current_app, request
+
+
+WBITS = {
+    'gzip': 16 + zlib.MAX_WBITS,
+    'deflate': zlib.MAX_WBITS
+}
+
+
+def negotiate_encoding():
+    """ Picks the encoding the client prefers, gzip on ties.
+
+    :return: str|None
+    """
+
+    encodings = request.accept_encodings
+    encoding = max(WBITS, key=lambda encoding: (encodings.quality(encoding), encoding == 'gzip'))
+    return encoding if encodings.quality(encoding) > 0 else None
+
+
+def compressor(encoding, level):
+    """ Creates a zlib compressor for the encoding.
+
+    :param encoding: gzip|deflate
+    :param level:
+    :return: zlib compress object
+    """
+
+    return zlib.compressobj(level, zlib.DEFLATED, WBITS[encoding])
+
+
+def compress_stream(chunks, encoding, level, charset):
+    """ Compresses a streamed body chunk by chunk.
+
+    :param chunks: iterable of str|bytes
+    :param encoding:
+    :param level:
+    :param charset:
+    :return: generator of bytes
+    """
+
+    stream = compressor(encoding, level)
+    try:
+        for chunk in chunks:
+            if isinstance(chunk, str):
+                chunk = chunk.encode(charset)
+            data = stream.compress(chunk)
+            if data:
+                yield data
+        yield stream.flush()
+    finally:
+        if hasattr(chunks, 'close'):
+            chunks.close()
+
+
+def compress_response(response):
+    """ After request hook
+    Compresses compressible bodies for clients that accept gzip or deflate.
+    Streamed bodies are compressed as they are sent, buffered bodies only
+    past COMPRESS_MIN_SIZE.
+
+    :param response:
+    :return: flask response
+    """
+
+    config = current_app.config
+    if (not config.get('COMPRESS_ENABLED') or
+            response.status_code < 200 or response.status_code in (204, 304) or
+            response.direct_passthrough or
+            'Content-Encoding' in response.headers or
+            response.mimetype not in config.get('COMPRESS_MIMETYPES')):
+        return response
+    encoding = negotiate_encoding()
+    response.vary.add('Accept-Encoding')
+    if encoding is None:
+        return response
+    level = config.get('COMPRESS_LEVEL')
+    if response.is_streamed:
+        response.response = compress_stream(response.response, encoding, level, response.charset)
+        response.headers.pop('Content-Length', None)
+    else:
+        data = response.get_data()
+        if len(data) < config.get('COMPRESS_MIN_SIZE'):
+            return response
+        stream = compressor(encoding, level)
+        response.set_data(stream.compress(data) + stream.flush())
+    response.headers['Content-Encoding'] = encoding
+    return response
+
+
+def init_compression(app):
+    """ Registers the compression hook on the app.
+
+    :param app:
+    """
+
+    app.after_request(compress_response)
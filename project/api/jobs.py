@@ -0,0 +1,522 @@
+# ezasdf-users/project/api/jobs.py
+
+
+import datetime
+import json
+import threading
+import time
+
+from flask import Blueprint, current_app, request
+from sqlalchemy import and_, or_
+
+from project import db
+from project.api.models import Job, OutboxEvent, User, refresh_user_stats
+from project.api.partitioning import identity_clause
+from project.api.utils import authenticate, error_response, is_admin, success_response
+from project.api.validation import SIGNUP, limit_body_size
+
+
+jobs_blueprint = Blueprint('jobs', __name__)
+
+JOB_TYPES = {}
+FINISHED = ('succeeded', 'failed', 'cancelled')
+
+
+class JobCancelled(Exception):
+    """ Raised in a job when an admin cancels it. """
+
+
+class JobLost(Exception):
+    """ Raised in a job whose claim went stale and was taken by another worker. """
+
+
+def register_job(name):
+    """ Decorator
+    Registers f as the handler of a job type.
+    Handlers are called with a JobContext and the payload and return a json result.
+
+    :param name:
+    :return: decorator
+    """
+
+    def decorator(f):
+        JOB_TYPES[name] = f
+        return f
+
+    return decorator
+
+
+class JobContext:
+    """ Lets a running job report progress and notice cancellation.
+    Every write is fenced by the attempt that claimed the job, so a worker
+    whose job was claimed again cannot commit over the new claim.
+    """
+
+    def __init__(self, job_id, attempt):
+        """ __init__
+
+        :param job_id:
+        :param attempt: the job's attempts when it was claimed
+        """
+
+        self.job_id = job_id
+        self.attempt = attempt
+        self.beat_at = time.time()
+
+    def claim(self):
+        """ Queries the job while this attempt still holds it.
+
+        :return: Query
+        """
+
+        return Job.query.filter_by(id=self.job_id, status='running', attempts=self.attempt)
+
+    def claimed(self):
+        """ Locks the job if this attempt still holds it.
+
+        :return: Job|None
+        """
+
+        return self.claim().with_for_update().first()
+
+    def report(self, values):
+        """ Commits the work so far with the given job values and a fresh heartbeat.
+
+        :param values: dict
+        :raises JobLost: if another worker claimed the job, the work is rolled back
+        """
+
+        values['heartbeat_at'] = datetime.datetime.utcnow()
+        if not self.claim().update(values, synchronize_session=False):
+            db.session.rollback()
+            raise JobLost()
+        db.session.commit()
+        self.beat_at = time.time()
+
+    def progress(self, done, total=None):
+        """ Commits the work so far with the job's progress.
+
+        :param done: units of work finished
+        :param total: units of work overall, if known
+        :raises JobCancelled: if an admin cancelled the job
+        :raises JobLost: if another worker claimed the job
+        """
+
+        values = {'progress_done': done}
+        if total is not None:
+            values['progress_total'] = total
+        self.report(values)
+        if db.session.query(Job.cancel_requested).filter_by(id=self.job_id).scalar():
+            raise JobCancelled()
+
+    def heartbeat(self):
+        """ Keeps the job's claim alive during long work between progress reports.
+        Commits the work so far, at most every JOBS_HEARTBEAT_SECONDS.
+
+        :raises JobLost: if another worker claimed the job
+        """
+
+        if time.time() - self.beat_at >= current_app.config.get('JOBS_HEARTBEAT_SECONDS'):
+            self.report({})
+
+
+def enqueue_job(job_type, payload, created_by=None, max_attempts=None):
+    """ Queues a job.
+
+    :param job_type: registered job type
+    :param payload: json payload
+    :param created_by: user id
+    :param max_attempts: defaults to JOBS_MAX_ATTEMPTS
+    :return: Job
+    """
+
+    job = Job(
+        type=job_type,
+        payload=json.dumps(payload),
+        created_by=created_by,
+        max_attempts=max_attempts or current_app.config.get('JOBS_MAX_ATTEMPTS')
+    )
+    db.session.add(job)
+    db.session.commit()
+    return job
+
+
+def finish_job(job, status, now=None):
+    """ Marks a job finished and drops its payload, which may carry
+    secrets like the passwords of imported users.
+
+    :param job:
+    :param status: succeeded|failed|cancelled
+    :param now: finish time, defaults to now
+    """
+
+    job.status = status
+    job.finished_at = now or datetime.datetime.utcnow()
+    job.payload = None
+
+
+def cancel_job(job):
+    """ Cancels a queued job now and a running one at its next progress report.
+
+    :param job:
+    :return: boolean, False if the job already finished
+    """
+
+    if job.status in FINISHED:
+        return False
+    if job.status == 'queued':
+        finish_job(job, 'cancelled')
+    job.cancel_requested = True
+    db.session.commit()
+    return True
+
+
+def backoff(attempts):
+    """ Calculates the wait before a failed job is retried.
+
+    :param attempts: attempts so far
+    :return: datetime.timedelta
+    """
+
+    return datetime.timedelta(seconds=min(
+        current_app.config.get('JOBS_RETRY_SECONDS') * 2 ** (attempts - 1),
+        current_app.config.get('JOBS_MAX_RETRY_SECONDS')
+    ))
+
+
+def claim_job():
+    """ Locks the next due job and marks it running, skipping jobs other workers hold.
+    Running jobs with a stale heartbeat are claimed again.
+
+    :return: Job|None
+    """
+
+    while True:
+        now = datetime.datetime.utcnow()
+        stale = now - datetime.timedelta(seconds=current_app.config.get('JOBS_STALE_SECONDS'))
+        job = Job.query.filter(or_(
+            and_(Job.status == 'queued', Job.available_at <= now),
+            and_(Job.status == 'running', Job.heartbeat_at < stale)
+        )).order_by(Job.id).limit(1).with_for_update(skip_locked=True).first()
+        if job is None:
+            db.session.commit()
+            return None
+        if job.status == 'running' and job.attempts >= job.max_attempts:
+            job.last_error = 'Worker lost.'
+            finish_job(job, 'failed', now)
+            db.session.commit()
+            continue
+        job.status = 'running'
+        job.attempts += 1
+        job.started_at = job.heartbeat_at = now
+        db.session.commit()
+        return job
+
+
+def run_job(job):
+    """ Runs a claimed job and records its outcome.
+    Nothing is recorded if another worker claimed the job meanwhile.
+
+    :param job:
+    :return: status, or lost
+    """
+
+    job_id, job_type, payload = job.id, job.type, json.loads(job.payload)
+    context = JobContext(job_id, job.attempts)
+    status, result = 'succeeded', None
+    try:
+        handler = JOB_TYPES.get(job_type)
+        if handler is None:
+            raise ValueError('Unknown job type {type}.'.format(type=job_type))
+        result = handler(context, payload)
+    except JobLost:
+        status = 'lost'
+    except JobCancelled:
+        status = 'cancelled'
+    except Exception as e:
+        current_app.logger.exception('Job %s failed.', job_id)
+        status, result = 'failed', e
+    if status != 'succeeded':
+        db.session.rollback()
+    job = context.claimed() if status != 'lost' else None
+    if job is None:
+        db.session.rollback()
+        current_app.logger.warning('Job %s was claimed by another worker.', job_id)
+        return 'lost'
+    now = datetime.datetime.utcnow()
+    if status == 'succeeded':
+        job.result = json.dumps(result, default=str)
+        finish_job(job, status, now)
+    elif status == 'cancelled':
+        finish_job(job, status, now)
+    else:
+        job.last_error = str(result)[:1000]
+        if job.attempts >= job.max_attempts:
+            finish_job(job, status, now)
+        else:
+            job.status = 'queued'
+            job.available_at = now + backoff(job.attempts)
+    db.session.commit()
+    return job.status
+
+
+def run_next_job():
+    """ Claims and runs one job.
+
+    :return: Job|None
+    """
+
+    job = claim_job()
+    if job is not None:
+        run_job(job)
+    return job
+
+
+class Worker:
+    """ Runs jobs on a pool of threads, each with its own app context and session. """
+
+    def __init__(self, app, concurrency, poll_seconds):
+        """ __init__
+
+        :param app:
+        :param concurrency: jobs run at once
+        :param poll_seconds: wait when no job is due
+        """
+
+        self.app = app
+        self.concurrency = concurrency
+        self.poll_seconds = poll_seconds
+        self.stopped = threading.Event()
+
+    def work(self, once=False):
+        """ Runs jobs until stopped, or until none is due when once is set. """
+
+        with self.app.app_context():
+            while not self.stopped.is_set():
+                try:
+                    job = run_next_job()
+                except Exception:
+                    db.session.rollback()
+                    self.app.logger.exception('Claiming a job failed.')
+                    job = None
+                finally:
+                    db.session.remove()
+                if job is None:
+                    if once:
+                        return
+                    self.stopped.wait(self.poll_seconds)
+
+    def run(self, once=False):
+        """ Starts the threads and waits for them.
+        A running job interrupted here is claimed again once its heartbeat goes stale.
+        SQLite has no row locks, so there every transaction of the worker takes
+        the write lock when it begins rather than failing to upgrade a read.
+
+        :param once: exit when no job is due
+        """
+
+        with self.app.app_context():
+            if db.engine.dialect.name == 'sqlite':
+                db.engine.update_execution_options(sqlite_begin='IMMEDIATE')
+        threads = [
+            threading.Thread(target=self.work, args=(once,), daemon=True)
+            for _ in range(self.concurrency)
+        ]
+        for thread in threads:
+            thread.start()
+        try:
+            while any(thread.is_alive() for thread in threads):
+                time.sleep(0.1)
+        except KeyboardInterrupt:
+            self.stopped.set()
+            for thread in threads:
+                thread.join(self.poll_seconds)
+
+
+@register_job('import_users')
+def import_users(context, payload):
+    """ Adds users in chunks, skipping invalid ones and those that already exist.
+    Passwords are hashed between transactions, so no lock is held meanwhile,
+    with a heartbeat after each one to keep the claim alive through slow chunks.
+    payload: {
+        users: [{username, email, password}, ...]
+    }
+
+    :param context:
+    :param payload:
+    :return: counts and the errors of the first invalid users
+    """
+
+    users = payload.get('users') or []
+    chunk_size = current_app.config.get('JOBS_IMPORT_CHUNK_SIZE')
+    imported = skipped = invalid = 0
+    errors = {}
+    context.progress(0, len(users))
+    for start in range(0, len(users), chunk_size):
+        chunk = [(index, data, SIGNUP.validate(data)) for index, data in enumerate(users[start:start + chunk_size], start)]
+        valid = [data for index, data, data_errors in chunk if not data_errors]
+        taken = set()
+        if valid:
+            for row in db.session.query(User.username, User.email).filter(or_(
+                *[identity_clause('username', data['username']) for data in valid] +
+                [identity_clause('email', data['email']) for data in valid]
+            )):
+                taken.update(row)
+            db.session.commit()
+        new_users = []
+        for index, data, data_errors in chunk:
+            if data_errors:
+                invalid += 1
+                if len(errors) < 100:
+                    errors[str(index)] = data_errors
+            elif data['username'] in taken or data['email'] in taken:
+                skipped += 1
+            else:
+                new_users.append(User(data['username'], data['email'], data['password']))
+                taken.update((data['username'], data['email']))
+                context.heartbeat()
+        db.session.add_all(new_users)
+        imported += len(new_users)
+        context.progress(start + len(chunk))
+    return {
+        'imported': imported,
+        'skipped': skipped,
+        'invalid': invalid,
+        'errors': errors
+    }
+
+
+@register_job('prune_outbox')
+def prune_outbox(context, payload):
+    """ Deletes outbox events delivered or failed more than days ago.
+    payload: {
+        days: EVENTS_RETENTION_DAYS
+    }
+
+    :param context:
+    :param payload:
+    :return: number of events deleted
+    """
+
+    days = payload.get('days', current_app.config.get('EVENTS_RETENTION_DAYS'))
+    cutoff = datetime.datetime.utcnow() - datetime.timedelta(days=days)
+    chunk_size = current_app.config.get('JOBS_IMPORT_CHUNK_SIZE')
+    deleted = 0
+    while True:
+        ids = [row.id for row in db.session.query(OutboxEvent.id).filter(or_(
+            OutboxEvent.dispatched_at < cutoff,
+            OutboxEvent.failed_at < cutoff
+        )).order_by(OutboxEvent.id).limit(chunk_size)]
+        if not ids:
+            return {'deleted': deleted}
+        OutboxEvent.query.filter(OutboxEvent.id.in_(ids)).delete(synchronize_session=False)
+        deleted += len(ids)
+        context.progress(deleted)
+
+
+@register_job('refresh_user_stats')
+def refresh_stats(context, payload):
+    """ Recounts the maintained user stats.
+
+    :param context:
+    :param payload:
+    :return: user stats
+    """
+
+    return refresh_user_stats(db.session).to_json()
+
+
+@jobs_blueprint.route('/jobs', methods=['POST'])
+@limit_body_size('JOBS_MAX_BODY_SIZE')
+@authenticate
+def post_jobs(user_id):
+    """ POST /jobs
+    Queues a background job.
+    The body limit leaves room for an import of JOBS_IMPORT_MAX_USERS users.
+    model:
+        type,
+        payload,
+        max_attempts
+
+    :param user_id:
+    :return: Flask Response
+    """
+
+    if not is_admin(user_id):
+        return error_response(
+            'You do not have permission to do that.'
+        ), 401
+    data = request.get_json(silent=True)
+    if not data or not isinstance(data, dict) or data.get('type') not in JOB_TYPES:
+        return error_response(), 400
+    payload = data.get('payload', {})
+    max_attempts = data.get('max_attempts')
+    if not isinstance(payload, dict) or max_attempts is not None and (
+            not isinstance(max_attempts, int) or isinstance(max_attempts, bool) or max_attempts < 1):
+        return error_response(), 400
+    users = payload.get('users') if data['type'] == 'import_users' else None
+    if isinstance(users, list) and len(users) > current_app.config.get('JOBS_IMPORT_MAX_USERS'):
+        return error_response(errors={'users': 'Must be at most {count} users.'.format(
+            count=current_app.config.get('JOBS_IMPORT_MAX_USERS')
+        )}), 400
+    job = enqueue_job(data['type'], payload, user_id, max_attempts)
+    return success_response(
+        'Job {job_id} queued.'.format(job_id=job.id),
+        data=job.to_json()
+    ), 202
+
+
+@jobs_blueprint.route('/jobs/<job_id>', methods=['GET'])
+@authenticate
+def get_job(user_id, job_id):
+    """ GET /jobs/<job_id>
+    Fetches a job's status, progress and result.
+
+    :param user_id:
+    :param job_id:
+    :return: Flask Response
+    """
+
+    if not is_admin(user_id):
+        return error_response(
+            'You do not have permission to do that.'
+        ), 401
+    job = Job.query.get(int(job_id)) if job_id.isdigit() else None
+    if job is None:
+        return error_response(
+            'Job does not exist.'
+        ), 404
+    return success_response(
+        'Job {job_id} fetched.'.format(job_id=job.id),
+        data=job.to_json()
+    ), 200
+
+
+@jobs_blueprint.route('/jobs/<job_id>/cancel', methods=['POST'])
+@authenticate
+def post_job_cancel(user_id, job_id):
+    """ POST /jobs/<job_id>/cancel
+    Cancels a job. A running job stops at its next progress report.
+
+    :param user_id:
+    :param job_id:
+    :return: Flask Response
+    """
+
+    if not is_admin(user_id):
+        return error_response(
+            'You do not have permission to do that.'
+        ), 401
+    job = Job.query.get(int(job_id)) if job_id.isdigit() else None
+    if job is None:
+        return error_response(
+            'Job does not exist.'
+        ), 404
+    if not cancel_job(job):
+        return error_response(
+            'Job already finished.'
+        ), 400
+    return success_response(
+        'Job {job_id} cancelled.'.format(job_id=job.id),
+        data=job.to_json()
+    ), 200
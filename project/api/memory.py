@@ -0,0 +1,387 @@
+# ezasdf-users/project/api/memory.py
+
+
+import datetime
+import os
+import sys
+import threading
+import tracemalloc
+from collections import OrderedDict
+
+from flask import Blueprint, current_app, request
+
+from project.api.utils import authenticate, error_response, is_admin, success_response
+
+
+memory_blueprint = Blueprint('memory', __name__)
+
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+OTHER = '<other>'
+
+
+def frame_module(filename):
+    """ Names the module under project/ a file belongs to.
+
+    :param filename:
+    :return: dotted module name|None
+    """
+
+    path = os.path.abspath(filename)
+    if not path.startswith(PROJECT_DIR + os.sep):
+        return None
+    relative = os.path.splitext(os.path.relpath(path, os.path.dirname(PROJECT_DIR)))[0]
+    return relative.replace(os.sep, '.')
+
+
+def attribute(traceback):
+    """ Finds the project frame closest to where the memory was allocated,
+    so memory allocated inside libraries is charged to the project code calling them.
+
+    :param traceback: tracemalloc.Traceback
+    :return: (module, 'file:line')
+    """
+
+    frames = list(traceback)
+    if sys.version_info >= (3, 7):
+        frames.reverse()
+    for frame in frames:
+        module = frame_module(frame.filename)
+        if module is not None:
+            return module, '{module}:{line}'.format(module=module, line=frame.lineno)
+    return OTHER, '{file}:{line}'.format(file=frames[0].filename, line=frames[0].lineno)
+
+
+def group_traces(snapshot):
+    """ Sums the live allocations of a snapshot by project module and by site.
+    Allocations are grouped by traceback first, so each distinct traceback is attributed once.
+
+    :param snapshot: tracemalloc.Snapshot
+    :return: (modules, sites), each a dict of key to [size, count]
+    """
+
+    modules = {}
+    sites = {}
+    for statistic in snapshot.statistics('traceback'):
+        module, site = attribute(statistic.traceback)
+        for groups, key in ((modules, module), (sites, site)):
+            totals = groups.setdefault(key, [0, 0])
+            totals[0] += statistic.size
+            totals[1] += statistic.count
+    return modules, sites
+
+
+def top(groups, limit, name, before=None):
+    """ Lists the largest groups, or the fastest growing ones when before is given.
+
+    :param groups: dict of key to [size, count]
+    :param limit:
+    :param name: key name in each row
+    :param before: earlier groups to compare with
+    :return: list of dicts
+    """
+
+    if before is None:
+        rows = [{name: key, 'size': size, 'count': count} for key, (size, count) in groups.items()]
+        return sorted(rows, key=lambda row: -row['size'])[:limit]
+    rows = []
+    for key in set(groups) | set(before):
+        size, count = groups.get(key, (0, 0))
+        before_size, before_count = before.get(key, (0, 0))
+        rows.append({
+            name: key,
+            'size': size,
+            'size_diff': size - before_size,
+            'count': count,
+            'count_diff': count - before_count
+        })
+    return sorted(rows, key=lambda row: -row['size_diff'])[:limit]
+
+
+def report(snapshot, limit, before=None):
+    """ Reports the top modules and allocation sites of a snapshot,
+    or their growth since an earlier snapshot.
+
+    :param snapshot:
+    :param limit:
+    :param before: earlier snapshot
+    :return: dict
+    """
+
+    modules, sites = group_traces(snapshot)
+    before_modules = before_sites = None
+    if before is not None:
+        before_modules, before_sites = group_traces(before)
+    return {
+        'total': sum(size for size, count in modules.values()),
+        'modules': top(modules, limit, 'module', before_modules),
+        'sites': top(sites, limit, 'site', before_sites)
+    }
+
+
+class MemoryTracker:
+    """ Holds a worker's tracemalloc snapshots.
+    Snapshot ids are prefixed with the worker's pid, so a request that lands
+    on another worker is told so rather than served an unrelated snapshot.
+    Snapshots of different workers are compared offline: dump them to
+    MEMORY_DIR and run flask memory-report.
+    """
+
+    def __init__(self, max_snapshots, directory=None):
+        """ __init__
+
+        :param max_snapshots: snapshots kept in memory, oldest dropped first
+        :param directory: where snapshots are also dumped, if set
+        """
+
+        self.max_snapshots = max_snapshots
+        self.directory = directory
+        self.lock = threading.Lock()
+        self.snapshots = OrderedDict()
+        self.next_id = 1
+
+    def start(self, frames):
+        """ Starts tracing allocations.
+
+        :param frames: frames kept per allocation
+        """
+
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(frames)
+
+    def stop(self):
+        """ Stops tracing and drops the snapshots. """
+
+        with self.lock:
+            self.snapshots.clear()
+        tracemalloc.stop()
+
+    def take(self):
+        """ Takes a snapshot.
+
+        :return: ('pid-n' id, snapshot, path or None)
+        """
+
+        snapshot = tracemalloc.take_snapshot().filter_traces((
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, __file__)
+        ))
+        with self.lock:
+            snapshot_id = '{pid}-{n}'.format(pid=os.getpid(), n=self.next_id)
+            self.next_id += 1
+            self.snapshots[snapshot_id] = snapshot
+            while len(self.snapshots) > self.max_snapshots:
+                self.snapshots.popitem(last=False)
+        path = None
+        if self.directory:
+            os.makedirs(self.directory, exist_ok=True)
+            path = os.path.join(self.directory, '{snapshot_id}-{time}.tracemalloc'.format(
+                snapshot_id=snapshot_id,
+                time=datetime.datetime.utcnow().strftime('%Y%m%dT%H%M%S')
+            ))
+            snapshot.dump(path)
+        return snapshot_id, snapshot, path
+
+    @staticmethod
+    def owns(snapshot_id):
+        """ Determine if a snapshot id was issued by this worker.
+
+        :param snapshot_id:
+        :return: boolean
+        """
+
+        return snapshot_id.split('-', 1)[0] == str(os.getpid())
+
+    def get(self, snapshot_id):
+        """ Fetches a kept snapshot.
+
+        :param snapshot_id:
+        :return: tracemalloc.Snapshot|None
+        """
+
+        with self.lock:
+            return self.snapshots.get(snapshot_id)
+
+    def status(self):
+        """ Describes the tracer.
+
+        :return: dict
+        """
+
+        current, peak = tracemalloc.get_traced_memory()
+        with self.lock:
+            snapshots = list(self.snapshots)
+        return {
+            'pid': os.getpid(),
+            'tracing': tracemalloc.is_tracing(),
+            'frames': tracemalloc.get_traceback_limit(),
+            'traced': current,
+            'peak': peak,
+            'snapshots': snapshots
+        }
+
+
+def get_memory_tracker():
+    """ Fetches the app's memory tracker, creating it from config.
+
+    :return: MemoryTracker
+    """
+
+    tracker = current_app.extensions.get('memory_tracker')
+    if tracker is None:
+        tracker = current_app.extensions['memory_tracker'] = MemoryTracker(
+            current_app.config.get('MEMORY_MAX_SNAPSHOTS'),
+            current_app.config.get('MEMORY_DIR')
+        )
+    return tracker
+
+
+def report_limit():
+    """ Parses the limit query parameter.
+
+    :return: integer
+    """
+
+    limit = request.args.get('limit', '')
+    return max(int(limit), 1) if limit.isdigit() else current_app.config.get('MEMORY_REPORT_LIMIT')
+
+
+@memory_blueprint.route('/memory', methods=['GET'])
+@authenticate
+def get_memory(user_id):
+    """ GET /memory
+    Fetches this worker's tracer status.
+
+    :param user_id:
+    :return: Flask Response
+    """
+
+    if not is_admin(user_id):
+        return error_response(
+            'You do not have permission to do that.'
+        ), 401
+    return success_response(
+        'Memory tracer status fetched.',
+        data=get_memory_tracker().status()
+    ), 200
+
+
+@memory_blueprint.route('/memory/tracing', methods=['POST'])
+@authenticate
+def post_memory_tracing(user_id):
+    """ POST /memory/tracing
+    Starts tracing allocations in this worker.
+    model:
+        frames
+
+    :param user_id:
+    :return: Flask Response
+    """
+
+    if not is_admin(user_id):
+        return error_response(
+            'You do not have permission to do that.'
+        ), 401
+    data = request.get_json(silent=True) or {}
+    if not isinstance(data, dict):
+        return error_response(), 400
+    frames = data.get('frames', current_app.config.get('MEMORY_TRACE_FRAMES'))
+    if not isinstance(frames, int) or isinstance(frames, bool) or frames < 1:
+        return error_response(), 400
+    tracker = get_memory_tracker()
+    tracker.start(frames)
+    return success_response(
+        'Memory tracing started.',
+        data=tracker.status()
+    ), 200
+
+
+@memory_blueprint.route('/memory/tracing', methods=['DELETE'])
+@authenticate
+def delete_memory_tracing(user_id):
+    """ DELETE /memory/tracing
+    Stops tracing allocations in this worker and drops its snapshots.
+
+    :param user_id:
+    :return: Flask Response
+    """
+
+    if not is_admin(user_id):
+        return error_response(
+            'You do not have permission to do that.'
+        ), 401
+    tracker = get_memory_tracker()
+    tracker.stop()
+    return success_response(
+        'Memory tracing stopped.',
+        data=tracker.status()
+    ), 200
+
+
+@memory_blueprint.route('/memory/snapshots', methods=['POST'])
+@authenticate
+def post_memory_snapshots(user_id):
+    """ POST /memory/snapshots?limit=<limit>
+    Takes a snapshot and reports its top modules and allocation sites.
+
+    :param user_id:
+    :return: Flask Response
+    """
+
+    if not is_admin(user_id):
+        return error_response(
+            'You do not have permission to do that.'
+        ), 401
+    if not tracemalloc.is_tracing():
+        return error_response(
+            'Memory tracing is not started.'
+        ), 400
+    snapshot_id, snapshot, path = get_memory_tracker().take()
+    return success_response(
+        'Snapshot {snapshot_id} taken.'.format(snapshot_id=snapshot_id),
+        data=dict(report(snapshot, report_limit()), id=snapshot_id, pid=os.getpid(), path=path)
+    ), 201
+
+
+@memory_blueprint.route('/memory/snapshots/<snapshot_id>', methods=['GET'])
+@authenticate
+def get_memory_snapshot(user_id, snapshot_id):
+    """ GET /memory/snapshots/<snapshot_id>?limit=<limit>&since=<snapshot_id>
+    Reports a snapshot's top modules and allocation sites,
+    or their growth since an earlier snapshot of the same worker.
+
+    :param user_id:
+    :param snapshot_id:
+    :return: Flask Response
+    """
+
+    if not is_admin(user_id):
+        return error_response(
+            'You do not have permission to do that.'
+        ), 401
+    tracker = get_memory_tracker()
+    since = request.args.get('since')
+    if not tracker.owns(snapshot_id) or since is not None and not tracker.owns(since):
+        return error_response(
+            'Snapshot was taken by another worker.'
+        ), 404
+    snapshot = tracker.get(snapshot_id)
+    before = tracker.get(since) if since is not None else None
+    if snapshot is None or since is not None and before is None:
+        return error_response(
+            'Snapshot does not exist.'
+        ), 404
+    return success_response(
+        'Snapshot {snapshot_id} fetched.'.format(snapshot_id=snapshot_id),
+        data=dict(report(snapshot, report_limit(), before), id=snapshot_id, pid=os.getpid())
+    ), 200
+
+
+def init_memory(app):
+    """ Starts tracing at boot when MEMORY_TRACE_ON_START is set,
+    so growth from the first request on is visible.
+
+    :param app:
+    """
+
+    if app.config.get('MEMORY_TRACE_ON_START'):
+        tracemalloc.start(app.config.get('MEMORY_TRACE_FRAMES'))
@@ -0,0 +1,36 @@
+# ezasdf-users/project/api/metrics.py
+
+
+from flask import Blueprint
+
+from project.api.admission import get_hashing_limiter
+from project.api.availability import get_availability_index
+from project.api.coalescing import get_single_flight
+from project.api.utils import authenticate, error_response, is_admin, success_response
+
+
+metrics_blueprint = Blueprint('metrics', __name__)
+
+
+@metrics_blueprint.route('/metrics', methods=['GET'])
+@authenticate
+def get_metrics(user_id):
+    """ GET /metrics
+    Fetches this worker's runtime metrics.
+
+    :param user_id:
+    :return: Flask Response
+    """
+
+    if not is_admin(user_id):
+        return error_response(
+            'You do not have permission to do that.'
+        ), 401
+    return success_response(
+        'Metrics fetched.',
+        data={
+            'hashing': get_hashing_limiter().stats(),
+            'availability': get_availability_index().stats(),
+            'coalescing': get_single_flight().stats()
+        }
+    ), 200
@@ -2,26 +2,42 @@
 
 
 import datetime
+import json
 
 import jwt
 from flask import current_app
+from sqlalchemy import event, inspect
+from sqlalchemy.dialects.postgresql import insert
 
 from project import db, bcrypt
+from project.api.admission import hashing_slot
+from project.api.tracing import span
+from project.routing import RoutingSession
 
 
 class User(db.Model):
     """ User model """
 
     __tablename__ = "users"
+    __table_args__ = (
+        db.Index('ix_users_created_at_id', 'created_at', 'id'),
+    )
     id = db.Column(db.Integer, primary_key=True, autoincrement=True)
     username = db.Column(db.String(128), unique=True, nullable=False)
     email = db.Column(db.String(128), unique=True, nullable=False)
     password = db.Column(db.String(255), nullable=False)
-    active = db.Column(db.Boolean, default=True, nullable=False)
-    admin = db.Column(db.Boolean, default=False, nullable=False)
-    created_at = db.Column(db.DateTime, nullable=False)
+    active = db.column_property(db.Column(db.Boolean, default=True, nullable=False), active_history=True)
+    admin = db.column_property(db.Column(db.Boolean, default=False, nullable=False), active_history=True)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.datetime.utcnow)
+    updated_at = db.Column(
+        db.DateTime,
+        nullable=False,
+        default=datetime.datetime.utcnow,
+        onupdate=datetime.datetime.utcnow
+    )
+    change_seq = db.Column(db.BigInteger, index=True, unique=True, nullable=False)
 
-    def __init__(self, username, email, password, created_at=datetime.datetime.utcnow()):
+    def __init__(self, username, email, password, created_at=None):
         """ __init__
 
         :param username:
@@ -32,8 +48,10 @@ class User(db.Model):
 
         self.username = username
         self.email = email
-        self.password = bcrypt.generate_password_hash(password, current_app.config.get('BCRYPT_LOG_ROUNDS')).decode()
-        self.created_at = created_at
+        with span('bcrypt.hash'), hashing_slot():
+            self.password = bcrypt.generate_password_hash(password, current_app.config.get('BCRYPT_LOG_ROUNDS')).decode()
+        if created_at is not None:
+            self.created_at = created_at
 
     def to_json(self):
         return {
@@ -41,29 +59,46 @@ class User(db.Model):
             'username': self.username,
             'email': self.email,
             'active': self.active,
-            'created_at': self.created_at
+            'created_at': self.created_at,
+            'updated_at': self.updated_at
         }
 
     def encode_jwt(self, user_id):
         """ Generates the jwt token.
+        The user's admin and active flags ride along as claims.
 
         :param user_id:
         :return: bytes|error
         """
 
+        return User.encode_jwt_claims(user_id, self.admin, self.active)
+
+    @staticmethod
+    def encode_jwt_claims(user_id, admin, active):
+        """ Generates the jwt token from the user's id and flags.
+
+        :param user_id:
+        :param admin:
+        :param active:
+        :return: bytes|error
+        """
+
         try:
-            return jwt.encode(
-                {
-                    'exp': datetime.datetime.utcnow() + datetime.timedelta(
-                        days=current_app.config.get('TOKEN_EXPIRATION_DAYS'),
-                        seconds=current_app.config.get('TOKEN_EXPIRATION_SECONDS')
-                    ),
-                    'iat': datetime.datetime.utcnow(),
-                    'sub': user_id
-                },
-                current_app.config.get('SECRET_KEY'),
-                algorithm='HS256'
-            )
+            with span('jwt.encode'):
+                return jwt.encode(
+                    {
+                        'exp': datetime.datetime.utcnow() + datetime.timedelta(
+                            days=current_app.config.get('TOKEN_EXPIRATION_DAYS'),
+                            seconds=current_app.config.get('TOKEN_EXPIRATION_SECONDS')
+                        ),
+                        'iat': datetime.datetime.utcnow(),
+                        'sub': user_id,
+                        'admin': bool(admin),
+                        'active': bool(active)
+                    },
+                    current_app.config.get('SECRET_KEY'),
+                    algorithm='HS256'
+                )
         except Exception as e:
             return e
 
@@ -75,10 +110,337 @@ class User(db.Model):
         :return: integer|string
         """
 
+        claims = User.decode_jwt_claims(token)
+        return claims if isinstance(claims, str) else claims['sub']
+
+    @staticmethod
+    def decode_jwt_claims(token):
+        """ Decodes the jwt token's claims.
+
+        :param token:
+        :return: dict|string
+        """
+
         try:
-            payload = jwt.decode(token, current_app.config.get('SECRET_KEY'))
-            return payload['sub']
+            with span('jwt.decode'):
+                return jwt.decode(token, current_app.config.get('SECRET_KEY'))
         except jwt.ExpiredSignatureError:
             return 'Signature expired. Signin again.'
         except jwt.InvalidTokenError:
             return 'Invalid token. Signin again.'
+
+
+class ChangeCounter(db.Model):
+    """ Change sequence counter model
+
+    Each row is a monotonic counter. Incrementing it locks the row until
+    commit, so sequence numbers become visible in commit order.
+    """
+
+    __tablename__ = "change_counters"
+    name = db.Column(db.String(64), primary_key=True)
+    value = db.Column(db.BigInteger, nullable=False)
+
+
+class UserStats(db.Model):
+    """ User stats model
+
+    A single row of user counts, adjusted by every write to users.
+    """
+
+    __tablename__ = "user_stats"
+    id = db.Column(db.Integer, primary_key=True)
+    total = db.Column(db.BigInteger, nullable=False, default=0)
+    active = db.Column(db.BigInteger, nullable=False, default=0)
+    admin = db.Column(db.BigInteger, nullable=False, default=0)
+    refreshed_at = db.Column(db.DateTime)
+
+    def to_json(self):
+        return {
+            'total': self.total,
+            'active': self.active,
+            'inactive': self.total - self.active,
+            'admin': self.admin,
+            'refreshed_at': self.refreshed_at
+        }
+
+
+class OutboxEvent(db.Model):
+    """ Outbox event model
+
+    Events are written in the transaction of the change they describe
+    and delivered later by the dispatcher.
+    """
+
+    __tablename__ = "outbox_events"
+    __table_args__ = (
+        db.Index(
+            'ix_outbox_events_pending',
+            'user_id',
+            'id',
+            postgresql_where=db.text('dispatched_at IS NULL AND failed_at IS NULL')
+        ),
+    )
+    id = db.Column(db.BigInteger().with_variant(db.Integer, 'sqlite'), primary_key=True, autoincrement=True)
+    user_id = db.Column(db.Integer, nullable=False)
+    type = db.Column(db.String(64), nullable=False)
+    payload = db.Column(db.Text, nullable=False)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.datetime.utcnow)
+    available_at = db.Column(db.DateTime, nullable=False, default=datetime.datetime.utcnow)
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    last_error = db.Column(db.Text)
+    dispatched_at = db.Column(db.DateTime)
+    failed_at = db.Column(db.DateTime)
+
+    def to_json(self):
+        return {
+            'id': self.id,
+            'type': self.type,
+            'user_id': self.user_id,
+            'created_at': self.created_at,
+            'payload': json.loads(self.payload)
+        }
+
+
+class Job(db.Model):
+    """ Background job model
+
+    Jobs are queued by admins and run by `flask worker` outside of requests.
+    A running job refreshes heartbeat_at as it reports progress, so a job
+    whose worker died is claimed again once the heartbeat goes stale.
+    Each claim increments attempts, which fences off writes of the
+    previous claim. The payload is dropped once the job finishes.
+    """
+
+    __tablename__ = "jobs"
+    __table_args__ = (
+        db.Index('ix_jobs_status_available_at', 'status', 'available_at'),
+    )
+    id = db.Column(db.Integer, primary_key=True, autoincrement=True)
+    type = db.Column(db.String(64), nullable=False)
+    payload = db.Column(db.Text)
+    status = db.Column(db.String(16), nullable=False, default='queued')
+    progress_done = db.Column(db.Integer, nullable=False, default=0)
+    progress_total = db.Column(db.Integer)
+    result = db.Column(db.Text)
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    max_attempts = db.Column(db.Integer, nullable=False)
+    last_error = db.Column(db.Text)
+    cancel_requested = db.Column(db.Boolean, nullable=False, default=False)
+    created_by = db.Column(db.Integer)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.datetime.utcnow)
+    available_at = db.Column(db.DateTime, nullable=False, default=datetime.datetime.utcnow)
+    started_at = db.Column(db.DateTime)
+    heartbeat_at = db.Column(db.DateTime)
+    finished_at = db.Column(db.DateTime)
+
+    def to_json(self):
+        return {
+            'id': self.id,
+            'type': self.type,
+            'status': self.status,
+            'progress': {
+                'done': self.progress_done,
+                'total': self.progress_total
+            },
+            'result': json.loads(self.result) if self.result is not None else None,
+            'attempts': self.attempts,
+            'max_attempts': self.max_attempts,
+            'last_error': self.last_error,
+            'cancel_requested': self.cancel_requested,
+            'created_by': self.created_by,
+            'created_at': self.created_at,
+            'started_at': self.started_at,
+            'finished_at': self.finished_at
+        }
+
+
+def changed_users(session):
+    """ Collects the users a flush will insert or modify.
+
+    :param session:
+    :return: list of User
+    """
+
+    users = [user for user in session.new if isinstance(user, User)]
+    users += [
+        user for user in session.dirty
+        if isinstance(user, User) and session.is_modified(user, include_collections=False)
+    ]
+    return users
+
+
+def bump_change_counter(session, name, count):
+    """ Adds count to a counter, creating it if needed.
+    The counter row stays locked until the transaction ends, on SQLite
+    the database write lock does the same.
+
+    :param session:
+    :param name:
+    :param count:
+    :return: integer, the counter's new value
+    """
+
+    table = ChangeCounter.__table__
+    if db.engine.dialect.name != 'postgresql':
+        if not session.execute(table.update().where(table.c.name == name).values(value=table.c.value + count)).rowcount:
+            session.execute(table.insert().values(name=name, value=count))
+        return session.execute(db.select([table.c.value]).where(table.c.name == name)).scalar()
+    statement = insert(table).values(name=name, value=count)
+    statement = statement.on_conflict_do_update(
+        index_elements=[table.c.name],
+        set_={'value': table.c.value + count}
+    ).returning(table.c.value)
+    return session.execute(statement).scalar()
+
+
+def next_change_seqs(session, name, count):
+    """ Allocates count consecutive sequence numbers from a counter.
+
+    :param session:
+    :param name:
+    :param count:
+    :return: range
+    """
+
+    last = bump_change_counter(session, name, count)
+    return range(last - count + 1, last + 1)
+
+
+@event.listens_for(RoutingSession, 'before_flush')
+def assign_change_seqs(session, flush_context, instances):
+    """ Stamps new and modified users with the next change sequence numbers.
+
+    :param session:
+    :param flush_context:
+    :param instances:
+    """
+
+    users = changed_users(session)
+    if users:
+        for user, change_seq in zip(users, next_change_seqs(session, User.__tablename__, len(users))):
+            user.change_seq = change_seq
+
+
+def user_event_type(session, user):
+    """ Names the lifecycle event of a new or modified user.
+
+    :param session:
+    :param user:
+    :return: str
+    """
+
+    if user in session.new:
+        return 'user.created'
+    active = inspect(user).attrs.active.history
+    if active.deleted and active.deleted[0] and not user.active:
+        return 'user.deactivated'
+    return 'user.updated'
+
+
+def event_row(event_type, user_json, now):
+    """ Builds an outbox row for a user event.
+
+    :param event_type:
+    :param user_json: the user's to_json with its change_seq
+    :param now:
+    :return: dict
+    """
+
+    return {
+        'user_id': user_json['id'],
+        'type': event_type,
+        'payload': json.dumps(user_json, default=str),
+        'created_at': now,
+        'available_at': now,
+        'attempts': 0
+    }
+
+
+@event.listens_for(RoutingSession, 'after_flush')
+def record_user_events(session, flush_context):
+    """ Writes outbox events for the users the flush inserted or modified.
+    The session still holds the pre-flush history here.
+
+    :param session:
+    :param flush_context:
+    """
+
+    users = changed_users(session)
+    if not users:
+        return
+    now = datetime.datetime.utcnow()
+    rows = [
+        event_row(user_event_type(session, user), dict(user.to_json(), change_seq=user.change_seq), now)
+        for user in sorted(users, key=lambda user: user.change_seq)
+    ]
+    session.execute(OutboxEvent.__table__.insert(), rows)
+
+
+def adjust_user_stats(session, total, active, admin):
+    """ Adds deltas to the user stats row.
+    Nothing happens before the row is seeded by refresh_user_stats.
+
+    :param session:
+    :param total:
+    :param active:
+    :param admin:
+    """
+
+    if total or active or admin:
+        table = UserStats.__table__
+        session.execute(table.update().where(table.c.id == 1).values(
+            total=table.c.total + total,
+            active=table.c.active + active,
+            admin=table.c.admin + admin
+        ))
+
+
+def refresh_user_stats(session):
+    """ Recounts the user stats row from the users table.
+    The row is locked before counting so concurrent writers apply their
+    deltas on top of the recount instead of being counted twice.
+
+    :param session:
+    :return: UserStats
+    """
+
+    table = UserStats.__table__
+    if db.engine.dialect.name != 'postgresql':
+        session.execute(table.insert().prefix_with('OR IGNORE').values(id=1, total=0, active=0, admin=0))
+    else:
+        session.execute(insert(table).values(id=1, total=0, active=0, admin=0).on_conflict_do_nothing())
+    stats = session.query(UserStats).filter_by(id=1).with_for_update().populate_existing().one()
+    total, active, admin = session.query(
+        db.func.count(User.id),
+        db.func.count(User.id).filter(User.active),
+        db.func.count(User.id).filter(User.admin)
+    ).one()
+    stats.total, stats.active, stats.admin = total, active, admin
+    stats.refreshed_at = datetime.datetime.utcnow()
+    return stats
+
+
+@event.listens_for(RoutingSession, 'after_flush')
+def track_user_stats(session, flush_context):
+    """ Adjusts the user stats by the users the flush inserted, modified or deleted.
+
+    :param session:
+    :param flush_context:
+    """
+
+    total = active = admin = 0
+    for user in session.new:
+        if isinstance(user, User):
+            total, active, admin = total + 1, active + user.active, admin + user.admin
+    for user in session.deleted:
+        if isinstance(user, User):
+            total, active, admin = total - 1, active - user.active, admin - user.admin
+    for user in session.dirty:
+        if isinstance(user, User) and user not in session.deleted:
+            state = inspect(user).attrs
+            if state.active.history.deleted:
+                active += user.active - state.active.history.deleted[0]
+            if state.admin.history.deleted:
+                admin += user.admin - state.admin.history.deleted[0]
+    adjust_user_stats(session, total, active, admin)
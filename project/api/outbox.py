@@ -0,0 +1,218 @@
+# ezasdf-users/project/api/outbox.py
+
+
+import datetime
+import json
+import queue
+import threading
+import urllib.request
+
+from sqlalchemy import and_, exists
+from sqlalchemy.orm import aliased
+from werkzeug.utils import import_string
+
+from project import db
+from project.api.models import OutboxEvent
+
+
+class WebhookSink:
+    """ POSTs each event as JSON to a URL. """
+
+    def __init__(self, url, timeout):
+        """ __init__
+
+        :param url:
+        :param timeout: seconds to wait for the receiver
+        """
+
+        self.url = url
+        self.timeout = timeout
+
+    @classmethod
+    def from_config(cls, config):
+        """ Creates the sink from EVENTS_WEBHOOK_URL.
+
+        :param config:
+        :return: WebhookSink
+        """
+
+        return cls(config.get('EVENTS_WEBHOOK_URL'), config.get('EVENTS_WEBHOOK_TIMEOUT'))
+
+    def send(self, event):
+        """ Delivers the event, raising unless the receiver answers 2xx.
+
+        :param event: dict
+        """
+
+        request = urllib.request.Request(
+            self.url,
+            data=json.dumps(event, default=str).encode(),
+            headers={
+                'Content-Type': 'application/json',
+                'X-Event-Id': str(event['id']),
+                'X-Event-Type': event['type']
+            },
+            method='POST'
+        )
+        with urllib.request.urlopen(request, timeout=self.timeout):
+            pass
+
+
+class FileSink:
+    """ Appends each event to a file, one JSON object per line. """
+
+    def __init__(self, path):
+        """ __init__
+
+        :param path:
+        """
+
+        self.path = path
+        self.lock = threading.Lock()
+
+    @classmethod
+    def from_config(cls, config):
+        """ Creates the sink from EVENTS_FILE.
+
+        :param config:
+        :return: FileSink
+        """
+
+        return cls(config.get('EVENTS_FILE'))
+
+    def send(self, event):
+        """ Writes the event.
+
+        :param event: dict
+        """
+
+        with self.lock, open(self.path, 'a') as f:
+            f.write(json.dumps(event, default=str) + '\n')
+
+
+class QueueSink:
+    """ Puts each event on an in process queue, standing in for a broker. """
+
+    def __init__(self, events=None):
+        """ __init__
+
+        :param events: queue.Queue
+        """
+
+        self.events = events if events is not None else queue.Queue()
+
+    @classmethod
+    def from_config(cls, config):
+        """ Creates the sink with an unbounded queue.
+
+        :param config:
+        :return: QueueSink
+        """
+
+        return cls()
+
+    def send(self, event):
+        """ Enqueues the event.
+
+        :param event: dict
+        """
+
+        self.events.put(event)
+
+
+class Dispatcher:
+    """ Drains the outbox to a sink in batches.
+
+    Claimed rows stay locked until the batch commits, so a crash redelivers
+    the batch instead of losing it. Receivers deduplicate on the event id.
+    """
+
+    def __init__(self, sink, batch_size, max_attempts, retry_seconds, max_retry_seconds):
+        """ __init__
+
+        :param sink: object with send(event)
+        :param batch_size: events claimed per transaction
+        :param max_attempts: deliveries tried before an event is marked failed
+        :param retry_seconds: backoff after the first failure, doubling after each one
+        :param max_retry_seconds: longest backoff
+        """
+
+        self.sink = sink
+        self.batch_size = batch_size
+        self.max_attempts = max_attempts
+        self.retry_seconds = retry_seconds
+        self.max_retry_seconds = max_retry_seconds
+
+    @classmethod
+    def from_config(cls, config):
+        """ Creates the dispatcher and its EVENTS_SINK.
+
+        :param config:
+        :return: Dispatcher
+        """
+
+        return cls(
+            import_string(config.get('EVENTS_SINK')).from_config(config),
+            config.get('EVENTS_BATCH_SIZE'),
+            config.get('EVENTS_MAX_ATTEMPTS'),
+            config.get('EVENTS_RETRY_SECONDS'),
+            config.get('EVENTS_MAX_RETRY_SECONDS')
+        )
+
+    def backoff(self, attempts):
+        """ Calculates the wait before the next delivery attempt.
+
+        :param attempts: failed attempts so far
+        :return: datetime.timedelta
+        """
+
+        return datetime.timedelta(seconds=min(self.retry_seconds * 2 ** (attempts - 1), self.max_retry_seconds))
+
+    def claim(self, now):
+        """ Locks the next due events, skipping rows other dispatchers hold.
+        An event is only due once every earlier pending event of its user is
+        delivered, which keeps delivery in order per user across dispatchers
+        and claims at most one event per user per batch.
+
+        :param now:
+        :return: list of OutboxEvent
+        """
+
+        earlier = aliased(OutboxEvent)
+        return OutboxEvent.query.filter(
+            OutboxEvent.dispatched_at.is_(None),
+            OutboxEvent.failed_at.is_(None),
+            OutboxEvent.available_at <= now,
+            ~exists().where(and_(
+                earlier.user_id == OutboxEvent.user_id,
+                earlier.id < OutboxEvent.id,
+                earlier.dispatched_at.is_(None),
+                earlier.failed_at.is_(None)
+            ))
+        ).order_by(OutboxEvent.id).limit(self.batch_size).with_for_update(skip_locked=True).all()
+
+    def dispatch(self):
+        """ Delivers one batch.
+
+        :return: (delivered, failed) counts
+        """
+
+        now = datetime.datetime.utcnow()
+        delivered = failed = 0
+        for event in self.claim(now):
+            try:
+                self.sink.send(event.to_json())
+            except Exception as e:
+                failed += 1
+                event.attempts += 1
+                event.last_error = str(e)[:1000]
+                if event.attempts >= self.max_attempts:
+                    event.failed_at = now
+                else:
+                    event.available_at = now + self.backoff(event.attempts)
+            else:
+                delivered += 1
+                event.attempts += 1
+                event.dispatched_at = now
+        db.session.commit()
+        return delivered, failed
@@ -0,0 +1,103 @@
+# ezasdf-users/project/api/partitioning.py
+
+
+from flask import current_app
+from sqlalchemy import Integer, String, column, select, table
+
+from project.api.models import User
+
+
+user_identities = table(
+    'user_identities',
+    column('kind', String),
+    column('value', String),
+    column('user_id', Integer)
+)
+
+
+IDENTITIES_DDL = """
+CREATE TABLE user_identities (
+    kind VARCHAR(16) NOT NULL,
+    value VARCHAR(128) NOT NULL,
+    user_id INTEGER NOT NULL,
+    PRIMARY KEY (kind, value)
+);
+
+CREATE FUNCTION sync_user_identities() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP IN ('UPDATE', 'DELETE') THEN
+        DELETE FROM user_identities
+        WHERE (kind, value) IN (('username', OLD.username), ('email', OLD.email)) AND user_id = OLD.id;
+    END IF;
+    IF TG_OP IN ('INSERT', 'UPDATE') THEN
+        INSERT INTO user_identities (kind, value, user_id)
+        VALUES ('username', NEW.username, NEW.id), ('email', NEW.email, NEW.id);
+    END IF;
+    RETURN NULL;
+END
+$$ LANGUAGE plpgsql;
+"""
+
+PARTITIONED_DDL = """
+LOCK TABLE users IN ACCESS EXCLUSIVE MODE;
+
+CREATE TABLE users_partitioned (LIKE users INCLUDING DEFAULTS) PARTITION BY HASH (id);
+ALTER TABLE users_partitioned ADD CONSTRAINT users_partitioned_pkey PRIMARY KEY (id);
+CREATE INDEX ix_users_partitioned_created_at_id ON users_partitioned (created_at, id);
+CREATE INDEX ix_users_partitioned_change_seq ON users_partitioned (change_seq);
+CREATE INDEX ix_users_partitioned_username ON users_partitioned (username);
+CREATE INDEX ix_users_partitioned_email ON users_partitioned (email);
+{partitions}
+
+INSERT INTO users_partitioned SELECT * FROM users;
+INSERT INTO user_identities (kind, value, user_id)
+    SELECT 'username', username, id FROM users
+    UNION ALL
+    SELECT 'email', email, id FROM users;
+
+CREATE TRIGGER sync_user_identities
+    AFTER INSERT OR DELETE OR UPDATE OF username, email ON users_partitioned
+    FOR EACH ROW EXECUTE PROCEDURE sync_user_identities();
+
+ALTER SEQUENCE users_id_seq OWNED BY users_partitioned.id;
+ALTER TABLE users RENAME TO users_unpartitioned;
+ALTER TABLE users_partitioned RENAME TO users;
+ANALYZE users;
+"""
+
+PARTITION_DDL = (
+    'CREATE TABLE users_p{remainder} PARTITION OF users_partitioned '
+    'FOR VALUES WITH (MODULUS {modulus}, REMAINDER {remainder});'
+)
+
+
+def partition_statements(partitions):
+    """ Generates the migration of users to a table hash partitioned on id.
+    The old table is kept as users_unpartitioned. Uniqueness of usernames
+    and emails moves to user_identities, maintained by a trigger, because
+    unique indexes on a partitioned table must include the partition key.
+
+    :param partitions: number of hash partitions
+    :return: str
+    """
+
+    return IDENTITIES_DDL + PARTITIONED_DDL.format(partitions='\n'.join(
+        PARTITION_DDL.format(modulus=partitions, remainder=remainder) for remainder in range(partitions)
+    ))
+
+
+def identity_clause(kind, value):
+    """ Matches the user with the given username or email.
+    On a partitioned table the id is resolved through user_identities first,
+    so the users scan is pruned to a single partition at execution time.
+
+    :param kind: username|email
+    :param value:
+    :return: clause
+    """
+
+    if not current_app.config.get('USERS_PARTITIONED'):
+        return getattr(User, kind) == value
+    return User.id == select([user_identities.c.user_id]).where(
+        (user_identities.c.kind == kind) & (user_identities.c.value == value)
+    ).as_scalar()
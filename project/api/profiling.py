@@ -0,0 +1,223 @@
+# ezasdf-users/project/api/profiling.py
+
+
+import cProfile
+import os
+import pstats
+import re
+import uuid
+from collections import defaultdict
+
+from flask import Blueprint, current_app, request, send_file
+
+from project.api.models import User
+from project.api.utils import authenticate, claims_fresh, error_response, is_admin
+
+
+profiling_blueprint = Blueprint('profiling', __name__)
+
+PROFILE_ID = re.compile(r'^[0-9a-f]{32}$')
+COLLAPSED_MAX_DEPTH = 64
+COLLAPSED_MIN_SECONDS = 1e-6
+
+
+def profile_path(profile_id):
+    """ Calculates where a profile is stored.
+
+    :param profile_id:
+    :return: str
+    """
+
+    return os.path.join(current_app.config.get('PROFILE_DIR'), '{profile_id}.pstats'.format(profile_id=profile_id))
+
+
+def prune_profiles(directory, keep):
+    """ Deletes all but the newest profiles.
+    Profiles another worker deletes meanwhile are skipped.
+
+    :param directory:
+    :param keep: number of profiles kept
+    """
+
+    profiles = []
+    for name in os.listdir(directory):
+        if name.endswith('.pstats'):
+            path = os.path.join(directory, name)
+            try:
+                profiles.append((os.path.getmtime(path), path))
+            except OSError:
+                pass
+    profiles.sort()
+    for mtime, path in profiles[:max(len(profiles) - keep, 0)]:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+def frame_label(func):
+    """ Formats a pstats function key as module:function.
+
+    :param func: (filename, line, name)
+    :return: str
+    """
+
+    filename, line, name = func
+    if filename == '~':
+        return name
+    return '{module}:{name}'.format(module=os.path.splitext(os.path.basename(filename))[0], name=name)
+
+
+def collapsed_stacks(stats):
+    """ Approximates collapsed stacks from a profile, one 'a;b;c microseconds' line each.
+    cProfile only records caller to callee edges, so a function's time is split
+    across the paths reaching it in proportion to the time each edge accounts for.
+
+    :param stats: pstats.Stats
+    :return: list of str, heaviest first
+    """
+
+    entries = stats.stats
+    callees = defaultdict(dict)
+    for func, (cc, nc, tt, ct, callers) in entries.items():
+        for caller, edge in callers.items():
+            callees[caller][func] = edge
+    totals = defaultdict(float)
+
+    def walk(func, path, seen, share):
+        tt = entries[func][2]
+        totals[';'.join(path)] += tt * share
+        if len(path) >= COLLAPSED_MAX_DEPTH:
+            return
+        for callee, edge in callees[func].items():
+            ct = entries[callee][3]
+            callee_share = share * edge[3] / ct if ct and callee not in seen else 0
+            if callee_share * ct >= COLLAPSED_MIN_SECONDS:
+                walk(callee, path + [frame_label(callee)], seen | {callee}, callee_share)
+
+    for func, entry in entries.items():
+        if not entry[4]:
+            walk(func, [frame_label(func)], {func}, 1.0)
+    return [
+        '{stack} {microseconds}'.format(stack=stack, microseconds=int(seconds * 1e6))
+        for stack, seconds in sorted(totals.items(), key=lambda item: -item[1])
+        if seconds * 1e6 >= 1
+    ]
+
+
+class ProfilingMiddleware:
+    """ Runs requests that carry X-Profile under cProfile when an admin sends them.
+    Requests without the header pass straight through.
+    """
+
+    def __init__(self, wsgi_app, app):
+        """ __init__
+
+        :param wsgi_app: wrapped wsgi callable
+        :param app: Flask app, for its config and database
+        """
+
+        self.wsgi_app = wsgi_app
+        self.app = app
+
+    def __call__(self, environ, start_response):
+        if 'HTTP_X_PROFILE' not in environ or not self.sent_by_admin(environ):
+            return self.wsgi_app(environ, start_response)
+        profile_id = uuid.uuid4().hex
+
+        def profiled_start_response(status, headers, exc_info=None):
+            return start_response(status, headers + [('X-Profile-Id', profile_id)], exc_info)
+
+        profile = cProfile.Profile()
+        profile.enable()
+        try:
+            app_iter = self.wsgi_app(environ, profiled_start_response)
+            try:
+                body = b''.join(app_iter)
+            finally:
+                if hasattr(app_iter, 'close'):
+                    app_iter.close()
+        finally:
+            profile.disable()
+            self.save(profile, profile_id)
+        return [body]
+
+    def sent_by_admin(self, environ):
+        """ Determine if the request's token belongs to an active admin.
+
+        :param environ:
+        :return: boolean
+        """
+
+        auth_header = environ.get('HTTP_AUTHORIZATION')
+        if not auth_header:
+            return False
+        with self.app.app_context():
+            claims = User.decode_jwt_claims(auth_header[7:])
+            if isinstance(claims, str):
+                return False
+            if claims_fresh(claims):
+                return claims['active'] and claims['admin']
+            user = User.query.filter_by(id=claims['sub']).first()
+            return user is not None and user.active and user.admin
+
+    def save(self, profile, profile_id):
+        """ Writes the profile to PROFILE_DIR, keeping the newest PROFILE_MAX_FILES.
+        Failures are logged, never raised into the profiled request.
+
+        :param profile:
+        :param profile_id:
+        """
+
+        with self.app.app_context():
+            try:
+                directory = current_app.config.get('PROFILE_DIR')
+                os.makedirs(directory, exist_ok=True)
+                profile.dump_stats(profile_path(profile_id))
+                prune_profiles(directory, current_app.config.get('PROFILE_MAX_FILES'))
+            except Exception:
+                current_app.logger.exception('Profile %s not saved.', profile_id)
+
+
+@profiling_blueprint.route('/profiles/<profile_id>', methods=['GET'])
+@authenticate
+def get_profile_artifact(user_id, profile_id):
+    """ GET /profiles/<profile_id>?format=pstats|collapsed
+    Downloads a request profile, as pstats by default
+    or as collapsed stacks for flame graph tools.
+
+    :param user_id:
+    :param profile_id:
+    :return: Flask Response
+    """
+
+    if not is_admin(user_id):
+        return error_response(
+            'You do not have permission to do that.'
+        ), 401
+    path = profile_path(profile_id) if PROFILE_ID.match(profile_id) else None
+    if path is None or not os.path.exists(path):
+        return error_response(
+            'Profile does not exist.'
+        ), 404
+    if request.args.get('format') == 'collapsed':
+        return current_app.response_class(
+            '\n'.join(collapsed_stacks(pstats.Stats(path))) + '\n',
+            mimetype='text/plain'
+        )
+    return send_file(
+        path,
+        mimetype='application/octet-stream',
+        as_attachment=True,
+        attachment_filename=os.path.basename(path)
+    )
+
+
+def init_profiling(app):
+    """ Wraps the app in the profiling middleware when PROFILING_ENABLED.
+
+    :param app:
+    """
+
+    if app.config.get('PROFILING_ENABLED'):
+        app.wsgi_app = ProfilingMiddleware(app.wsgi_app, app)
@@ -0,0 +1,68 @@
+# ezasdf-users/project/api/query_timing.py
+
+
+import time
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+
+query_listeners = []
+error_listeners = []
+
+
+def on_query(listener):
+    """ Decorator
+    Registers a listener called after every statement with
+    (conn, cursor, statement, parameters, executemany, started, duration).
+
+    :param listener:
+    :return: listener
+    """
+
+    if listener not in query_listeners:
+        query_listeners.append(listener)
+    return listener
+
+
+def on_query_error(listener):
+    """ Decorator
+    Registers a listener called after every failed statement with
+    (context, started, duration).
+
+    :param listener:
+    :return: listener
+    """
+
+    if listener not in error_listeners:
+        error_listeners.append(listener)
+    return listener
+
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def start_query_timer(conn, cursor, statement, parameters, context, executemany):
+    """ Starts timing a statement. """
+
+    conn.info.setdefault('query_started', []).append(time.time())
+
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def stop_query_timer(conn, cursor, statement, parameters, context, executemany):
+    """ Hands a statement's start and duration to the query listeners. """
+
+    started = conn.info['query_started'].pop()
+    duration = time.time() - started
+    for listener in query_listeners:
+        listener(conn, cursor, statement, parameters, executemany, started, duration)
+
+
+@event.listens_for(Engine, 'handle_error')
+def fail_query_timer(context):
+    """ Hands a failed statement's start and duration to the error listeners. """
+
+    if context.connection is None or not context.connection.info.get('query_started'):
+        return
+    started = context.connection.info['query_started'].pop()
+    duration = time.time() - started
+    for listener in error_listeners:
+        listener(context, started, duration)
@@ -0,0 +1,175 @@
+# ezasdf-users/project/api/ratelimit.py
+
+
+import math
+import threading
+import time
+
+from flask import current_app, request
+
+
+class MemoryBackend:
+    """ Per process counter storage. """
+
+    def __init__(self, max_keys=100000):
+        """ __init__
+
+        :param max_keys: number of keys kept before expired ones are pruned
+        """
+
+        self.lock = threading.Lock()
+        self.counters = {}
+        self.max_keys = max_keys
+
+    def incr(self, key, expires):
+        """ Increments the counter at key.
+
+        :param key:
+        :param expires: seconds until the counter is dropped
+        :return: integer
+        """
+
+        now = time.time()
+        with self.lock:
+            if len(self.counters) >= self.max_keys:
+                self.counters = {k: v for k, v in self.counters.items() if v[1] > now}
+            count, expires_at = self.counters.get(key, (0, 0))
+            if expires_at <= now:
+                count, expires_at = 0, now + expires
+            self.counters[key] = (count + 1, expires_at)
+            return count + 1
+
+    def get(self, key):
+        """ Fetches the counter at key.
+
+        :param key:
+        :return: integer
+        """
+
+        count, expires_at = self.counters.get(key, (0, 0))
+        return count if expires_at > time.time() else 0
+
+
+class RedisBackend:
+    """ Counter storage shared by every worker through redis. """
+
+    def __init__(self, client):
+        """ __init__
+
+        :param client: redis client
+        """
+
+        self.client = client
+
+    @classmethod
+    def from_url(cls, url):
+        """ Connects to the redis server at url.
+
+        :param url:
+        :return: RedisBackend
+        """
+
+        import redis
+        return cls(redis.StrictRedis.from_url(url))
+
+    def incr(self, key, expires):
+        """ Increments the counter at key.
+
+        :param key:
+        :param expires: seconds until the counter is dropped
+        :return: integer
+        """
+
+        pipe = self.client.pipeline()
+        pipe.incr(key)
+        pipe.expire(key, int(math.ceil(expires)))
+        return int(pipe.execute()[0])
+
+    def get(self, key):
+        """ Fetches the counter at key.
+
+        :param key:
+        :return: integer
+        """
+
+        return int(self.client.get(key) or 0)
+
+
+class SlidingWindowLimiter:
+    """ Sliding window counter rate limiter.
+
+    The count of the previous fixed window is weighted by how much of it
+    still overlaps the sliding window, so only two counters are kept per key.
+    """
+
+    def __init__(self, backend):
+        """ __init__
+
+        :param backend: MemoryBackend|RedisBackend
+        """
+
+        self.backend = backend
+
+    def hit(self, key, limit, window):
+        """ Records a hit and determines if key is over its limit.
+
+        :param key:
+        :param limit: hits allowed per window
+        :param window: seconds
+        :return: integer seconds to wait, 0 if allowed
+        """
+
+        now = time.time()
+        current = int(now // window)
+        elapsed = now - current * window
+        count = self.backend.incr('{key}:{window}'.format(key=key, window=current), window * 2)
+        previous = self.backend.get('{key}:{window}'.format(key=key, window=current - 1))
+        if previous * (window - elapsed) / window + count <= limit:
+            return 0
+        return max(1, int(math.ceil(window - elapsed)))
+
+
+def get_limiter():
+    """ Fetches the app's limiter, creating it from RATELIMIT_STORAGE_URL.
+
+    :return: SlidingWindowLimiter
+    """
+
+    limiter = current_app.extensions.get('rate_limiter')
+    if limiter is None:
+        url = current_app.config.get('RATELIMIT_STORAGE_URL')
+        if url.startswith('redis://'):
+            backend = RedisBackend.from_url(url)
+        else:
+            backend = MemoryBackend()
+        limiter = current_app.extensions['rate_limiter'] = SlidingWindowLimiter(backend)
+    return limiter
+
+
+def signin_retry_after(email, address=None):
+    """ Records a signin attempt for the email and the client address.
+
+    Fails open when the backend is unreachable.
+
+    :param email:
+    :param address: client address, defaults to the request's
+    :return: integer seconds to wait, 0 if allowed
+    """
+
+    if not current_app.config.get('RATELIMIT_ENABLED'):
+        return 0
+    limiter = get_limiter()
+    try:
+        return max(
+            limiter.hit(
+                'signin:client:{address}'.format(address=address or request.remote_addr),
+                *current_app.config.get('RATELIMIT_SIGNIN_PER_CLIENT')
+            ),
+            limiter.hit(
+                'signin:email:{email}'.format(email=str(email).lower()),
+                *current_app.config.get('RATELIMIT_SIGNIN_PER_EMAIL')
+            )
+        )
+    except Exception as e:
+        current_app.logger.warning('Rate limiter unavailable: %s', e)
+        return 0
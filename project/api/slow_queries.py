@@ -0,0 +1,262 @@
+# ezasdf-users/project/api/slow_queries.py
+
+
+import datetime
+import json
+import queue
+import re
+import threading
+from collections import OrderedDict
+
+from flask import current_app, has_app_context, has_request_context, request
+
+from project.api.query_timing import on_query
+
+
+write_lock = threading.Lock()
+explained = OrderedDict()
+explained_lock = threading.Lock()
+explainer = None
+explainer_lock = threading.Lock()
+
+
+def params_shape(parameters, executemany=False):
+    """ Describes the parameters of a statement without their values.
+
+    :param parameters:
+    :param executemany:
+    :return: dict|list|str
+    """
+
+    if executemany:
+        return {
+            'rows': len(parameters),
+            'row': params_shape(parameters[0]) if parameters else None
+        }
+    if isinstance(parameters, dict):
+        return {key: type(value).__name__ for key, value in parameters.items()}
+    if isinstance(parameters, (list, tuple)):
+        return [type(value).__name__ for value in parameters]
+    return type(parameters).__name__
+
+
+def explain(engine, statement, parameters):
+    """ Captures EXPLAIN (ANALYZE, BUFFERS) of a statement on a connection of its own,
+    inside a transaction that is rolled back.
+    Runs on the raw cursor so it is not logged or traced itself.
+
+    :param engine:
+    :param statement:
+    :param parameters:
+    :return: list of str
+    """
+
+    connection = engine.raw_connection()
+    try:
+        cursor = connection.cursor()
+        try:
+            cursor.execute('EXPLAIN (ANALYZE, BUFFERS) ' + statement, parameters)
+            return [row[0] for row in cursor.fetchall()]
+        finally:
+            cursor.close()
+    finally:
+        connection.rollback()
+        connection.close()
+
+
+def write_record(path, record):
+    """ Appends a record to the slow query log.
+
+    :param path:
+    :param record:
+    """
+
+    with write_lock, open(path, 'a') as f:
+        f.write(json.dumps(record, default=str) + '\n')
+
+
+class Explainer:
+    """ Explains slow statements in a background thread, so the slow request
+    neither runs its statement twice nor risks its own transaction.
+    The record is written once its plan is captured.
+    """
+
+    def __init__(self, queue_size):
+        """ __init__
+
+        :param queue_size: statements allowed to wait, more are logged unexplained
+        """
+
+        self.queue = queue.Queue(queue_size)
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def submit(self, engine, record, parameters, path):
+        """ Queues a record's statement for explaining.
+
+        :param engine:
+        :param record:
+        :param parameters:
+        :param path: slow query log
+        :return: boolean, False if the queue is full
+        """
+
+        try:
+            self.queue.put_nowait((engine, record, parameters, path))
+        except queue.Full:
+            return False
+        return True
+
+    def run(self):
+        """ Thread target
+        Explains queued statements and writes their records.
+        """
+
+        while True:
+            engine, record, parameters, path = self.queue.get()
+            try:
+                record['explain'] = explain(engine, record['statement'], parameters)
+            except Exception as e:
+                record['explain_error'] = str(e)
+            try:
+                write_record(path, record)
+            except OSError:
+                pass
+            finally:
+                self.queue.task_done()
+
+
+def get_explainer():
+    """ Fetches the process's explainer, starting it on first use.
+
+    :return: Explainer
+    """
+
+    global explainer
+    if explainer is None:
+        with explainer_lock:
+            if explainer is None:
+                explainer = Explainer(current_app.config.get('SLOW_QUERY_EXPLAIN_QUEUE_SIZE'))
+    return explainer
+
+
+def claim_explain(statement, limit):
+    """ Determine if a statement was not explained yet, and remember it if so.
+    Only the limit most recently seen statements are remembered,
+    the least recently seen is forgotten first.
+
+    :param statement:
+    :param limit:
+    :return: boolean
+    """
+
+    with explained_lock:
+        if statement in explained:
+            explained.move_to_end(statement)
+            return False
+        explained[statement] = True
+        while len(explained) > limit:
+            explained.popitem(last=False)
+        return True
+
+
+def should_explain(conn, statement, duration_ms, config):
+    """ Determine if a slow statement is a top offender worth explaining.
+    Each statement is explained once while it is among the
+    SLOW_QUERY_EXPLAINED_MAX most recently explained ones.
+
+    :param conn:
+    :param statement:
+    :param duration_ms:
+    :param config:
+    :return: boolean
+    """
+
+    return (
+        config.get('SLOW_QUERY_EXPLAIN') and
+        duration_ms >= config.get('SLOW_QUERY_EXPLAIN_THRESHOLD_MS') and
+        conn.dialect.name == 'postgresql' and
+        statement.lstrip().upper().startswith('SELECT') and
+        claim_explain(statement, config.get('SLOW_QUERY_EXPLAINED_MAX'))
+    )
+
+
+def log_slow_query(conn, cursor, statement, parameters, executemany, started, duration):
+    """ Logs a statement slower than SLOW_QUERY_THRESHOLD_MS.
+    Top offenders are handed to the explainer, which writes their record.
+    """
+
+    duration_ms = duration * 1000
+    if not has_app_context():
+        return
+    config = current_app.config
+    if not config.get('SLOW_QUERY_LOG_ENABLED') or duration_ms < config.get('SLOW_QUERY_THRESHOLD_MS'):
+        return
+    record = {
+        'time': datetime.datetime.utcnow().isoformat() + 'Z',
+        'duration_ms': round(duration_ms, 3),
+        'statement': statement,
+        'params': params_shape(parameters, executemany),
+        'route': request.url_rule.rule if has_request_context() and request.url_rule else None,
+        'method': request.method if has_request_context() else None
+    }
+    if should_explain(conn, statement, duration_ms, config):
+        if get_explainer().submit(conn.engine, record, parameters, config.get('SLOW_QUERY_LOG')):
+            return
+        record['explain_error'] = 'Explain queue is full.'
+    write_record(config.get('SLOW_QUERY_LOG'), record)
+
+
+def init_slow_query_log(app):
+    """ Registers the slow query listener on the shared query timer.
+
+    :param app:
+    """
+
+    on_query(log_slow_query)
+
+
+def normalize(statement):
+    """ Collapses whitespace and literals so equivalent statements group together.
+
+    :param statement:
+    :return: str
+    """
+
+    statement = re.sub(r"'(?:[^']|'')*'", '?', statement)
+    statement = re.sub(r'\b\d+\b', '?', statement)
+    return re.sub(r'\s+', ' ', statement).strip()
+
+
+def summarize(path, top=10):
+    """ Groups a slow query log by statement, slowest total time first.
+
+    :param path:
+    :param top:
+    :return: list of dicts
+    """
+
+    groups = {}
+    with open(path) as f:
+        for line in f:
+            record = json.loads(line)
+            key = normalize(record['statement'])
+            group = groups.setdefault(key, {
+                'statement': key,
+                'count': 0,
+                'total_ms': 0,
+                'max_ms': 0,
+                'routes': set(),
+                'explain': None
+            })
+            group['count'] += 1
+            group['total_ms'] += record['duration_ms']
+            group['max_ms'] = max(group['max_ms'], record['duration_ms'])
+            if record.get('route'):
+                group['routes'].add(record['route'])
+            group['explain'] = record.get('explain') or group['explain']
+    summary = sorted(groups.values(), key=lambda group: group['total_ms'], reverse=True)[:top]
+    for group in summary:
+        group['mean_ms'] = group['total_ms'] / group['count']
+        group['routes'] = sorted(group['routes'])
+    return summary
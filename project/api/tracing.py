@@ -0,0 +1,267 @@
+# ezasdf-users/project/api/tracing.py
+
+
+import json
+import os
+import random
+import re
+import threading
+import time
+from contextlib import contextmanager
+
+from flask import current_app, g, has_request_context, request
+from werkzeug.utils import import_string
+
+from project.api.query_timing import on_query, on_query_error
+
+
+TRACEPARENT = re.compile(r'^00-([0-9a-f]{32})-([0-9a-f]{16})-([0-9a-f]{2})$')
+
+
+def parse_traceparent(header):
+    """ Parses a W3C traceparent header.
+
+    :param header:
+    :return: (trace_id, parent_id, sampled)|None
+    """
+
+    match = TRACEPARENT.match((header or '').strip().lower())
+    if not match:
+        return None
+    trace_id, parent_id, flags = match.groups()
+    if trace_id == '0' * 32 or parent_id == '0' * 16:
+        return None
+    return trace_id, parent_id, bool(int(flags, 16) & 1)
+
+
+def format_traceparent(trace_id, span_id):
+    """ Formats a sampled W3C traceparent header.
+
+    :param trace_id:
+    :param span_id:
+    :return: str
+    """
+
+    return '00-{trace_id}-{span_id}-01'.format(trace_id=trace_id, span_id=span_id)
+
+
+class Span:
+    """ A timed unit of work in a trace. """
+
+    def __init__(self, name, trace_id, parent_id=None, attributes=None):
+        """ __init__
+
+        :param name:
+        :param trace_id:
+        :param parent_id:
+        :param attributes:
+        """
+
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = os.urandom(8).hex()
+        self.parent_id = parent_id
+        self.attributes = attributes or {}
+        self.start = time.time()
+        self.end = None
+
+    def finish(self):
+        """ Stops the span's clock. """
+
+        self.end = time.time()
+
+    def to_json(self):
+        return {
+            'name': self.name,
+            'trace_id': self.trace_id,
+            'span_id': self.span_id,
+            'parent_id': self.parent_id,
+            'start': self.start,
+            'duration_ms': round(((self.end or time.time()) - self.start) * 1000, 3),
+            'attributes': self.attributes
+        }
+
+
+class NDJSONFileExporter:
+    """ Appends finished spans to a file, one JSON object per line. """
+
+    def __init__(self, path):
+        """ __init__
+
+        :param path:
+        """
+
+        self.path = path
+        self.lock = threading.Lock()
+
+    @classmethod
+    def from_config(cls, config):
+        """ Creates the exporter from TRACING_FILE.
+
+        :param config:
+        :return: NDJSONFileExporter
+        """
+
+        return cls(config.get('TRACING_FILE'))
+
+    def export(self, spans):
+        """ Writes the spans.
+
+        :param spans: list of Span
+        """
+
+        lines = ''.join(json.dumps(span.to_json(), default=str) + '\n' for span in spans)
+        with self.lock, open(self.path, 'a') as f:
+            f.write(lines)
+
+
+def get_exporter():
+    """ Fetches the app's exporter, creating it from TRACING_EXPORTER.
+
+    :return: exporter
+    """
+
+    exporter = current_app.extensions.get('trace_exporter')
+    if exporter is None:
+        exporter_class = import_string(current_app.config.get('TRACING_EXPORTER'))
+        exporter = current_app.extensions['trace_exporter'] = exporter_class.from_config(current_app.config)
+    return exporter
+
+
+def active_span():
+    """ Fetches the innermost open span of the current request.
+
+    :return: Span|None
+    """
+
+    if not has_request_context():
+        return None
+    stack = g.get('trace_stack')
+    return stack[-1] if stack else None
+
+
+def start_span(name, **attributes):
+    """ Opens a child of the innermost open span.
+
+    :param name:
+    :param attributes:
+    :return: Span|None
+    """
+
+    parent = active_span()
+    if parent is None:
+        return None
+    child = Span(name, parent.trace_id, parent.span_id, attributes)
+    g.trace_spans.append(child)
+    g.trace_stack.append(child)
+    return child
+
+
+def finish_span(child):
+    """ Closes a span opened by start_span.
+
+    :param child:
+    """
+
+    if child is not None:
+        child.finish()
+        if g.get('trace_stack') and g.trace_stack[-1] is child:
+            g.trace_stack.pop()
+
+
+@contextmanager
+def span(name, **attributes):
+    """ Context manager
+    Traces the block as a child span when the request is traced.
+
+    :param name:
+    :param attributes:
+    """
+
+    child = start_span(name, **attributes)
+    try:
+        yield child
+    finally:
+        finish_span(child)
+
+
+def start_trace():
+    """ Before request hook
+    Opens the request's root span, continuing the caller's trace if any.
+    """
+
+    g.trace_spans = g.trace_stack = None
+    config = current_app.config
+    if not config.get('TRACING_ENABLED'):
+        return
+    parent = parse_traceparent(request.headers.get('traceparent'))
+    if parent:
+        trace_id, parent_id, sampled = parent
+    else:
+        trace_id, parent_id = os.urandom(16).hex(), None
+        sampled = random.random() < config.get('TRACING_SAMPLE_RATE')
+    if not sampled:
+        return
+    root = Span(
+        '{method} {path}'.format(method=request.method, path=request.url_rule.rule if request.url_rule else request.path),
+        trace_id,
+        parent_id,
+        {'http.method': request.method, 'http.path': request.path}
+    )
+    g.trace_spans = [root]
+    g.trace_stack = [root]
+
+
+def finish_trace(response):
+    """ After request hook
+    Closes the root span, exports the trace and propagates its traceparent.
+
+    :param response:
+    :return: flask response
+    """
+
+    spans = g.get('trace_spans')
+    if not spans:
+        return response
+    root = spans[0]
+    root.attributes['http.status_code'] = response.status_code
+    root.finish()
+    g.trace_spans = g.trace_stack = None
+    response.headers['traceparent'] = format_traceparent(root.trace_id, root.span_id)
+    try:
+        get_exporter().export(spans)
+    except Exception as e:
+        current_app.logger.warning('Trace not exported: %s', e)
+    return response
+
+
+@on_query
+def record_query_span(conn, cursor, statement, parameters, executemany, started, duration):
+    """ Records a statement of a traced request as a span. """
+
+    child = start_span('db.query', statement=statement[:500])
+    if child is not None:
+        child.start = started
+        child.attributes['rowcount'] = cursor.rowcount
+        finish_span(child)
+
+
+@on_query_error
+def record_failed_query_span(context, started, duration):
+    """ Records a failed statement of a traced request as a span. """
+
+    child = start_span('db.query', statement=context.statement[:500] if context.statement else None)
+    if child is not None:
+        child.start = started
+        child.attributes['error'] = str(context.original_exception)
+        finish_span(child)
+
+
+def init_tracing(app):
+    """ Registers the tracing hooks on the app.
+
+    :param app:
+    """
+
+    app.before_request(start_trace)
+    app.after_request(finish_trace)
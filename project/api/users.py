@@ -1,16 +1,106 @@
 # asdf-users/project/api/users.py
 
 
-from flask import Blueprint, request
-from sqlalchemy import exc, or_
+import datetime
+import re
 
+from dateutil import parser
+from flask import Blueprint, current_app, request
+from sqlalchemy import exc, func, or_, tuple_
+
+from project.api.coalescing import coalesce
 from project.api.models import User
-from project.api.utils import add_user, error_response, success_response, authenticate, is_admin
+from project.api.partitioning import identity_clause
+from project.api.validation import SIGNUP, limit_body_size
+from project.api.utils import (
+    add_user,
+    error_response,
+    success_response,
+    authenticate,
+    is_admin,
+    bulk_update_users,
+    count_users,
+    get_user_stats
+)
 from project import db
 
 
 users_blueprint = Blueprint('users', __name__)
 
+BULK_FIELDS = ('active', 'admin')
+DOMAIN = re.compile(r'^[A-Za-z0-9.-]+$')
+CURSOR_TIME_FORMAT = '%Y-%m-%dT%H:%M:%S.%f'
+COUNT_METHODS = ('exact', 'estimated')
+
+
+def format_users_cursor(user):
+    """ Encodes a user's position in the newest first listing.
+
+    :param user:
+    :return: str
+    """
+
+    return '{created_at}_{id}'.format(created_at=user.created_at.strftime(CURSOR_TIME_FORMAT), id=user.id)
+
+
+def parse_users_cursor(cursor):
+    """ Decodes a cursor made by format_users_cursor.
+
+    :param cursor:
+    :return: (created_at, id)
+    """
+
+    created_at, _, user_id = cursor.rpartition('_')
+    return datetime.datetime.strptime(created_at, CURSOR_TIME_FORMAT), int(user_id)
+
+
+def parse_timestamp(value):
+    """ Parses a timestamp as a naive UTC datetime.
+
+    :param value:
+    :return: datetime
+    """
+
+    if not isinstance(value, str):
+        raise ValueError(value)
+    try:
+        timestamp = parser.parse(value)
+    except OverflowError:
+        raise ValueError(value)
+    if timestamp.tzinfo is not None:
+        timestamp = timestamp.astimezone(datetime.timezone.utc).replace(tzinfo=None)
+    return timestamp
+
+
+def bulk_criteria(ids, filters):
+    """ Translates the ids or filter of a bulk request into clauses.
+
+    :param ids: list of user ids
+    :param filters: dict of active, admin, email_domain, created_after, created_before
+    :return: list of clauses
+    """
+
+    if ids is not None:
+        if (not isinstance(ids, list) or not ids or len(ids) > current_app.config.get('BULK_MAX_IDS') or
+                not all(isinstance(user_id, int) and not isinstance(user_id, bool) for user_id in ids)):
+            raise ValueError(ids)
+        return [User.id.in_(ids)]
+    if not isinstance(filters, dict) or not filters:
+        raise ValueError(filters)
+    criteria = []
+    for name, value in filters.items():
+        if name in BULK_FIELDS and isinstance(value, bool):
+            criteria.append(getattr(User, name) == value)
+        elif name == 'email_domain' and isinstance(value, str) and DOMAIN.match(value):
+            criteria.append(func.lower(User.email).like('%@' + value.lower()))
+        elif name == 'created_after':
+            criteria.append(User.created_at >= parse_timestamp(value))
+        elif name == 'created_before':
+            criteria.append(User.created_at < parse_timestamp(value))
+        else:
+            raise ValueError(name)
+    return criteria
+
 
 @users_blueprint.route('/users/ping', methods=['GET'])
 def get_users_ping():
@@ -24,23 +114,99 @@ def get_users_ping():
 
 
 @users_blueprint.route('/users', methods=['GET'])
+@coalesce
 def get_users():
-    """ GET /users
-    Fetches a list of users.
+    """ GET /users?limit=<limit>&cursor=<cursor>&count=exact|estimated
+    Fetches a list of users, newest first.
+    With a limit the list is paged by keyset and returns the next cursor.
+    With count the total is returned in X-Total-Count.
 
     :return: Flask Response
     """
 
+    query = User.query.order_by(User.created_at.desc(), User.id.desc())
+    count = request.args.get('count')
+    try:
+        limit = request.args.get('limit')
+        if limit is not None:
+            limit = int(limit)
+            if limit < 1:
+                raise ValueError(limit)
+        if request.args.get('cursor'):
+            query = query.filter(tuple_(User.created_at, User.id) < parse_users_cursor(request.args.get('cursor')))
+    except ValueError:
+        return error_response(), 400
+    if count is not None and count not in COUNT_METHODS:
+        return error_response(), 400
+    headers = {}
+    if count:
+        headers['X-Total-Count'] = str(count_users(count))
+    if limit is None:
+        data = {'users': [user.to_json() for user in query.all()]}
+    else:
+        limit = min(limit, current_app.config.get('USERS_MAX_PAGE_SIZE'))
+        users = query.limit(limit + 1).all()
+        has_more = len(users) > limit
+        users = users[:limit]
+        data = {
+            'users': [user.to_json() for user in users],
+            'cursor': format_users_cursor(users[-1]) if has_more else None,
+            'has_more': has_more
+        }
     # TODO use serialize
     return success_response(
         'Users fetched.',
+        data=data
+    ), 200, headers
+
+
+@users_blueprint.route('/users/stats', methods=['GET'])
+def get_users_stats():
+    """ GET /users/stats
+    Fetches the total, active, inactive and admin user counts.
+
+    :return: Flask Response
+    """
+
+    return success_response(
+        'User stats fetched.',
+        data=get_user_stats().to_json()
+    ), 200
+
+
+@users_blueprint.route('/users/changes', methods=['GET'])
+def get_users_changes():
+    """ GET /users/changes?since=<cursor>&limit=<limit>
+    Fetches the users that changed after the cursor, oldest change first.
+    Consumers resume from the returned cursor until has_more is false.
+
+    :return: Flask Response
+    """
+
+    config = current_app.config
+    try:
+        since = int(request.args.get('since', 0))
+        limit = int(request.args.get('limit', config.get('CHANGES_PAGE_SIZE')))
+    except ValueError:
+        return error_response(), 400
+    if since < 0 or limit < 1:
+        return error_response(), 400
+    limit = min(limit, config.get('CHANGES_MAX_PAGE_SIZE'))
+    users = User.query.filter(User.change_seq > since).order_by(User.change_seq).limit(limit + 1).all()
+    has_more = len(users) > limit
+    users = users[:limit]
+    return success_response(
+        'Changes fetched.',
         data={
-            'users': [user.to_json() for user in User.query.order_by(User.created_at.desc()).all()]
+            'users': [user.to_json() for user in users],
+            'cursor': str(users[-1].change_seq if users else since),
+            'has_more': has_more
         }
     ), 200
 
 
 @users_blueprint.route('/users', methods=['POST'])
+@limit_body_size('MAX_BODY_SIZE')
 @authenticate
 def post_users(user_id):
     """ POST /users
@@ -61,15 +227,17 @@ def post_users(user_id):
         return error_response(
             'You do not have permission to do that.'
         ), 401
-    data = request.get_json()
+    data = request.get_json(silent=True)
     if not data:
         return error_response(), 400
+    errors = SIGNUP.validate(data)
+    if errors:
+        return error_response(errors=errors), 400
     username = data.get('username')
     email = data.get('email')
     password = data.get('password')
-    # TODO setup validation
     try:
-        if not User.query.filter(or_(User.username == username, User.email == email)).first():
+        if not User.query.filter(or_(identity_clause('username', username), identity_clause('email', email))).first():
             add_user(username, email, password)
             return success_response(
                 '{email} was added!'.format(email=email)
@@ -82,7 +250,48 @@ def post_users(user_id):
         return error_response(), 400
 
 
+@users_blueprint.route('/users/bulk', methods=['PATCH'])
+@limit_body_size('BULK_MAX_BODY_SIZE')
+@authenticate
+def patch_users_bulk(user_id):
+    """ PATCH /users/bulk
+    Applies active and admin changes to many users in one statement.
+    The body limit leaves room for BULK_MAX_IDS of the longest ids.
+    model:
+        ids or filter,
+        set
+
+    :param user_id:
+    :return: Flask Response
+    """
+
+    if not is_admin(user_id):
+        return error_response(
+            'You do not have permission to do that.'
+        ), 401
+    data = request.get_json(silent=True)
+    if not data or not isinstance(data, dict):
+        return error_response(), 400
+    changes = data.get('set')
+    if (not isinstance(changes, dict) or not changes or
+            not all(name in BULK_FIELDS and isinstance(value, bool) for name, value in changes.items())):
+        return error_response(), 400
+    if (data.get('ids') is None) == (data.get('filter') is None):
+        return error_response(), 400
+    try:
+        criteria = bulk_criteria(data.get('ids'), data.get('filter'))
+    except ValueError:
+        return error_response(), 400
+    ids = bulk_update_users(criteria, changes)
+    db.session.commit()
+    return success_response(
+        '{count} users updated.'.format(count=len(ids)),
+        data={'ids': ids}
+    ), 200
+
+
 @users_blueprint.route('/users/<user_id>', methods=['GET'])
+@coalesce
 def get_user_by_id(user_id):
     """ GET /users/<user_id>
     Fetches a user with the specified id.
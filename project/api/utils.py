@@ -1,45 +1,141 @@
 # ezasdf-users/project/api/utils.py
 
 
+import calendar
 import datetime
 import json
+import time
 from functools import wraps
 
-from flask import request, jsonify
+from flask import current_app, g, has_request_context, request, jsonify
+from sqlalchemy import and_, bindparam, func, or_, select, text
 
 from project import db
-from project.api.models import User
+from project.api.models import (
+    OutboxEvent,
+    User,
+    UserStats,
+    adjust_user_stats,
+    bump_change_counter,
+    event_row,
+    refresh_user_stats
+)
+from project.api.tracing import span
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+
+MSGPACK_MIMETYPES = ('application/msgpack', 'application/x-msgpack')
+
+
+def encode_msgpack(obj):
+    """ Encodes types msgpack does not know natively.
+    Naive datetimes are UTC and use the msgpack timestamp extension.
+
+    :param obj:
+    :return: msgpack.Timestamp
+    """
+
+    if isinstance(obj, datetime.datetime):
+        if obj.tzinfo is not None:
+            obj = obj.astimezone(datetime.timezone.utc)
+        return msgpack.Timestamp(calendar.timegm(obj.timetuple()), obj.microsecond * 1000)
+    raise TypeError('{obj!r} is not msgpack serializable'.format(obj=obj))
+
+
+def wants_msgpack():
+    """ Determine if the client prefers msgpack over json.
+
+    :return: boolean
+    """
+
+    if msgpack is None or not has_request_context():
+        return False
+    return request.accept_mimetypes.best_match(('application/json',) + MSGPACK_MIMETYPES) in MSGPACK_MIMETYPES
+
+
+def serialize(body):
+    """ Generates a flask response with the body encoded as negotiated.
+    json is the default.
+
+    :param body:
+    :return: flask response
+    """
+
+    if wants_msgpack():
+        response = current_app.response_class(
+            msgpack.packb(body, default=encode_msgpack, use_bin_type=True),
+            mimetype=MSGPACK_MIMETYPES[0]
+        )
+    else:
+        response = jsonify(body)
+    if msgpack is not None:
+        response.vary.add('Accept')
+    return response
 
 
 def success_response(message, data=None):
-    """ Generates a flask success response with jsonify.
+    """ Generates a flask success response as json or msgpack.
 
     :param message:
     :param data:
     :return: flask response
     """
 
-    return jsonify({
+    return serialize({
         'status': 'success',
         'message': message,
         'data': data
     })
 
 
-def error_response(message='Invalid payload.'):
-    """ Generates a flask error response with jsonify.
+def error_response(message='Invalid payload.', errors=None):
+    """ Generates a flask error response as json or msgpack.
 
     :param message:
+    :param errors: dict of field name to error
     :return: flask response
     """
 
-    return jsonify({
+    body = {
         'status': 'error',
         'message': message
-    })
+    }
+    if errors:
+        body['errors'] = errors
+    return serialize(body)
+
+
+def overloaded_response(e):
+    """ Error handler
+    Generates the response for work that was not admitted.
+
+    :param e: Overloaded
+    :return: flask response
+    """
 
+    return error_response(
+        'Server is busy. Try again later.'
+    ), 503, {'Retry-After': str(e.retry_after)}
 
-def add_user(username, email, password, created_at=datetime.datetime.utcnow()):
+
+def payload_too_large_response(e):
+    """ Error handler
+    Generates the response for bodies over their endpoint's size limit.
+
+    :param e: RequestEntityTooLarge
+    :return: flask response
+    """
+
+    return error_response(
+        'Payload too large.'
+    ), 413
+
+
+def add_user(username, email, password, created_at=None):
     """ Adds a new user to the database.
 
     :param username:
@@ -60,6 +156,145 @@ def add_user(username, email, password, created_at=datetime.datetime.utcnow()):
     return new_user
 
 
+BULK_COLUMNS = ('id', 'username', 'email', 'active', 'admin', 'created_at', 'updated_at', 'change_seq')
+
+
+def bulk_update_returning(criteria, changes, base, now):
+    """ Updates the matching users with a single UPDATE ... FROM ... RETURNING.
+
+    :param criteria: clause over the users table
+    :param changes: dict of column name to value
+    :param base: change sequence number before the first updated user
+    :param now:
+    :return: list of rows with BULK_COLUMNS, was_active and was_admin
+    """
+
+    users = User.__table__
+    candidates = select([users.c.id]).where(criteria).order_by(users.c.id).with_for_update()
+    old = select([
+        users.c.id,
+        users.c.active,
+        users.c.admin,
+        func.row_number().over(order_by=users.c.id).label('rn')
+    ]).where(users.c.id.in_(candidates)).alias('old')
+    return db.session.execute(
+        users.update().where(users.c.id == old.c.id).values(
+            updated_at=now,
+            change_seq=base + old.c.rn,
+            **changes
+        ).returning(
+            *[users.c[name] for name in BULK_COLUMNS] +
+            [old.c.active.label('was_active'), old.c.admin.label('was_admin')]
+        )
+    ).fetchall()
+
+
+def bulk_update_selecting(criteria, changes, base, now):
+    """ Updates the matching users on databases without UPDATE ... RETURNING.
+    The old values are selected first and the new rows read back after one
+    executemany UPDATE.
+
+    :param criteria: clause over the users table
+    :param changes: dict of column name to value
+    :param base: change sequence number before the first updated user
+    :param now:
+    :return: list of dicts with BULK_COLUMNS, was_active and was_admin
+    """
+
+    users = User.__table__
+    old = db.session.execute(
+        select([users.c.id, users.c.active, users.c.admin]).where(criteria).order_by(users.c.id)
+    ).fetchall()
+    if not old:
+        return []
+    db.session.execute(
+        users.update().where(users.c.id == bindparam('user_id')).values(
+            updated_at=now,
+            change_seq=bindparam('seq'),
+            **changes
+        ),
+        [{'user_id': row.id, 'seq': base + n} for n, row in enumerate(old, 1)]
+    )
+    new = db.session.execute(
+        select([users.c[name] for name in BULK_COLUMNS]).where(users.c.id.in_([row.id for row in old]))
+    ).fetchall()
+    was = {row.id: row for row in old}
+    return [
+        dict(row.items(), was_active=was[row.id].active, was_admin=was[row.id].admin)
+        for row in new
+    ]
+
+
+def bulk_update_users(criteria, changes):
+    """ Applies changes to every user matching criteria in one UPDATE.
+    Users the changes would not alter are left alone. Updated users get new
+    change sequence numbers, outbox events and stats deltas, like ORM updates do.
+
+    :param criteria: list of clauses over the users table
+    :param changes: dict of column name to value
+    :return: list of updated user ids
+    """
+
+    users = User.__table__
+    now = datetime.datetime.utcnow()
+    base = bump_change_counter(db.session, User.__tablename__, 0)
+    criteria = and_(or_(*[users.c[name] != value for name, value in changes.items()]), *criteria)
+    if db.engine.dialect.name == 'postgresql':
+        rows = bulk_update_returning(criteria, changes, base, now)
+    else:
+        rows = bulk_update_selecting(criteria, changes, base, now)
+    if rows:
+        bump_change_counter(db.session, User.__tablename__, len(rows))
+        adjust_user_stats(
+            db.session,
+            0,
+            sum(row['active'] - row['was_active'] for row in rows),
+            sum(row['admin'] - row['was_admin'] for row in rows)
+        )
+        db.session.execute(OutboxEvent.__table__.insert().values([
+            event_row(
+                'user.deactivated' if row['was_active'] and not row['active'] else 'user.updated',
+                {key: row[key] for key in BULK_COLUMNS if key != 'admin'},
+                now
+            )
+            for row in sorted(rows, key=lambda row: row['change_seq'])
+        ]))
+    db.session.expire_all()
+    return sorted(row['id'] for row in rows)
+
+
+def get_user_stats():
+    """ Fetches the user stats, seeding them on first use.
+
+    :return: UserStats
+    """
+
+    stats = UserStats.query.get(1)
+    if stats is None:
+        stats = refresh_user_stats(db.session)
+        db.session.commit()
+    return stats
+
+
+def count_users(method):
+    """ Counts the users without scanning the table.
+    exact reads the maintained stats, estimated reads the planner's
+    row estimate, which is refreshed by VACUUM and ANALYZE, on postgres.
+
+    :param method: exact|estimated
+    :return: integer
+    """
+
+    if method == 'estimated' and db.engine.dialect.name == 'postgresql':
+        estimate = db.session.execute(
+            text('SELECT reltuples::bigint FROM pg_class WHERE oid = CAST(:table AS regclass)'),
+            {'table': User.__tablename__}
+        ).scalar()
+        if estimate and estimate > 0:
+            return estimate
+    return get_user_stats().total
+
+
 def authenticate(f):
     """ Decorator
     Throws a flask error response or calculates
@@ -85,28 +320,106 @@ def authenticate(f):
                 'Provide a valid token.'
             ), 403
         token = auth_header[7:]
-        user_id = User.decode_jwt(token)
-        if isinstance(user_id, str):
-            return error_response(user_id), 401
-        user = User.query.filter_by(id=user_id).first()
-        if not user or not user.active:
+        claims = User.decode_jwt_claims(token)
+        if isinstance(claims, str):
+            return error_response(claims), 401
+        user_id = claims['sub']
+        g.token_claims = claims
+        g.user = None
+        if claims_fresh(claims):
+            active = claims['active']
+        else:
+            user = current_user()
+            active = user is not None and user.active
+        if not active:
             return error_response(
                 'Something went wrong. Please contact us.'
             ), 401
+        g.user_id = user_id
         return f(user_id, *args, **kwargs)
 
     return decorated_function
 
 
+def claims_fresh(claims):
+    """ Determine if a token's admin and active claims may stand in for the user row.
+    Claims are trusted for TOKEN_CLAIMS_MAX_AGE seconds after the token was issued.
+
+    :param claims:
+    :return: boolean
+    """
+
+    max_age = current_app.config.get('TOKEN_CLAIMS_MAX_AGE')
+    return bool(max_age) and 'active' in claims and time.time() - claims['iat'] <= max_age
+
+
+def verify_tokens(tokens):
+    """ Verifies tokens, resolving every referenced user with one query.
+    Users behind fresh claims are not looked up.
+
+    :param tokens: list of str
+    :return: list of dicts with valid, sub, active, admin, exp and error
+    """
+
+    decoded = [User.decode_jwt_claims(token) for token in tokens]
+    ids = {claims['sub'] for claims in decoded if not isinstance(claims, str) and not claims_fresh(claims)}
+    users = {}
+    if ids:
+        with span('db.user_lookup'):
+            users = {
+                row.id: row
+                for row in db.session.query(User.id, User.active, User.admin).filter(User.id.in_(ids))
+            }
+    results = []
+    for claims in decoded:
+        if isinstance(claims, str):
+            results.append({'valid': False, 'sub': None, 'active': None, 'admin': None, 'exp': None, 'error': claims})
+            continue
+        if claims['sub'] in users:
+            active, admin = users[claims['sub']].active, users[claims['sub']].admin
+        elif claims_fresh(claims):
+            active, admin = claims['active'], claims['admin']
+        else:
+            active = admin = False
+        results.append({
+            'valid': bool(active),
+            'sub': claims['sub'],
+            'active': bool(active),
+            'admin': bool(admin),
+            'exp': claims['exp'],
+            'error': None if active else 'Something went wrong. Please contact us.'
+        })
+    return results
+
+
+def current_user():
+    """ Fetches the authenticated user, loading it at most once per request.
+
+    :return: User|None
+    """
+
+    if g.get('user') is None:
+        with span('db.user_lookup'):
+            g.user = User.query.filter_by(id=g.token_claims['sub']).first()
+    return g.user
+
+
 def is_admin(user_id):
     """ Determine if the user with the specified id is an admin.
+    The authenticated user is answered from fresh claims or the loaded row.
 
     :param user_id:
     :return: boolean
     """
 
-    user = User.query.filter_by(id=user_id).first()
-    return user.admin
+    claims = g.get('token_claims')
+    if claims is None or claims['sub'] != user_id:
+        user = User.query.filter_by(id=user_id).first()
+    elif g.get('user') is None and claims_fresh(claims):
+        return claims['admin']
+    else:
+        user = current_user()
+    return user is not None and user.admin
 
 
 def add_admin():
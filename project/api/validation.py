@@ -0,0 +1,132 @@
+# ezasdf-users/project/api/validation.py
+
+
+import re
+from functools import wraps
+
+from flask import current_app, request
+from werkzeug.exceptions import RequestEntityTooLarge
+
+
+EMAIL = re.compile(r'^[^@\s]+@[^@\s]+\.[^@\s]+$')
+USERNAME = re.compile(r'^[A-Za-z0-9_.-]+$')
+
+
+class Field:
+    """ A payload field with its type, length and format constraints. """
+
+    def __init__(self, kind, required=True, min_length=None, max_length=None, pattern=None, items=None):
+        """ __init__
+
+        :param kind: python type of the value
+        :param required:
+        :param min_length:
+        :param max_length:
+        :param pattern: compiled regex the value must match
+        :param items: Field every element of a list value must satisfy
+        """
+
+        self.kind = kind
+        self.required = required
+        self.min_length = min_length
+        self.max_length = max_length
+        self.pattern = pattern
+        self.items = items
+
+    def error(self, value):
+        """ Describes what is wrong with a value.
+
+        :param value:
+        :return: str|None
+        """
+
+        if not isinstance(value, self.kind) or isinstance(value, bool) and self.kind is not bool:
+            return 'Must be a {kind}.'.format(kind=self.kind.__name__)
+        unit = 'items' if self.kind is list else 'characters'
+        if self.max_length is not None and len(value) > self.max_length:
+            return 'Must be at most {length} {unit}.'.format(length=self.max_length, unit=unit)
+        if self.min_length is not None and len(value) < self.min_length:
+            return 'Must be at least {length} {unit}.'.format(length=self.min_length, unit=unit)
+        if self.pattern is not None and not self.pattern.match(value):
+            return 'Invalid format.'
+        if self.items is not None:
+            for index, item in enumerate(value):
+                error = self.items.error(item)
+                if error:
+                    return 'Item {index}: {error}'.format(index=index, error=error)
+        return None
+
+
+class Schema:
+    """ A payload schema, checked field by field in declaration order. """
+
+    def __init__(self, **fields):
+        """ __init__
+
+        :param fields: name to Field
+        """
+
+        self.fields = tuple(fields.items())
+
+    def validate(self, data):
+        """ Checks a payload against the schema.
+
+        :param data:
+        :return: dict of field name to error, empty when valid
+        """
+
+        if not isinstance(data, dict):
+            return {'payload': 'Must be an object.'}
+        errors = {}
+        for name, field in self.fields:
+            if data.get(name) is None:
+                if field.required:
+                    errors[name] = 'Required.'
+                continue
+            error = field.error(data[name])
+            if error:
+                errors[name] = error
+        return errors
+
+
+SIGNUP = Schema(
+    username=Field(str, min_length=1, max_length=128, pattern=USERNAME),
+    email=Field(str, max_length=128, pattern=EMAIL),
+    password=Field(str, min_length=1, max_length=128)
+)
+SIGNIN = Schema(
+    email=Field(str, max_length=128, pattern=EMAIL),
+    password=Field(str, min_length=1, max_length=128)
+)
+VERIFY_BATCH = Schema(
+    tokens=Field(list, min_length=1, items=Field(str, max_length=4096))
+)
+
+
+def limit_body_size(name):
+    """ Decorator
+    Rejects bodies declared larger than the limit configured as name
+    before they are read, or any authentication or query runs.
+
+    :param name: config key of the limit in bytes
+    :return: decorator
+    """
+
+    def decorator(f):
+        @wraps(f)
+        def decorated_function(*args, **kwargs):
+            """ Wrapper
+
+            :param args:
+            :param kwargs:
+            :return: flask response
+            :raises RequestEntityTooLarge:
+            """
+
+            if request.content_length is not None and request.content_length > current_app.config.get(name):
+                raise RequestEntityTooLarge()
+            return f(*args, **kwargs)
+
+        return decorated_function
+
+    return decorator
@@ -0,0 +1 @@
+# ezasdf-users/project/benchmarks/__init__.py
@@ -0,0 +1,100 @@
+# ezasdf-users/project/benchmarks/aio.py
+""" Compares GET /auth/profile served natively and by the Flask fallback
+under concurrent requests. Needs the postgres database of DATABASE_URL.
+
+usage: python -m project.benchmarks.aio [concurrency] [requests]
+"""
+
+
+import asyncio
+import sys
+import time
+
+from project import create_app, db
+from project.aio import create_asgi_app
+from project.api.models import OutboxEvent, User
+from project.api.utils import add_user
+
+
+async def get(app, path, token):
+    """ Sends one GET request through an ASGI app.
+
+    :param app: ASGI 3 app
+    :param path:
+    :param token:
+    :return: status
+    """
+
+    scope = {
+        'type': 'http',
+        'asgi': {'version': '3.0'},
+        'http_version': '1.1',
+        'method': 'GET',
+        'scheme': 'http',
+        'path': path,
+        'raw_path': path.encode(),
+        'query_string': b'',
+        'root_path': '',
+        'headers': [(b'authorization', 'Bearer {token}'.format(token=token).encode())],
+        'client': ('127.0.0.1', 50000),
+        'server': ('benchmark', 80)
+    }
+    sent = []
+
+    async def receive():
+        return {'type': 'http.request', 'body': b'', 'more_body': False}
+
+    async def send(message):
+        sent.append(message)
+
+    await app(scope, receive, send)
+    return sent[0]['status']
+
+
+async def measure(name, app, token, concurrency, requests):
+    """ Sends requests in batches of concurrency and prints the throughput.
+
+    :param name:
+    :param app: ASGI 3 app
+    :param token:
+    :param concurrency:
+    :param requests:
+    """
+
+    started = time.time()
+    for _ in range(0, requests, concurrency):
+        statuses = await asyncio.gather(*[get(app, '/auth/profile', token) for _ in range(concurrency)])
+        assert set(statuses) == {200}, statuses
+    seconds = time.time() - started
+    print('{name:<8} {rate:>10.0f} requests/s'.format(name=name, rate=requests / seconds))
+
+
+def main(concurrency=50, requests=2000):
+    """ Runs the benchmark.
+
+    :param concurrency:
+    :param requests:
+    """
+
+    app = create_app()
+    with app.app_context():
+        user = add_user('benchmark', 'benchmark@email.com', 'password')
+        db.session.commit()
+        user_id, token = user.id, user.encode_jwt(user.id).decode()
+    native = create_asgi_app(app)
+    fallback = create_asgi_app(app, native=False)
+    loop = asyncio.get_event_loop()
+    loop.run_until_complete(native.router.startup())
+    try:
+        loop.run_until_complete(measure('native', native, token, concurrency, requests))
+        loop.run_until_complete(measure('flask', fallback, token, concurrency, requests))
+    finally:
+        loop.run_until_complete(native.router.shutdown())
+        with app.app_context():
+            User.query.filter_by(id=user_id).delete()
+            OutboxEvent.query.filter_by(user_id=user_id).delete()
+            db.session.commit()
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
@@ -0,0 +1,163 @@
+# ezasdf-users/project/benchmarks/partitioning.py
+""" Compares lookups, listing pages and inserts on an unpartitioned users
+table and the same table after the hash partitioning migration.
+Runs in a scratch schema of DATABASE_URL that is dropped afterwards.
+
+usage: python -m project.benchmarks.partitioning [rows] [partitions] [repeat]
+"""
+
+
+import os
+import random
+import re
+import sys
+import time
+
+from sqlalchemy import create_engine, text
+
+from project.api.models import User
+from project.api.partitioning import partition_statements
+
+
+SCHEMA = 'bench_partitioning'
+
+LOAD = """
+INSERT INTO users (username, email, password, active, admin, created_at, updated_at, change_seq)
+SELECT 'user' || n, 'user' || n || '@email.com', 'password', true, false,
+       now() - n * interval '1 second', now(), n
+FROM generate_series(1, :rows) AS n
+"""
+
+QUERIES = {
+    'id': (
+        'SELECT * FROM users WHERE id = :id',
+        'SELECT * FROM users WHERE id = :id'
+    ),
+    'email': (
+        'SELECT * FROM users WHERE email = :email',
+        "SELECT * FROM users WHERE id = (SELECT user_id FROM user_identities WHERE kind = 'email' AND value = :email)"
+    ),
+    'page': (
+        'SELECT * FROM users WHERE (created_at, id) < (now() - :id * interval \'1 second\', :id) '
+        'ORDER BY created_at DESC, id DESC LIMIT 50',
+        'SELECT * FROM users WHERE (created_at, id) < (now() - :id * interval \'1 second\', :id) '
+        'ORDER BY created_at DESC, id DESC LIMIT 50'
+    )
+}
+
+
+def time_query(conn, statement, rows, repeat):
+    """ Times a statement over random users.
+
+    :param conn:
+    :param statement:
+    :param rows:
+    :param repeat:
+    :return: mean milliseconds
+    """
+
+    started = time.perf_counter()
+    for _ in range(repeat):
+        n = random.randint(1, rows)
+        conn.execute(text(statement), id=n, email='user{n}@email.com'.format(n=n)).fetchall()
+    return (time.perf_counter() - started) * 1000 / repeat
+
+
+def time_inserts(conn, rows, repeat):
+    """ Times single row inserts, rolled back afterwards.
+
+    :param conn:
+    :param rows:
+    :param repeat:
+    :return: mean milliseconds
+    """
+
+    transaction = conn.begin()
+    started = time.perf_counter()
+    for n in range(rows + 1, rows + repeat + 1):
+        conn.execute(text(
+            'INSERT INTO users (username, email, password, active, admin, created_at, updated_at, change_seq) '
+            "VALUES ('user' || :n, 'user' || :n || '@email.com', 'password', true, false, now(), now(), :n)"
+        ), n=n)
+    elapsed = time.perf_counter() - started
+    transaction.rollback()
+    return elapsed * 1000 / repeat
+
+
+def partitions_scanned(conn, statement, rows):
+    """ Counts the partitions a statement actually scans.
+
+    :param conn:
+    :param statement:
+    :param rows:
+    :return: integer
+    """
+
+    n = rows // 2
+    plan = '\n'.join(row[0] for row in conn.execute(
+        text('EXPLAIN (ANALYZE, COSTS OFF) ' + statement),
+        id=n,
+        email='user{n}@email.com'.format(n=n)
+    ))
+    return len([line for line in plan.splitlines() if re.search(r'on users_p\d+', line) and 'never executed' not in line])
+
+
+def measure(conn, rows, repeat, partitioned):
+    """ Times every query on the current users table.
+
+    :param conn:
+    :param rows:
+    :param repeat:
+    :param partitioned:
+    :return: dict of name to mean milliseconds
+    """
+
+    results = {
+        name: time_query(conn, statements[partitioned], rows, repeat)
+        for name, statements in QUERIES.items()
+    }
+    results['insert'] = time_inserts(conn, rows, repeat)
+    return results
+
+
+def main(rows=100000, partitions=16, repeat=1000):
+    engine = create_engine(os.getenv('DATABASE_URL'))
+    with engine.connect() as conn:
+        conn.execute('DROP SCHEMA IF EXISTS {schema} CASCADE'.format(schema=SCHEMA))
+        conn.execute('CREATE SCHEMA {schema}'.format(schema=SCHEMA))
+        conn.execute('SET search_path TO {schema}'.format(schema=SCHEMA))
+        try:
+            User.__table__.create(conn)
+            conn.execute(text(LOAD), rows=rows)
+            conn.execute('ANALYZE users')
+            plain = measure(conn, rows, repeat, False)
+            started = time.perf_counter()
+            conn.execute(text(partition_statements(partitions)))
+            migration = time.perf_counter() - started
+            partitioned = measure(conn, rows, repeat, True)
+            print('{rows} users, {partitions} partitions, {repeat} runs, migration {seconds:.2f}s'.format(
+                rows=rows,
+                partitions=partitions,
+                repeat=repeat,
+                seconds=migration
+            ))
+            print('{name:>8} {plain:>12} {partitioned:>12} {scanned:>10}'.format(
+                name='query',
+                plain='plain ms',
+                partitioned='hash ms',
+                scanned='scanned'
+            ))
+            for name in ('id', 'email', 'page', 'insert'):
+                scanned = partitions_scanned(conn, QUERIES[name][1], rows) if name in QUERIES else 1
+                print('{name:>8} {plain:>12.3f} {partitioned:>12.3f} {scanned:>10}'.format(
+                    name=name,
+                    plain=plain[name],
+                    partitioned=partitioned[name],
+                    scanned=scanned
+                ))
+        finally:
+            conn.execute('DROP SCHEMA {schema} CASCADE'.format(schema=SCHEMA))
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
@@ -0,0 +1,91 @@
+# ezasdf-users/project/benchmarks/serialization.py
+""" Compares json and msgpack serialization of the listing and profile bodies.
+
+usage: python -m project.benchmarks.serialization [users] [repeat]
+"""
+
+
+import datetime
+import sys
+import timeit
+
+import msgpack
+from flask import Flask, json
+
+from project.api.utils import encode_msgpack
+
+
+def listing_body(users):
+    """ Builds a GET /users body with the given number of users.
+
+    :param users:
+    :return: dict
+    """
+
+    created_at = datetime.datetime(2018, 1, 1)
+    return {
+        'status': 'success',
+        'message': 'Users fetched.',
+        'data': {
+            'users': [
+                {
+                    'id': n,
+                    'username': 'user{n}'.format(n=n),
+                    'email': 'user{n}@email.com'.format(n=n),
+                    'active': True,
+                    'created_at': created_at + datetime.timedelta(seconds=n)
+                } for n in range(users)
+            ]
+        }
+    }
+
+
+def profile_body():
+    """ Builds a GET /auth/profile body.
+
+    :return: dict
+    """
+
+    return {
+        'status': 'success',
+        'message': "Fetched user@email.com's profile data.",
+        'data': listing_body(1)['data']['users'][0]
+    }
+
+
+def measure(name, body, repeat):
+    """ Times both encoders on the body and prints payload sizes.
+
+    :param name:
+    :param body:
+    :param repeat:
+    """
+
+    encoders = {
+        'json': lambda: json.dumps(body).encode(),
+        'msgpack': lambda: msgpack.packb(body, default=encode_msgpack, use_bin_type=True)
+    }
+    for encoder, encode in encoders.items():
+        seconds = min(timeit.repeat(encode, number=repeat, repeat=3)) / repeat
+        print('{name:<8} {encoder:<8} {size:>10} bytes {micros:>12.1f} us'.format(
+            name=name,
+            encoder=encoder,
+            size=len(encode()),
+            micros=seconds * 1e6
+        ))
+
+
+def main(users=10000, repeat=20):
+    """ Runs the benchmark.
+
+    :param users:
+    :param repeat:
+    """
+
+    with Flask(__name__).app_context():
+        measure('listing', listing_body(users), repeat)
+        measure('profile', profile_body(), repeat * 1000)
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
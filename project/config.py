@@ -2,6 +2,7 @@
 
 
 import os
+import tempfile
 
 
 class BaseConfig:
@@ -14,6 +15,87 @@ class BaseConfig:
     BCRYPT_LOG_ROUNDS = 13
     TOKEN_EXPIRATION_DAYS = 30
     TOKEN_EXPIRATION_SECONDS = 0
+    TOKEN_CLAIMS_MAX_AGE = 0
+    VERIFY_BATCH_MAX_TOKENS = 100
+    MAX_BODY_SIZE = 16 * 1024
+    VERIFY_BATCH_MAX_BODY_SIZE = MAX_BODY_SIZE + VERIFY_BATCH_MAX_TOKENS * (4096 + 4)
+    SQLALCHEMY_REPLICA_URIS = [uri for uri in os.getenv('DATABASE_REPLICA_URLS', '').split(',') if uri]
+    REPLICA_STICKY_SECONDS = 5
+    RATELIMIT_ENABLED = True
+    RATELIMIT_STORAGE_URL = os.getenv('RATELIMIT_STORAGE_URL', 'memory://')
+    RATELIMIT_SIGNIN_PER_EMAIL = (5, 60)
+    RATELIMIT_SIGNIN_PER_CLIENT = (30, 60)
+    TRUSTED_PROXY_COUNT = int(os.getenv('TRUSTED_PROXY_COUNT', 0))
+    HASH_CONCURRENCY = os.cpu_count() or 1
+    HASH_QUEUE_SIZE = 2 * HASH_CONCURRENCY
+    HASH_QUEUE_TIMEOUT = 0.5
+    HASH_RETRY_AFTER = 1
+    HASH_SLOTS_DIR = os.getenv('HASH_SLOTS_DIR', os.path.join(tempfile.gettempdir(), 'ezasdf_users_hashing'))
+    AVAILABILITY_CAPACITY = 100000
+    AVAILABILITY_ERROR_RATE = 0.01
+    AVAILABILITY_REFRESH_SECONDS = 5
+    AVAILABILITY_REBUILD_SECONDS = 300
+    AVAILABILITY_BACKGROUND_REBUILD = True
+    ACCESS_LOG_ENABLED = True
+    ACCESS_LOG_SAMPLE_RATES = {
+        'users.get_users_ping': 0.01,
+        'auth.get_available': 0.1
+    }
+    ACCESS_LOG_QUEUE_SIZE = 10000
+    TRACING_ENABLED = bool(os.getenv('TRACING_FILE'))
+    TRACING_SAMPLE_RATE = 1.0
+    TRACING_EXPORTER = 'project.api.tracing.NDJSONFileExporter'
+    TRACING_FILE = os.getenv('TRACING_FILE', 'traces.ndjson')
+    SLOW_QUERY_LOG_ENABLED = True
+    SLOW_QUERY_LOG = os.getenv('SLOW_QUERY_LOG', 'slow_queries.ndjson')
+    SLOW_QUERY_THRESHOLD_MS = 200
+    SLOW_QUERY_EXPLAIN = False
+    SLOW_QUERY_EXPLAIN_THRESHOLD_MS = 1000
+    SLOW_QUERY_EXPLAIN_QUEUE_SIZE = 100
+    SLOW_QUERY_EXPLAINED_MAX = 1000
+    COMPRESS_ENABLED = True
+    COMPRESS_MIMETYPES = ('application/json', 'application/msgpack', 'text/plain')
+    COMPRESS_MIN_SIZE = 1024
+    COMPRESS_LEVEL = 6
+    CHANGES_PAGE_SIZE = 100
+    CHANGES_MAX_PAGE_SIZE = 1000
+    BULK_MAX_IDS = 10000
+    BULK_MAX_BODY_SIZE = MAX_BODY_SIZE + BULK_MAX_IDS * len('-2147483648, ')
+    USERS_MAX_PAGE_SIZE = 1000
+    USERS_PARTITIONED = bool(os.getenv('USERS_PARTITIONED'))
+    EVENTS_SINK = os.getenv('EVENTS_SINK', 'project.api.outbox.FileSink')
+    EVENTS_FILE = os.getenv('EVENTS_FILE', 'events.ndjson')
+    EVENTS_WEBHOOK_URL = os.getenv('EVENTS_WEBHOOK_URL')
+    EVENTS_WEBHOOK_TIMEOUT = 5
+    EVENTS_BATCH_SIZE = 100
+    EVENTS_MAX_ATTEMPTS = 10
+    EVENTS_RETRY_SECONDS = 1
+    EVENTS_MAX_RETRY_SECONDS = 300
+    EVENTS_POLL_SECONDS = 1
+    ASYNC_POOL_MIN_SIZE = 2
+    ASYNC_POOL_MAX_SIZE = 20
+    JOBS_CONCURRENCY = 2
+    JOBS_NICE = 10
+    JOBS_POLL_SECONDS = 1
+    JOBS_MAX_ATTEMPTS = 3
+    JOBS_RETRY_SECONDS = 5
+    JOBS_MAX_RETRY_SECONDS = 300
+    JOBS_STALE_SECONDS = 300
+    JOBS_HEARTBEAT_SECONDS = 30
+    JOBS_IMPORT_CHUNK_SIZE = 100
+    JOBS_IMPORT_MAX_USERS = 100 * JOBS_IMPORT_CHUNK_SIZE
+    JOBS_MAX_BODY_SIZE = MAX_BODY_SIZE + JOBS_IMPORT_MAX_USERS * 512
+    EVENTS_RETENTION_DAYS = 7
+    PROFILING_ENABLED = True
+    PROFILE_DIR = os.getenv('PROFILE_DIR', os.path.join(tempfile.gettempdir(), 'ezasdf_users_profiles'))
+    PROFILE_MAX_FILES = 100
+    MEMORY_TRACE_ON_START = bool(os.getenv('MEMORY_TRACE_ON_START'))
+    MEMORY_TRACE_FRAMES = 10
+    MEMORY_MAX_SNAPSHOTS = 5
+    MEMORY_DIR = os.getenv('MEMORY_DIR')
+    MEMORY_REPORT_LIMIT = 20
+    COALESCING_ENABLED = True
+    COALESCING_TIMEOUT = 10
 
 
 class DevelopmentConfig(BaseConfig):
@@ -24,6 +106,12 @@ class DevelopmentConfig(BaseConfig):
     BCRYPT_LOG_ROUNDS = 4
 
 
+class EmbeddedConfig(DevelopmentConfig):
+    """ Development Configurations on an embedded SQLite database in WAL mode """
+
+    SQLALCHEMY_DATABASE_URI = os.getenv('EMBEDDED_DATABASE_URL', 'sqlite:///users.db')
+
+
 class StagingConfig(BaseConfig):
     """ Staging Configurations """
 
@@ -37,11 +125,28 @@ class TestingConfig(BaseConfig):
     DEBUG = True
     TESTING = True
     SQLALCHEMY_DATABASE_URI = os.getenv('DATABASE_TEST_URL')
+    SQLALCHEMY_REPLICA_URIS = []
+    RATELIMIT_STORAGE_URL = 'memory://'
+    TRUSTED_PROXY_COUNT = 0
+    ACCESS_LOG_ENABLED = False
+    TRACING_ENABLED = False
+    SLOW_QUERY_LOG_ENABLED = False
+    AVAILABILITY_BACKGROUND_REBUILD = False
+    EVENTS_SINK = 'project.api.outbox.QueueSink'
     BCRYPT_LOG_ROUNDS = 4
     TOKEN_EXPIRATION_DAYS = 0
     TOKEN_EXPIRATION_SECONDS = 3
 
 
+class EmbeddedTestingConfig(TestingConfig):
+    """ Testing Configurations on an embedded SQLite database in WAL mode """
+
+    SQLALCHEMY_DATABASE_URI = os.getenv(
+        'EMBEDDED_DATABASE_TEST_URL',
+        'sqlite:///' + os.path.join(tempfile.gettempdir(), 'ezasdf_users_test.db')
+    )
+
+
 class ProductionConfig(BaseConfig):
     """ Production Configurations """
 
@@ -0,0 +1,73 @@
+# ezasdf-users/project/proxy.py
+
+
+from werkzeug.contrib.fixers import ProxyFix
+
+
+def forwarded_address(forwarded_for, trusted):
+    """ Picks the client address seen by the outermost trusted proxy.
+    Hops further left were added by the client and cannot be trusted.
+
+    :param forwarded_for: X-Forwarded-For addresses, client first
+    :param trusted: number of proxies in front of the app
+    :return: str|None
+    """
+
+    forwarded_for = [address.strip() for address in forwarded_for if address.strip()]
+    if not trusted or len(forwarded_for) < trusted:
+        return None
+    return forwarded_for[-trusted]
+
+
+class TrustedProxyMiddleware(ProxyFix):
+    """ ProxyFix trusting the TRUSTED_PROXY_COUNT proxies in front of the app,
+    so request.remote_addr is the client rather than the load balancer.
+    Requests pass through untouched while TRUSTED_PROXY_COUNT is 0.
+    """
+
+    def __init__(self, wsgi_app, app):
+        """ __init__
+
+        :param wsgi_app: wrapped wsgi callable
+        :param app: Flask app, for its config
+        """
+
+        ProxyFix.__init__(self, wsgi_app)
+        self.flask_app = app
+
+    def __call__(self, environ, start_response):
+        if not self.flask_app.config.get('TRUSTED_PROXY_COUNT'):
+            return self.app(environ, start_response)
+        return ProxyFix.__call__(self, environ, start_response)
+
+    def get_remote_addr(self, forwarded_for):
+        """ Picks the client address from X-Forwarded-For.
+
+        :param forwarded_for:
+        :return: str|None
+        """
+
+        return forwarded_address(forwarded_for, self.flask_app.config.get('TRUSTED_PROXY_COUNT'))
+
+
+def trusted_environ(environ, app):
+    """ Applies the trusted proxy headers to an environ the middleware does not see,
+    like those of requests served natively by the async deployment.
+
+    :param environ:
+    :param app: Flask app, for its config
+    :return: environ
+    """
+
+    TrustedProxyMiddleware(lambda environ, start_response: None, app)(environ, None)
+    return environ
+
+
+def init_proxy_fix(app):
+    """ Wraps the app in the trusted proxy middleware.
+    It must wrap everything else, so every layer sees the client address.
+
+    :param app:
+    """
+
+    app.wsgi_app = TrustedProxyMiddleware(app.wsgi_app, app)
@@ -0,0 +1,134 @@
+# ezasdf-users/project/routing.py
+
+
+import itertools
+import time
+
+from flask import current_app, g, has_request_context, request
+from flask_sqlalchemy import SQLAlchemy, SignallingSession
+from sqlalchemy import create_engine, orm
+from sqlalchemy.sql.expression import UpdateBase
+
+
+READ_METHODS = ('GET', 'HEAD', 'OPTIONS')
+STICKY_COOKIE = 'db_primary_until'
+
+
+def mark_write():
+    """ Marks the current request as having written to the primary. """
+
+    if has_request_context():
+        g.db_wrote = True
+
+
+def use_replica():
+    """ Determine if the current request may read from a replica.
+
+    Only read-only requests that have not written anything and
+    whose client has not written within the sticky window are routed.
+
+    :return: boolean
+    """
+
+    if not has_request_context() or request.method not in READ_METHODS:
+        return False
+    if g.get('db_wrote'):
+        return False
+    try:
+        return float(request.cookies.get(STICKY_COOKIE)) <= time.time()
+    except (TypeError, ValueError):
+        return True
+
+
+def stick_to_primary(response):
+    """ After request hook
+    Pins a client that just wrote to the primary for REPLICA_STICKY_SECONDS
+    so it reads its own writes.
+
+    :param response:
+    :return: flask response
+    """
+
+    if g.get('db_wrote') and current_app.config.get('SQLALCHEMY_REPLICA_URIS'):
+        seconds = current_app.config.get('REPLICA_STICKY_SECONDS')
+        response.set_cookie(
+            STICKY_COOKIE,
+            str(time.time() + seconds),
+            max_age=seconds,
+            httponly=True
+        )
+    return response
+
+
+class RoutingSession(SignallingSession):
+    """ Session that sends reads of read-only requests to a replica
+    and everything else to the primary.
+    """
+
+    def __init__(self, db, **options):
+        """ __init__
+
+        :param db:
+        :param options:
+        """
+
+        self.db = db
+        self.routable = options.get('bind') is None
+        SignallingSession.__init__(self, db, **options)
+
+    def get_bind(self, mapper=None, clause=None):
+        """ Picks the engine for the given mapper or clause.
+
+        :param mapper:
+        :param clause:
+        :return: engine
+        """
+
+        primary = SignallingSession.get_bind(self, mapper, clause)
+        if self._flushing or isinstance(clause, UpdateBase):
+            mark_write()
+            return primary
+        if not self.routable or primary is not self.db.get_engine(self.app) or not use_replica():
+            return primary
+        return self.db.get_replica_engine(self.app) or primary
+
+
+class RoutingSQLAlchemy(SQLAlchemy):
+    """ Flask-SQLAlchemy with optional read replicas. """
+
+    def init_app(self, app):
+        """ Initializes the extension and the sticky cookie hook.
+
+        :param app:
+        """
+
+        app.config.setdefault('SQLALCHEMY_REPLICA_URIS', [])
+        app.config.setdefault('REPLICA_STICKY_SECONDS', 5)
+        SQLAlchemy.init_app(self, app)
+        app.after_request(stick_to_primary)
+
+    def create_session(self, options):
+        """ Creates the session factory with the routing session.
+
+        :param options:
+        :return: sessionmaker
+        """
+
+        return orm.sessionmaker(class_=RoutingSession, db=self, **options)
+
+    def get_replica_engine(self, app):
+        """ Round robins over the configured replica engines.
+
+        :param app:
+        :return: engine|None
+        """
+
+        uris = tuple(app.config.get('SQLALCHEMY_REPLICA_URIS') or ())
+        if not uris:
+            return None
+        replicas = app.extensions.setdefault('sqlalchemy_replicas', {})
+        if uris not in replicas:
+            with self._engine_lock:
+                if uris not in replicas:
+                    replicas[uris] = itertools.cycle([create_engine(uri) for uri in uris])
+        return next(replicas[uris])
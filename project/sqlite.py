@@ -0,0 +1,60 @@
+# ezasdf-users/project/sqlite.py
+
+
+import sqlite3
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+
+PRAGMAS = (
+    ('journal_mode', 'WAL'),
+    ('synchronous', 'NORMAL'),
+    ('busy_timeout', '5000')
+)
+
+
+def configure_connection(dbapi_connection, connection_record):
+    """ Puts new SQLite connections in WAL mode and hands transaction
+    control to SQLAlchemy, so BEGIN and SAVEPOINT behave as on postgres.
+
+    :param dbapi_connection:
+    :param connection_record:
+    """
+
+    if not isinstance(dbapi_connection, sqlite3.Connection):
+        return
+    dbapi_connection.isolation_level = None
+    cursor = dbapi_connection.cursor()
+    try:
+        for name, value in PRAGMAS:
+            cursor.execute('PRAGMA {name} = {value}'.format(name=name, value=value))
+    finally:
+        cursor.close()
+
+
+def begin_transaction(conn):
+    """ Emits the BEGIN that pysqlite would otherwise defer or skip.
+    The sqlite_begin execution option sets the mode, e.g. IMMEDIATE to
+    take the write lock up front instead of failing to upgrade a read.
+
+    :param conn:
+    """
+
+    if conn.dialect.name == 'sqlite':
+        conn.execute('BEGIN {mode}'.format(mode=conn._execution_options.get('sqlite_begin', '')).strip())
+
+
+def init_sqlite(app):
+    """ Registers the SQLite connection listeners on every engine.
+    They only act on SQLite connections.
+
+    :param app:
+    """
+
+    for name, listener in (
+        ('connect', configure_connection),
+        ('begin', begin_transaction)
+    ):
+        if not event.contains(Engine, name, listener):
+            event.listen(Engine, name, listener)
@@ -1,13 +1,27 @@
 # ezasdf-users/project/tests/base.py
 
 
+import json
+import os
+
 from flask_testing import TestCase
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
 
 from project import create_app, db
+from project.tests.utils import mint_jwt
 
 
 class BaseTestCase(TestCase):
-    """ Sets up the Base Test Case class for tests. """
+    """ Sets up the Base Test Case class for tests.
+
+    The schema is created once per process and every test runs inside
+    a transaction that is rolled back on teardown. The apps of a class
+    share their engines, so pooled connections are reused across its tests.
+    """
+
+    schema_created = False
+    connectors = None
 
     def create_app(self):
         """ Sets up app for testing configurations.
@@ -16,17 +30,116 @@ class BaseTestCase(TestCase):
         """
 
         app = create_app()
-        app.config.from_object('project.config.TestingConfig')
+        app.config.from_object(os.getenv('TEST_SETTINGS', 'project.config.TestingConfig'))
+        if self.connectors is None:
+            type(self).connectors = {}
+        app.extensions['sqlalchemy'].connectors = self.connectors
         return app
 
+    @classmethod
+    def tearDownClass(cls):
+        """ Closes the pooled connections of the class's engines. """
+
+        for connector in (cls.connectors or {}).values():
+            connector.get_engine().dispose()
+        cls.connectors = None
+        super().tearDownClass()
+
     def setUp(self):
-        """ Creates database. """
+        """ Creates database once and opens the test transaction. """
 
-        db.create_all()
-        db.session.commit()
+        self.create_schema()
+        self.app_session = db.session
+        self.connection = db.engine.connect()
+        self.transaction = self.connection.begin()
+        db.session = db.create_scoped_session(options={'bind': self.connection, 'binds': {}})
+        db.session.begin_nested()
+        event.listen(db.session(), 'after_transaction_end', self.restart_savepoint)
 
     def tearDown(self):
-        """ Removes database. """
+        """ Rolls back the test transaction. """
 
         db.session.remove()
-        db.drop_all()
+        db.session = self.app_session
+        self.transaction.rollback()
+        self.connection.close()
+
+    def send(self, method, url, user=None, body=None):
+        """ Sends a request, as user when given.
+
+        :param method:
+        :param url:
+        :param user:
+        :param body: json payload, or a str sent as is
+        :return: (response, data)
+        """
+
+        response = self.client.open(
+            url,
+            method=method,
+            data=body if body is None or isinstance(body, str) else json.dumps(body),
+            content_type='application/json',
+            headers={
+                'Authorization': 'Bearer ' + mint_jwt(user)
+            } if user is not None else {}
+        )
+        return response, json.loads(response.data.decode())
+
+    @staticmethod
+    def create_schema():
+        """ Recreates the schema once per process. """
+
+        if not BaseTestCase.schema_created:
+            db.drop_all()
+            db.create_all()
+            BaseTestCase.schema_created = True
+
+    @staticmethod
+    def restart_savepoint(session, transaction):
+        """ Reopens the savepoint after the code under test commits or rolls back.
+
+        :param session:
+        :param transaction:
+        """
+
+        if transaction.nested and not transaction._parent.nested:
+            session.expire_all()
+            session.begin_nested()
+
+
+class StatementCountingTestCase(BaseTestCase):
+    """ Records the statements each request runs once the worker has booted. """
+
+    def setUp(self):
+        """ Boots the worker and starts recording statements. """
+
+        super().setUp()
+        self.client.get('/users/ping')
+        self.statements = []
+        event.listen(Engine, 'before_cursor_execute', self.record_statement)
+
+    def tearDown(self):
+        """ Stops recording statements. """
+
+        event.remove(Engine, 'before_cursor_execute', self.record_statement)
+        super().tearDown()
+
+    def record_statement(self, conn, cursor, statement, parameters, context, executemany):
+        self.statements.append(statement)
+
+    def send(self, method, url, user=None, body=None):
+        """ Sends a request, recording only its statements.
+        The user's token is minted before recording starts,
+        so reloading an expired user is not counted.
+
+        :param method:
+        :param url:
+        :param user:
+        :param body:
+        :return: (response, data)
+        """
+
+        if user is not None:
+            mint_jwt(user)
+        del self.statements[:]
+        return super().send(method, url, user, body)
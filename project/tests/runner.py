@@ -0,0 +1,139 @@
+# ezasdf-users/project/tests/runner.py
+
+
+import os
+import subprocess
+import sys
+import unittest
+
+from sqlalchemy import create_engine, text
+from sqlalchemy.engine.url import make_url
+from werkzeug.utils import import_string
+
+
+def iter_test_classes(suite):
+    """ Yields the class id of every test in the suite.
+
+    :param suite:
+    :return: generator of str
+    """
+
+    for test in suite:
+        if isinstance(test, unittest.TestSuite):
+            yield from iter_test_classes(test)
+        else:
+            yield '{module}.{name}'.format(
+                module=type(test).__module__,
+                name=type(test).__name__
+            )
+
+
+def partition(class_ids, workers):
+    """ Splits the test classes into evenly loaded buckets.
+
+    :param class_ids:
+    :param workers:
+    :return: list of lists
+    """
+
+    counts = {}
+    for class_id in class_ids:
+        counts[class_id] = counts.get(class_id, 0) + 1
+    buckets = [[] for _ in range(workers)]
+    loads = [0] * workers
+    for class_id in sorted(counts, key=counts.get, reverse=True):
+        index = loads.index(min(loads))
+        buckets[index].append(class_id)
+        loads[index] += counts[class_id]
+    return [bucket for bucket in buckets if bucket]
+
+
+def worker_database_url(url, index):
+    """ Calculates the database url of the given worker.
+
+    :param url:
+    :param index:
+    :return: str
+    """
+
+    url = make_url(url)
+    if url.drivername.startswith('sqlite'):
+        if url.database:
+            root, ext = os.path.splitext(url.database)
+            url.database = '{root}_{index}{ext}'.format(root=root, index=index, ext=ext)
+    else:
+        url.database = '{database}_{index}'.format(database=url.database, index=index)
+    return str(url)
+
+
+def create_database(url):
+    """ Creates the worker's postgres database if it does not exist.
+
+    :param url:
+    """
+
+    url = make_url(url)
+    if not url.drivername.startswith('postgres'):
+        return
+    database = url.database
+    url.database = 'postgres'
+    engine = create_engine(url, isolation_level='AUTOCOMMIT')
+    try:
+        with engine.connect() as connection:
+            exists = connection.execute(
+                text('SELECT 1 FROM pg_database WHERE datname = :name'),
+                name=database
+            ).scalar()
+            if not exists:
+                connection.execute('CREATE DATABASE "{database}"'.format(database=database))
+    finally:
+        engine.dispose()
+
+
+def configured_database():
+    """ Fetches the database url of the test config in TEST_SETTINGS
+    and the environment variable the config reads it from.
+
+    :return: (str|None, str)
+    """
+
+    from project.config import EmbeddedTestingConfig
+
+    config = import_string(os.getenv('TEST_SETTINGS', 'project.config.TestingConfig'))
+    if issubclass(config, EmbeddedTestingConfig):
+        return config.SQLALCHEMY_DATABASE_URI, 'EMBEDDED_DATABASE_TEST_URL'
+    return config.SQLALCHEMY_DATABASE_URI, 'DATABASE_TEST_URL'
+
+
+def run_parallel(workers, start_dir='project/tests', pattern='test*.py'):
+    """ Runs the unit tests in worker processes with a database each.
+    Worker databases are derived from the active test config's database
+    and handed to the workers through the variable the config reads.
+
+    :param workers:
+    :param start_dir:
+    :param pattern:
+    :return: integer
+    """
+
+    database_url, variable = configured_database()
+    if not database_url:
+        sys.stderr.write('No test database configured, set {variable}.\n'.format(variable=variable))
+        return 1
+    suite = unittest.TestLoader().discover(start_dir, pattern=pattern, top_level_dir='.')
+    processes = []
+    for index, bucket in enumerate(partition(iter_test_classes(suite), workers)):
+        url = worker_database_url(database_url, index)
+        create_database(url)
+        processes.append(subprocess.Popen(
+            [sys.executable, '-m', 'unittest'] + bucket,
+            env=dict(os.environ, **{variable: url}),
+            stdout=subprocess.PIPE,
+            stderr=subprocess.STDOUT
+        ))
+    failed = False
+    for process in processes:
+        output, _ = process.communicate()
+        sys.stdout.write(output.decode())
+        failed = failed or process.returncode != 0
+    return 1 if failed else 0
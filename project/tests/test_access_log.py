@@ -0,0 +1,96 @@
+# ezasdf-users/project/tests/test_access_log.py
+
+
+import json
+import logging
+
+from project.api.access_log import JSONFormatter, get_listener
+from project.api.utils import add_user
+from project.tests.base import BaseTestCase
+from project.tests.utils import (
+    USERNAME,
+    EMAIL,
+    PASSWORD,
+    mint_jwt
+)
+
+
+class ListHandler(logging.Handler):
+    """ Collects formatted records. """
+
+    def __init__(self):
+        super().__init__()
+        self.setFormatter(JSONFormatter())
+        self.lines = []
+
+    def emit(self, record):
+        self.lines.append(self.format(record))
+
+
+class TestAccessLog(BaseTestCase):
+    """ Tests for the access log. """
+
+    def setUp(self):
+        """ Enables the access log and captures its output. """
+
+        super().setUp()
+        self.app.config['ACCESS_LOG_ENABLED'] = True
+        self.listener = get_listener(self.app.config['ACCESS_LOG_QUEUE_SIZE'])
+        self.handlers = self.listener.handlers
+        self.handler = ListHandler()
+        self.listener.handlers = (self.handler,)
+
+    def tearDown(self):
+        """ Restores the access log output. """
+
+        self.listener.handlers = self.handlers
+        super().tearDown()
+
+    def records(self):
+        """ Waits for the listener and parses the captured records.
+
+        :return: list of dicts
+        """
+
+        self.listener.queue.join()
+        return [json.loads(line) for line in self.handler.lines]
+
+    def test_logs_request(self):
+        """ Verify requests are logged with timing, queries and user id. """
+
+        user = add_user(USERNAME, EMAIL, PASSWORD)
+        with self.client:
+            self.client.get(
+                '/auth/profile',
+                headers={'Authorization': 'Bearer ' + mint_jwt(user)}
+            )
+        record, = self.records()
+        self.assertEqual(record['method'], 'GET')
+        self.assertEqual(record['route'], '/auth/profile')
+        self.assertEqual(record['status'], 200)
+        self.assertEqual(record['user_id'], user.id)
+        self.assertEqual(record['queries'], 1)
+        self.assertGreaterEqual(record['duration_ms'], record['db_ms'])
+
+    def test_samples_routes(self):
+        """ Verify sampled out successes are skipped and errors are kept. """
+
+        self.app.config['ACCESS_LOG_SAMPLE_RATES'] = {
+            'users.get_users_ping': 0,
+            'users.get_user_by_id': 0
+        }
+        with self.client:
+            self.client.get('/users/ping')
+            self.client.get('/users/999')
+        record, = self.records()
+        self.assertEqual(record['route'], '/users/<user_id>')
+        self.assertEqual(record['status'], 404)
+        self.assertEqual(record['sample_rate'], 0)
+
+    def test_disabled(self):
+        """ Verify nothing is logged when disabled. """
+
+        self.app.config['ACCESS_LOG_ENABLED'] = False
+        with self.client:
+            self.client.get('/users/ping')
+        self.assertEqual(self.records(), [])
@@ -0,0 +1,156 @@
+# ezasdf-users/project/tests/test_admission.py
+
+
+import json
+import shutil
+import tempfile
+import threading
+import unittest
+
+from project.api.admission import AdmissionLimiter, HostSlots, Overloaded
+from project.api.utils import add_user, add_admin
+from project.tests.base import BaseTestCase
+from project.tests.utils import (
+    USERNAME,
+    EMAIL,
+    PASSWORD,
+    mint_jwt
+)
+
+
+class TestAdmissionLimiter(unittest.TestCase):
+    """ Tests for the admission limiter. """
+
+    def test_rejects_when_queue_full(self):
+        """ Verify work is rejected once every slot and queue place is taken. """
+
+        limiter = AdmissionLimiter(1, 0, 1, retry_after=2)
+        limiter.acquire()
+        with self.assertRaises(Overloaded) as context:
+            limiter.acquire()
+        self.assertEqual(context.exception.retry_after, 2)
+        self.assertEqual(limiter.stats()['rejected'], 1)
+
+    def test_times_out_in_queue(self):
+        """ Verify queued work is rejected after the queue deadline. """
+
+        limiter = AdmissionLimiter(1, 1, 0.01)
+        limiter.acquire()
+        self.assertRaises(Overloaded, limiter.acquire)
+        stats = limiter.stats()
+        self.assertEqual(stats['timed_out'], 1)
+        self.assertEqual(stats['queue_depth'], 0)
+
+    def test_queued_work_runs_after_release(self):
+        """ Verify queued work is admitted when a slot frees up. """
+
+        limiter = AdmissionLimiter(1, 1, 5)
+        limiter.acquire()
+        waiter = threading.Thread(target=limiter.acquire)
+        waiter.start()
+        limiter.release()
+        waiter.join(5)
+        stats = limiter.stats()
+        self.assertEqual(stats['active'], 1)
+        self.assertEqual(stats['admitted'], 2)
+
+    def test_slot_releases_on_error(self):
+        """ Verify a slot is freed when its block raises. """
+
+        limiter = AdmissionLimiter(1, 0, 1)
+        with self.assertRaises(ValueError):
+            with limiter.slot():
+                raise ValueError
+        self.assertEqual(limiter.stats()['active'], 0)
+
+
+class TestHostSlots(unittest.TestCase):
+    """ Tests for the slots shared by every process on the host. """
+
+    def setUp(self):
+        """ Keeps the lock files in a scratch directory. """
+
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        """ Deletes the scratch directory. """
+
+        shutil.rmtree(self.directory)
+
+    def test_slots_shared_across_limiters(self):
+        """ Verify limiters of different processes share the host's slots. """
+
+        first = AdmissionLimiter(1, 0, 0.01, host_slots=HostSlots(self.directory, 1))
+        second = AdmissionLimiter(1, 0, 0.01, host_slots=HostSlots(self.directory, 1))
+        with first.slot():
+            with self.assertRaises(Overloaded):
+                with second.slot():
+                    pass
+        stats = second.stats()
+        self.assertEqual((stats['active'], stats['timed_out'], stats['host_slots']), (0, 1, 1))
+        with second.slot():
+            self.assertEqual(second.stats()['active'], 1)
+
+    def test_slots_not_shared_by_threads(self):
+        """ Verify threads of one process each need their own slot. """
+
+        slots = HostSlots(self.directory, 2)
+        fds = [slots.acquire(0), slots.acquire(0)]
+        self.assertNotIn(None, fds)
+        self.assertIsNone(slots.acquire(0))
+        slots.release(fds.pop())
+        fds.append(slots.acquire(0))
+        self.assertNotIn(None, fds)
+        for fd in fds:
+            slots.release(fd)
+
+
+class TestHashingAdmission(BaseTestCase):
+    """ Tests for password hashing admission control. """
+
+    def test_post_signup_overloaded(self):
+        """ Verify signups fail fast with 503 when hashing is saturated. """
+
+        admin = add_admin()
+        self.app.config['HASH_CONCURRENCY'] = 0
+        self.app.config['HASH_QUEUE_SIZE'] = 0
+        self.app.extensions.pop('hashing_limiter')
+        with self.client:
+            response = self.client.post(
+                '/auth/signup',
+                data=json.dumps({
+                    'username': USERNAME,
+                    'email': EMAIL,
+                    'password': PASSWORD
+                }),
+                content_type='application/json'
+            )
+            data = json.loads(response.data.decode())
+            self.assertEqual(data['status'], 'error')
+            self.assertEqual(data['message'], 'Server is busy. Try again later.')
+            self.assertEqual(response.status_code, 503)
+            self.assertEqual(response.headers['Retry-After'], '1')
+            self.assert200(self.client.get('/users/ping'))
+            response = self.client.get(
+                '/metrics',
+                headers={'Authorization': 'Bearer ' + mint_jwt(admin)}
+            )
+            data = json.loads(response.data.decode())
+            self.assertEqual(data['data']['hashing']['rejected'], 1)
+            self.assertEqual(data['data']['hashing']['queue_depth'], 0)
+
+    def test_get_metrics_requires_admin(self):
+        """ Verify only admins fetch the metrics. """
+
+        user = add_user(USERNAME, EMAIL, PASSWORD)
+        with self.client:
+            self.assertEqual(self.client.get('/metrics').status_code, 403)
+            response = self.client.get(
+                '/metrics',
+                headers={'Authorization': 'Bearer ' + mint_jwt(user)}
+            )
+            self.assert401(response)
+
+
+if __name__ == '__main__':
+    unittest.main()
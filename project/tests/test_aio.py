@@ -0,0 +1,367 @@
+# ezasdf-users/project/tests/test_aio.py
+
+
+import asyncio
+import gzip
+import itertools
+import json
+import os
+import time
+import unittest
+
+import msgpack
+
+from project import create_app, db
+from project.api.models import OutboxEvent, User
+from project.api.utils import add_user
+from project.routing import STICKY_COOKIE
+from project.tests.base import BaseTestCase
+from project.tests.utils import (
+    USERNAME,
+    USERNAME2,
+    EMAIL,
+    EMAIL2,
+    PASSWORD,
+    mint_jwt
+)
+
+try:
+    from starlette.applications import Starlette
+
+    from project.aio import AsyncAPI, asgi2, asyncpg_dsn, create_asgi_app
+except ImportError:
+    create_asgi_app = None
+
+
+class ASGIRequests:
+    """ Sends requests through the native app, self.asgi, and the Flask fallback, self.fallback,
+    on the event loop self.loop, and compares their answers.
+    """
+
+    COMPARED_HEADERS = ('content-type', 'content-encoding', 'vary', 'access-control-allow-origin')
+
+    def request(self, path, token=None, headers=(), app=None):
+        """ Sends one GET request through an ASGI app.
+
+        :param path:
+        :param token:
+        :param headers: extra (name, value) headers
+        :param app: ASGI 3 callable, defaults to the app under test
+        :return: (status, headers, body)
+        """
+
+        request_headers = [(name.lower().encode(), value.encode()) for name, value in headers]
+        if token:
+            request_headers.append((b'authorization', 'Bearer {token}'.format(token=token).encode()))
+        scope = {
+            'type': 'http',
+            'asgi': {'version': '3.0'},
+            'http_version': '1.1',
+            'method': 'GET',
+            'scheme': 'http',
+            'path': path,
+            'raw_path': path.encode(),
+            'query_string': b'',
+            'root_path': '',
+            'headers': request_headers,
+            'client': ('127.0.0.1', 50000),
+            'server': ('testserver', 80)
+        }
+        messages = [{'type': 'http.request', 'body': b'', 'more_body': False}]
+        sent = []
+
+        async def receive():
+            return messages.pop(0) if messages else {'type': 'http.disconnect'}
+
+        async def send(message):
+            sent.append(message)
+
+        self.loop.run_until_complete((app or self.asgi)(scope, receive, send))
+        response_headers = {k.decode().lower(): v.decode() for k, v in sent[0]['headers']}
+        body = b''.join(message.get('body', b'') for message in sent[1:])
+        if response_headers.get('content-encoding') == 'gzip':
+            body = gzip.decompress(body)
+        return sent[0]['status'], response_headers, body
+
+    def request_flask(self, path, token=None, headers=()):
+        """ Sends one GET request through the Flask fallback.
+
+        :param path:
+        :param token:
+        :param headers: extra (name, value) headers
+        :return: (status, headers, body)
+        """
+
+        return self.request(path, token, headers, app=self.fallback)
+
+    def assert_parity(self, token=None, headers=()):
+        """ Asserts the native profile route answers exactly as the Flask route.
+
+        :param token:
+        :param headers: extra (name, value) headers
+        :return: (status, headers, body) of the native route
+        """
+
+        native = self.request('/auth/profile', token, headers)
+        flask = self.request_flask('/auth/profile', token, headers)
+        self.assertEqual(native[0], flask[0])
+        self.assertEqual(native[2], flask[2])
+        for name in self.COMPARED_HEADERS:
+            self.assertEqual(native[1].get(name), flask[1].get(name), name)
+        return native
+
+
+class FakePool:
+    """ Stands in for an asyncpg pool, reading users from a dict of rows. """
+
+    def __init__(self):
+        """ __init__ """
+
+        self.rows = {}
+        self.reads = []
+
+    def acquire(self):
+        return self
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        return False
+
+    async def fetchrow(self, query, user_id):
+        self.reads.append(user_id)
+        return self.rows.get(user_id)
+
+
+class TestAioNative(ASGIRequests, BaseTestCase):
+    """ Tests for the native profile route on a stand-in pool.
+    They need no postgres, so they run against every test database.
+    """
+
+    def setUp(self):
+        """ Boots the worker in the test's thread
+        and serves its profile route natively from a stand-in pool.
+        """
+
+        if create_asgi_app is None:
+            self.skipTest('The async deployment requires starlette and asyncpg')
+        super().setUp()
+        self.client.get('/users/ping')
+        self.pool = FakePool()
+        api = AsyncAPI(self.app)
+        api.pool = self.pool
+        self.asgi = Starlette(routes=api.routes())
+        self.loop = asyncio.new_event_loop()
+
+    def tearDown(self):
+        """ Closes the event loop. """
+
+        self.loop.close()
+        super().tearDown()
+
+    def request_flask(self, path, token=None, headers=()):
+        """ Sends one GET request with the Flask test client.
+        SQLite connections are bound to their thread, so the Flask route
+        runs in the test's thread rather than the fallback's thread pool.
+
+        :param path:
+        :param token:
+        :param headers: extra (name, value) headers
+        :return: (status, headers, body)
+        """
+
+        headers = dict(headers)
+        if token:
+            headers['Authorization'] = 'Bearer {token}'.format(token=token)
+        response = self.client.get(path, headers=headers)
+        response_headers = {name.lower(): value for name, value in response.headers}
+        body = response.get_data()
+        if response_headers.get('content-encoding') == 'gzip':
+            body = gzip.decompress(body)
+        return response.status_code, response_headers, body
+
+    def add_row(self, user):
+        """ Copies a user into the stand-in pool.
+
+        :param user:
+        """
+
+        self.pool.rows[user.id] = {
+            'id': user.id,
+            'username': user.username,
+            'email': user.email,
+            'active': user.active,
+            'created_at': user.created_at
+        }
+
+    def test_profile_parity(self):
+        """ Verify the native route reads through the pool and answers as the Flask route. """
+
+        user = add_user(USERNAME, EMAIL, PASSWORD)
+        self.add_row(user)
+        token = mint_jwt(user)
+        status, headers, body = self.assert_parity(token)
+        self.assertEqual(status, 200)
+        self.assertEqual(json.loads(body.decode())['data']['id'], user.id)
+        status, headers, body = self.assert_parity(token, [('Accept', 'application/msgpack')])
+        self.assertEqual(msgpack.unpackb(body, raw=False)['data']['username'], USERNAME)
+        self.assertEqual(self.pool.reads, [user.id, user.id])
+
+    def test_profile_unauthorized_parity(self):
+        """ Verify missing, invalid and inactive tokens are rejected as by the Flask route. """
+
+        inactive = add_user(USERNAME2, EMAIL2, PASSWORD)
+        inactive.active = False
+        db.session.commit()
+        self.add_row(inactive)
+        self.assertEqual(self.assert_parity()[0], 403)
+        self.assertEqual(self.assert_parity('invalid')[0], 401)
+        self.assertEqual(self.assert_parity(mint_jwt(inactive))[0], 401)
+
+
+class TestAio(ASGIRequests, unittest.TestCase):
+    """ Tests for the async deployment.
+    asyncpg reads on its own connections, so the users are committed
+    once for the class and deleted afterwards. Only their ids are kept,
+    because fallback requests end the Flask session. The native profile
+    route is checked against the same route served by the Flask app.
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        """ Commits the test users and starts the ASGI app. """
+
+        if create_asgi_app is None:
+            raise unittest.SkipTest('The async deployment requires starlette and asyncpg')
+        cls.app = create_app()
+        cls.app.config.from_object(os.getenv('TEST_SETTINGS', 'project.config.TestingConfig'))
+        cls.context = cls.app.app_context()
+        cls.context.push()
+        if db.engine.dialect.name != 'postgresql':
+            cls.context.pop()
+            raise unittest.SkipTest('The async deployment requires postgres')
+        BaseTestCase.create_schema()
+        user = add_user(USERNAME, EMAIL, PASSWORD)
+        inactive = add_user(USERNAME2, EMAIL2, PASSWORD)
+        inactive.active = False
+        db.session.commit()
+        cls.user_id, cls.inactive_id = user.id, inactive.id
+        cls.token, cls.inactive_token = mint_jwt(user), mint_jwt(inactive)
+        cls.asgi = create_asgi_app(cls.app)
+        cls.fallback = create_asgi_app(cls.app, native=False)
+        cls.loop = asyncio.new_event_loop()
+        cls.loop.run_until_complete(cls.asgi.router.startup())
+
+    @classmethod
+    def tearDownClass(cls):
+        """ Stops the ASGI app and deletes the test users and their events. """
+
+        cls.loop.run_until_complete(cls.asgi.router.shutdown())
+        cls.loop.close()
+        ids = [cls.user_id, cls.inactive_id]
+        for user in User.query.filter(User.id.in_(ids)):
+            db.session.delete(user)
+        db.session.commit()
+        OutboxEvent.query.filter(OutboxEvent.user_id.in_(ids)).delete(synchronize_session=False)
+        db.session.commit()
+        db.session.remove()
+        cls.context.pop()
+
+    def test_asyncpg_dsn(self):
+        """ Verify the SQLAlchemy driver is stripped from the uri. """
+
+        self.assertEqual(
+            asyncpg_dsn('postgresql+psycopg2://postgres@localhost/users'),
+            'postgresql://postgres@localhost/users'
+        )
+
+    def test_asgi2(self):
+        """ Verify the ASGI 2 wrapper serves the same app. """
+
+        wrapped = asgi2(self.asgi)
+        status, headers, body = self.request('/users/ping', app=lambda *args: wrapped(args[0])(*args[1:]))
+        self.assertEqual(status, 200)
+        self.assertEqual(json.loads(body.decode())['message'], 'pong!')
+
+    def test_flask_fallback(self):
+        """ Verify other routes are served by the Flask app. """
+
+        status, headers, body = self.request('/users/stats')
+        self.assertEqual(status, 200)
+        self.assertEqual(json.loads(body.decode())['message'], 'User stats fetched.')
+        self.assertEqual(headers['access-control-allow-origin'], '*')
+
+    def test_profile_parity(self):
+        """ Verify the native profile route answers as the Flask route. """
+
+        status, headers, body = self.assert_parity(self.token)
+        self.assertEqual(status, 200)
+        data = json.loads(body.decode())
+        self.assertEqual(data['data']['id'], self.user_id)
+        self.assertEqual(data['data']['username'], USERNAME)
+
+    def test_profile_unauthorized_parity(self):
+        """ Verify missing, invalid and inactive tokens are rejected as by the Flask route. """
+
+        self.assertEqual(self.assert_parity()[0], 403)
+        self.assertEqual(self.assert_parity('invalid')[0], 401)
+        self.assertEqual(self.assert_parity(self.inactive_token)[0], 401)
+
+    def test_profile_msgpack_parity(self):
+        """ Verify msgpack is negotiated as by the Flask route. """
+
+        status, headers, body = self.assert_parity(self.token, [('Accept', 'application/msgpack')])
+        self.assertEqual(status, 200)
+        self.assertEqual(headers['content-type'], 'application/msgpack')
+        self.assertEqual(msgpack.unpackb(body, raw=False)['data']['email'], EMAIL)
+
+    def test_profile_gzip_parity(self):
+        """ Verify responses are compressed as by the Flask route. """
+
+        previous = self.app.config['COMPRESS_MIN_SIZE']
+        self.app.config['COMPRESS_MIN_SIZE'] = 0
+        try:
+            status, headers, body = self.assert_parity(self.token, [('Accept-Encoding', 'gzip')])
+        finally:
+            self.app.config['COMPRESS_MIN_SIZE'] = previous
+        self.assertEqual(status, 200)
+        self.assertEqual(headers['content-encoding'], 'gzip')
+
+    def test_profile_fresh_claims_parity(self):
+        """ Verify fresh claims of a missing user are rejected as by the Flask route. """
+
+        previous = self.app.config['TOKEN_CLAIMS_MAX_AGE']
+        self.app.config['TOKEN_CLAIMS_MAX_AGE'] = 60
+        try:
+            token = User.encode_jwt_claims(999999999, False, True).decode()
+            status, headers, body = self.assert_parity(token)
+            self.assertEqual(self.assert_parity(self.token)[0], 200)
+        finally:
+            self.app.config['TOKEN_CLAIMS_MAX_AGE'] = previous
+        self.assertEqual(status, 401)
+
+    def test_profile_profiled_by_flask(self):
+        """ Verify requests asking to be profiled are served by the Flask app. """
+
+        status, headers, body = self.request('/auth/profile', self.token, [('X-Profile', '1')])
+        self.assertEqual(status, 200)
+        self.assertEqual(json.loads(body.decode())['data']['id'], self.user_id)
+
+    def test_pick_pool(self):
+        """ Verify reads go to a replica unless the client is sticky to the primary. """
+
+        api = AsyncAPI(self.app)
+        api.pool, api.replicas = 'primary', itertools.cycle(['replica'])
+        with self.app.test_request_context('/auth/profile'):
+            self.assertEqual(api.pick_pool(), 'replica')
+        cookie = '{name}={until}'.format(name=STICKY_COOKIE, until=time.time() + 60)
+        with self.app.test_request_context('/auth/profile', headers={'Cookie': cookie}):
+            self.assertEqual(api.pick_pool(), 'primary')
+        api.replicas = None
+        with self.app.test_request_context('/auth/profile'):
+            self.assertEqual(api.pick_pool(), 'primary')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -2,17 +2,17 @@
 
 
 import json
-import time
 
 from project import db
-from project.api.utils import add_user, get_jwt
+from project.api.utils import add_user
 from project.tests.base import BaseTestCase
 from project.tests.utils import (
     USERNAME,
     USERNAME2,
     EMAIL,
     EMAIL2,
-    PASSWORD
+    PASSWORD,
+    mint_jwt
 )
 
 
@@ -215,7 +215,7 @@ class TestAuthBlueprint(BaseTestCase):
 
         user = add_user(USERNAME, EMAIL, PASSWORD)
         with self.client:
-            token = get_jwt(self.client, user.email)
+            token = mint_jwt(user)
             response = self.client.get(
                 '/auth/signout',
                 headers={'Authorization': 'Bearer ' + token}
@@ -243,9 +243,9 @@ class TestAuthBlueprint(BaseTestCase):
         """ Verify signing out a user with an expired token throws an error. """
 
         user = add_user(USERNAME, EMAIL, PASSWORD)
+        self.app.config['TOKEN_EXPIRATION_SECONDS'] = -1
         with self.client:
-            token = get_jwt(self.client, user.email)
-            time.sleep(4)
+            token = mint_jwt(user)
             response = self.client.get(
                 '/auth/signout',
                 headers={'Authorization': 'Bearer ' + token}
@@ -262,7 +262,7 @@ class TestAuthBlueprint(BaseTestCase):
         user.active = False
         db.session.commit()
         with self.client:
-            token = get_jwt(self.client, user.email)
+            token = mint_jwt(user)
             response = self.client.get(
                 '/auth/signout',
                 headers={'Authorization': 'Bearer ' + token}
@@ -277,7 +277,7 @@ class TestAuthBlueprint(BaseTestCase):
 
         user = add_user(USERNAME, EMAIL, PASSWORD)
         with self.client:
-            token = get_jwt(self.client, user.email)
+            token = mint_jwt(user)
             response = self.client.get(
                 '/auth/profile',
                 headers={'Authorization': 'Bearer ' + token}
@@ -312,7 +312,7 @@ class TestAuthBlueprint(BaseTestCase):
         user.active = False
         db.session.commit()
         with self.client:
-            token = get_jwt(self.client, user.email)
+            token = mint_jwt(user)
             response = self.client.get(
                 '/auth/profile',
                 headers={'Authorization': 'Bearer ' + token}
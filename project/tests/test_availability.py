@@ -0,0 +1,175 @@
+# ezasdf-users/project/tests/test_availability.py
+
+
+import json
+import threading
+import time
+import unittest
+
+from project.api.availability import AvailabilityIndex, BloomFilter, get_availability_index
+from project.api.utils import add_user
+from project.tests.base import BaseTestCase
+from project.tests.utils import (
+    USERNAME,
+    USERNAME2,
+    EMAIL,
+    EMAIL2,
+    PASSWORD
+)
+
+
+class TestBloomFilter(unittest.TestCase):
+    """ Tests for the Bloom filter. """
+
+    def test_added_values_are_members(self):
+        """ Verify the filter has no false negatives. """
+
+        bloom = BloomFilter(1000, 0.01)
+        values = ['user{n}'.format(n=n) for n in range(1000)]
+        for value in values:
+            bloom.add(value)
+        self.assertTrue(all(value in bloom for value in values))
+
+    def test_false_positive_rate(self):
+        """ Verify the false positive rate stays near the configured rate at capacity. """
+
+        bloom = BloomFilter(1000, 0.01)
+        for n in range(1000):
+            bloom.add('user{n}'.format(n=n))
+        false_positives = sum('other{n}'.format(n=n) in bloom for n in range(10000))
+        self.assertLess(false_positives, 300)
+
+
+class BlockingIndex(AvailabilityIndex):
+    """ Availability index whose scans wait for a release. """
+
+    def __init__(self, *args, **kwargs):
+        """ __init__ """
+
+        super().__init__(*args, **kwargs)
+        self.release = threading.Event()
+        self.scans = 0
+        self.pulls = 0
+
+    def scan(self):
+        """ Waits for the release, then returns a filter holding one username.
+
+        :return: (BloomFilter, largest id read)
+        """
+
+        self.scans += 1
+        self.release.wait(5)
+        bloom = BloomFilter(10, 0.01)
+        bloom.add('username:rebuilt')
+        return bloom, 0
+
+    def pull(self):
+        """ Counts the pull.
+
+        :return: list
+        """
+
+        self.pulls += 1
+        return []
+
+
+class TestAvailabilityRebuild(BaseTestCase):
+    """ Tests for refreshing and rebuilding the availability index. """
+
+    def test_refresh_once_per_interval(self):
+        """ Verify concurrent callers past the interval refresh once. """
+
+        index = BlockingIndex(10, 0.01, 60, 300)
+        index.filter = BloomFilter(10, 0.01)
+        index.built_at = time.time()
+        threads = [threading.Thread(target=index.refresh) for _ in range(5)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual((index.pulls, index.scans), (1, 0))
+
+    def test_rebuild_in_background(self):
+        """ Verify one rebuild runs off the request thread while the old filter serves. """
+
+        index = BlockingIndex(10, 0.01, 0, 300)
+        old = index.filter = BloomFilter(10, 0.01)
+        for _ in range(3):
+            index.refreshed_at = 0
+            index.refresh()
+        self.assertIs(index.filter, old)
+        self.assertTrue(index.stats()['rebuilding'])
+        index.release.set()
+        deadline = time.time() + 5
+        while index.rebuilding and time.time() < deadline:
+            time.sleep(0.001)
+        self.assertIn('username:rebuilt', index.filter)
+        self.assertEqual(index.scans, 1)
+
+    def test_available_before_first_build(self):
+        """ Verify values are checked against the database until the filter is built. """
+
+        add_user(USERNAME, EMAIL, PASSWORD)
+        index = BlockingIndex(10, 0.01, 0, 300)
+        self.assertFalse(index.available('username', USERNAME))
+        self.assertTrue(index.available('username', USERNAME2))
+        self.assertIsNone(index.filter)
+        self.assertEqual(index.stats()['lookups'], 0)
+        index.release.set()
+
+
+class TestAvailability(BaseTestCase):
+    """ Tests for the availability endpoint. """
+
+    def get_available(self, **params):
+        """ Checks availability.
+
+        :param params:
+        :return: (response, data)
+        """
+
+        response = self.client.get('/auth/available', query_string=params)
+        return response, json.loads(response.data.decode())
+
+    def test_get_available(self):
+        """ Verify unused usernames and emails are available without a lookup. """
+
+        add_user(USERNAME, EMAIL, PASSWORD)
+        with self.client:
+            response, data = self.get_available(username=USERNAME2, email=EMAIL2)
+            self.assertEqual(data['status'], 'success')
+            self.assertEqual(data['message'], 'Availability checked.')
+            self.assertEqual(data['data'], {'username': True, 'email': True})
+            self.assert200(response)
+            self.assertEqual(get_availability_index().lookups, 0)
+
+    def test_get_available_taken(self):
+        """ Verify existing usernames and emails are taken. """
+
+        add_user(USERNAME, EMAIL, PASSWORD)
+        with self.client:
+            response, data = self.get_available(username=USERNAME, email=EMAIL)
+            self.assertEqual(data['data'], {'username': False, 'email': False})
+            self.assert200(response)
+
+    def test_get_available_after_signup(self):
+        """ Verify users inserted after boot are taken. """
+
+        with self.client:
+            self.get_available(username=USERNAME)
+            add_user(USERNAME, EMAIL, PASSWORD)
+            response, data = self.get_available(username=USERNAME, email=EMAIL2)
+            self.assertEqual(data['data'], {'username': False, 'email': True})
+
+    def test_get_available_empty(self):
+        """ Verify a username or email is required. """
+
+        with self.client:
+            response, data = self.get_available()
+            self.assertEqual(data['status'], 'error')
+            self.assertEqual(data['message'], 'Invalid payload.')
+            self.assert400(response)
+
+
+if __name__ == '__main__':
+    unittest.main()
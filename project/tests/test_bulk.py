@@ -0,0 +1,137 @@
+# ezasdf-users/project/tests/test_bulk.py
+
+
+import datetime
+import unittest
+
+from project.api.models import OutboxEvent, User
+from project.api.utils import add_user, add_admin
+from project.tests.base import BaseTestCase
+from project.tests.utils import (
+    USERNAME,
+    USERNAME2,
+    EMAIL,
+    EMAIL2,
+    PASSWORD,
+    padded_json
+)
+
+
+class TestBulk(BaseTestCase):
+    """ Tests for bulk user changes. """
+
+    def test_patch_bulk_ids(self):
+        """ Verify listed users are changed in one request. """
+
+        admin = add_admin()
+        user = add_user(USERNAME, EMAIL, PASSWORD)
+        user2 = add_user(USERNAME2, EMAIL2, PASSWORD)
+        user_id, user2_id = user.id, user2.id
+        change_seq = user2.change_seq
+        with self.client:
+            response, data = self.send('PATCH', '/users/bulk', admin, {'ids': [user_id, user2_id], 'set': {'active': False}})
+            self.assertEqual(data['status'], 'success')
+            self.assertEqual(data['message'], '2 users updated.')
+            self.assertEqual(data['data']['ids'], [user_id, user2_id])
+            self.assert200(response)
+        users = User.query.filter(User.id.in_([user_id, user2_id])).order_by(User.id).all()
+        self.assertEqual([user.active for user in users], [False, False])
+        self.assertEqual([user.change_seq for user in users], [change_seq + 1, change_seq + 2])
+        events = OutboxEvent.query.filter_by(type='user.deactivated').order_by(OutboxEvent.id).all()
+        self.assertEqual([event.user_id for event in events], [user_id, user2_id])
+        self.assertFalse(events[0].to_json()['payload']['active'])
+        user3 = add_user('test3', 'test3@test.com', PASSWORD)
+        self.assertEqual(user3.change_seq, change_seq + 3)
+
+    def test_patch_bulk_skips_unchanged(self):
+        """ Verify users already in the requested state are not touched. """
+
+        admin = add_admin()
+        user = add_user(USERNAME, EMAIL, PASSWORD)
+        user_id, change_seq = user.id, user.change_seq
+        with self.client:
+            response, data = self.send('PATCH', '/users/bulk', admin, {'ids': [user_id], 'set': {'active': True}})
+            self.assertEqual(data['data']['ids'], [])
+            self.assert200(response)
+        self.assertEqual(User.query.get(user_id).change_seq, change_seq)
+
+    def test_patch_bulk_filter(self):
+        """ Verify users matching a filter are changed. """
+
+        admin = add_admin()
+        add_user(USERNAME, 'spam@spam.com', PASSWORD, datetime.datetime(2020, 1, 1, 12))
+        spammer = add_user(USERNAME2, 'more@SPAM.com', PASSWORD, datetime.datetime(2020, 1, 2, 12))
+        add_user('test3', EMAIL, PASSWORD, datetime.datetime(2020, 1, 2, 12))
+        spammer_id = spammer.id
+        with self.client:
+            response, data = self.send('PATCH', '/users/bulk', admin, {
+                'filter': {'email_domain': 'spam.com', 'created_after': '2020-01-02T00:00:00Z'},
+                'set': {'active': False}
+            })
+            self.assertEqual(data['data']['ids'], [spammer_id])
+            self.assert200(response)
+
+    def test_patch_bulk_promote(self):
+        """ Verify users can be promoted to admins. """
+
+        admin = add_admin()
+        user = add_user(USERNAME, EMAIL, PASSWORD)
+        user_id = user.id
+        with self.client:
+            response, data = self.send('PATCH', '/users/bulk', admin, {'ids': [user_id], 'set': {'admin': True}})
+            self.assertEqual(data['data']['ids'], [user_id])
+        self.assertTrue(User.query.get(user_id).admin)
+
+    def test_patch_bulk_not_admin(self):
+        """ Verify non admins cannot change users in bulk. """
+
+        user = add_user(USERNAME, EMAIL, PASSWORD)
+        with self.client:
+            response, data = self.send('PATCH', '/users/bulk', user, {'ids': [user.id], 'set': {'admin': True}})
+            self.assertEqual(data['status'], 'error')
+            self.assertEqual(data['message'], 'You do not have permission to do that.')
+            self.assert401(response)
+
+    def test_patch_bulk_invalid(self):
+        """ Verify malformed bulk requests are rejected. """
+
+        admin = add_admin()
+        with self.client:
+            for body in (
+                {'ids': [1]},
+                {'ids': [1], 'set': {}},
+                {'ids': [1], 'set': {'password': 'x'}},
+                {'ids': [1], 'set': {'active': 'no'}},
+                {'set': {'active': False}},
+                {'ids': [1], 'filter': {'admin': True}, 'set': {'active': False}},
+                {'ids': ['1'], 'set': {'active': False}},
+                {'ids': [], 'set': {'active': False}},
+                {'filter': {}, 'set': {'active': False}},
+                {'filter': {'email_domain': '%'}, 'set': {'active': False}},
+                {'filter': {'created_after': 'yesterday'}, 'set': {'active': False}},
+                {'filter': {'username': USERNAME}, 'set': {'active': False}}
+            ):
+                response, data = self.send('PATCH', '/users/bulk', admin, body)
+                self.assertEqual(data['message'], 'Invalid payload.', body)
+                self.assert400(response)
+
+    def test_patch_bulk_max_ids(self):
+        """ Verify BULK_MAX_IDS of the longest ids fit the body limit, and one more id is rejected. """
+
+        count = self.app.config['BULK_MAX_IDS']
+        admin = add_admin()
+        user = add_user(USERNAME, EMAIL, PASSWORD)
+        ids = [user.id] + [-2 ** 31 + n for n in range(count)]
+        body = {'ids': ids[:count], 'set': {'active': False}}
+        with self.client:
+            response, data = self.send(
+                'PATCH', '/users/bulk', admin, padded_json(body, self.app.config['BULK_MAX_BODY_SIZE'])
+            )
+            self.assert200(response)
+            self.assertEqual(data['data']['ids'], [user.id])
+            response, data = self.send('PATCH', '/users/bulk', admin, dict(body, ids=ids))
+            self.assert400(response)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,99 @@
+# ezasdf-users/project/tests/test_changes.py
+
+
+import json
+import unittest
+
+from project import db
+from project.api.utils import add_user
+from project.tests.base import BaseTestCase
+from project.tests.utils import (
+    USERNAME,
+    USERNAME2,
+    EMAIL,
+    EMAIL2,
+    PASSWORD
+)
+
+
+class TestChanges(BaseTestCase):
+    """ Tests for the user change feed. """
+
+    def get_changes(self, **params):
+        """ Fetches a page of changes.
+
+        :param params:
+        :return: (response, data)
+        """
+
+        response = self.client.get('/users/changes', query_string=params)
+        return response, json.loads(response.data.decode())
+
+    def test_created_at_per_insert(self):
+        """ Verify created_at and updated_at are stamped at insert. """
+
+        user = add_user(USERNAME, EMAIL, PASSWORD)
+        user2 = add_user(USERNAME2, EMAIL2, PASSWORD)
+        self.assertLessEqual(user.created_at, user2.created_at)
+        self.assertLessEqual(user.updated_at, user2.updated_at)
+        self.assertLess(user.change_seq, user2.change_seq)
+
+    def test_update_bumps_change_seq(self):
+        """ Verify modified users move to the end of the feed. """
+
+        user = add_user(USERNAME, EMAIL, PASSWORD)
+        user2 = add_user(USERNAME2, EMAIL2, PASSWORD)
+        change_seq, updated_at = user.change_seq, user.updated_at
+        user.active = False
+        db.session.commit()
+        self.assertGreater(user.change_seq, user2.change_seq)
+        self.assertGreater(user.change_seq, change_seq)
+        self.assertGreaterEqual(user.updated_at, updated_at)
+
+    def test_unmodified_user_keeps_change_seq(self):
+        """ Verify flushing an unchanged user does not bump its sequence. """
+
+        user = add_user(USERNAME, EMAIL, PASSWORD)
+        change_seq = user.change_seq
+        user.active = True
+        db.session.commit()
+        self.assertEqual(user.change_seq, change_seq)
+
+    def test_get_changes(self):
+        """ Verify the feed pages through changes since the cursor. """
+
+        user = add_user(USERNAME, EMAIL, PASSWORD)
+        add_user(USERNAME2, EMAIL2, PASSWORD)
+        with self.client:
+            response, data = self.get_changes(limit=1)
+            self.assertEqual(data['status'], 'success')
+            self.assertEqual(data['message'], 'Changes fetched.')
+            self.assertEqual([user['username'] for user in data['data']['users']], [USERNAME])
+            self.assertTrue(data['data']['has_more'])
+            self.assert200(response)
+            response, data = self.get_changes(since=data['data']['cursor'], limit=1)
+            self.assertEqual([user['username'] for user in data['data']['users']], [USERNAME2])
+            self.assertFalse(data['data']['has_more'])
+            cursor = data['data']['cursor']
+            user.active = False
+            db.session.commit()
+            response, data = self.get_changes(since=cursor)
+            self.assertEqual([user['username'] for user in data['data']['users']], [USERNAME])
+            self.assertFalse(data['data']['users'][0]['active'])
+            response, data = self.get_changes(since=data['data']['cursor'])
+            self.assertEqual(data['data']['users'], [])
+            self.assertEqual(data['data']['cursor'], str(user.change_seq))
+
+    def test_get_changes_invalid_cursor(self):
+        """ Verify malformed cursors and limits are rejected. """
+
+        with self.client:
+            for params in ({'since': 'abc'}, {'since': -1}, {'limit': 0}):
+                response, data = self.get_changes(**params)
+                self.assertEqual(data['status'], 'error')
+                self.assertEqual(data['message'], 'Invalid payload.')
+                self.assert400(response)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,236 @@
+# ezasdf-users/project/tests/test_coalescing.py
+
+
+import json
+import threading
+import time
+import unittest
+
+from project.api.coalescing import SingleFlight, coalesce, get_single_flight
+from project.api.utils import add_user, add_admin, success_response
+from project.routing import STICKY_COOKIE, use_replica
+from project.tests.base import BaseTestCase
+from project.tests.utils import (
+    USERNAME,
+    EMAIL,
+    PASSWORD,
+    mint_jwt
+)
+
+
+def wait_for(condition, timeout=5):
+    """ Polls until condition holds.
+
+    :param condition: callable
+    :param timeout: seconds
+    :return: boolean
+    """
+
+    deadline = time.time() + timeout
+    while not condition():
+        if time.time() > deadline:
+            return False
+        time.sleep(0.001)
+    return True
+
+
+class TestSingleFlight(unittest.TestCase):
+    """ Tests for the single flight group. """
+
+    def setUp(self):
+        """ Holds the computation until released. """
+
+        self.release = threading.Event()
+        self.calls = 0
+
+    def compute(self):
+        """ Counts the call and waits for the release.
+
+        :return: a new object
+        """
+
+        self.calls += 1
+        self.release.wait()
+        return object()
+
+    def run_concurrently(self, group, f, callers):
+        """ Calls f through the group from several threads while the first call is held.
+
+        :param group:
+        :param f:
+        :param callers:
+        :return: list of results or raised exceptions
+        """
+
+        results = [None] * callers
+
+        def call(index):
+            try:
+                results[index] = group.do('key', f)
+            except Exception as e:
+                results[index] = e
+
+        threads = [threading.Thread(target=call, args=(index,)) for index in range(callers)]
+        for thread in threads:
+            thread.start()
+        self.assertTrue(wait_for(lambda: group.stats()['waiting'] == callers - 1))
+        self.release.set()
+        for thread in threads:
+            thread.join()
+        return results
+
+    def test_waiters_share_result(self):
+        """ Verify concurrent identical calls run once and share the result. """
+
+        group = SingleFlight(5)
+        results = self.run_concurrently(group, self.compute, 5)
+        self.assertEqual(self.calls, 1)
+        self.assertTrue(all(result is results[0] for result in results))
+        stats = group.stats()
+        self.assertEqual((stats['leaders'], stats['coalesced'], stats['max_waiters']), (1, 4, 4))
+        self.assertEqual((stats['in_flight'], stats['waiting']), (0, 0))
+
+    def test_waiters_share_error(self):
+        """ Verify waiters see the error of the call they waited on. """
+
+        def fail():
+            self.compute()
+            raise RuntimeError('boom')
+
+        group = SingleFlight(5)
+        results = self.run_concurrently(group, fail, 3)
+        self.assertEqual(self.calls, 1)
+        self.assertTrue(all(isinstance(result, RuntimeError) for result in results))
+        self.assertEqual(group.stats()['errors'], 1)
+
+    def test_finished_calls_are_not_kept(self):
+        """ Verify sequential calls each run. """
+
+        group = SingleFlight(5)
+        self.release.set()
+        group.do('key', self.compute)
+        group.do('key', self.compute)
+        self.assertEqual(self.calls, 2)
+        self.assertEqual(group.stats()['coalesced'], 0)
+
+    def test_waiter_timeout(self):
+        """ Verify a waiter computes on its own once its wait times out. """
+
+        group = SingleFlight(0.01)
+        leader = threading.Thread(target=group.do, args=('key', self.compute))
+        leader.start()
+        self.assertTrue(wait_for(lambda: self.calls == 1))
+        result = group.do('key', lambda: 'own')
+        self.release.set()
+        leader.join()
+        self.assertEqual(result, 'own')
+        self.assertEqual(group.stats()['timed_out'], 1)
+
+
+class TestCoalesce(BaseTestCase):
+    """ Tests for coalescing read handlers. """
+
+    def test_coalesce_across_threads(self):
+        """ Verify identical concurrent requests in different threads share one response. """
+
+        release = threading.Event()
+        calls = []
+
+        @coalesce
+        def view():
+            calls.append(threading.get_ident())
+            release.wait()
+            return success_response('Fetched.', data={'calls': len(calls)}), 200, {'X-Total-Count': '7'}
+
+        responses = {}
+
+        def request(url, name):
+            with self.app.test_request_context(url):
+                responses[name] = view()
+
+        threads = [
+            threading.Thread(target=request, args=('/users?limit=1&count=exact', n))
+            for n in range(3)
+        ] + [
+            threading.Thread(target=request, args=('/users?count=exact&limit=1', 3)),
+            threading.Thread(target=request, args=('/users?limit=2', 4))
+        ]
+        for thread in threads:
+            thread.start()
+        self.assertTrue(wait_for(lambda: get_single_flight().stats()['waiting'] == 3))
+        release.set()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len(set(calls)), 2)
+        bodies = [json.loads(responses[n].get_data().decode()) for n in range(4)]
+        self.assertTrue(all(body == bodies[0] for body in bodies))
+        self.assertEqual(responses[0].headers['X-Total-Count'], '7')
+        self.assertIsNot(responses[0], responses[1])
+
+    def test_sticky_requests_not_coalesced_with_replica_reads(self):
+        """ Verify a request pinned to the primary does not share a replica read's response. """
+
+        release = threading.Event()
+        calls = []
+
+        @coalesce
+        def view():
+            replica = use_replica()
+            calls.append(replica)
+            release.wait()
+            return success_response('Fetched.', data={'replica': replica}), 200
+
+        responses = {}
+
+        def request(name, headers):
+            with self.app.test_request_context('/users', headers=headers):
+                responses[name] = view()
+
+        cookie = '{name}={until}'.format(name=STICKY_COOKIE, until=time.time() + 60)
+        threads = [
+            threading.Thread(target=request, args=('replica', {})),
+            threading.Thread(target=request, args=('primary', {'Cookie': cookie}))
+        ]
+        for thread in threads:
+            thread.start()
+        try:
+            self.assertTrue(wait_for(lambda: len(calls) == 2))
+        finally:
+            release.set()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(sorted(calls), [False, True])
+        self.assertTrue(json.loads(responses['replica'].get_data().decode())['data']['replica'])
+        self.assertFalse(json.loads(responses['primary'].get_data().decode())['data']['replica'])
+
+    def test_get_user_by_id(self):
+        """ Verify coalesced handlers still answer normally. """
+
+        user = add_user(USERNAME, EMAIL, PASSWORD)
+        admin = add_admin()
+        leaders = get_single_flight().stats()['leaders']
+        with self.client:
+            response = self.client.get('/users/{user_id}'.format(user_id=user.id))
+            data = json.loads(response.data.decode())
+            self.assertEqual(data['data']['username'], USERNAME)
+            self.assertEqual(response.content_type, 'application/json')
+            self.assert200(response)
+            response = self.client.get(
+                '/metrics',
+                headers={'Authorization': 'Bearer ' + mint_jwt(admin)}
+            )
+            data = json.loads(response.data.decode())
+            self.assertEqual(data['data']['coalescing']['leaders'], leaders + 1)
+
+    def test_disabled(self):
+        """ Verify handlers run directly when coalescing is disabled. """
+
+        self.app.config['COALESCING_ENABLED'] = False
+        leaders = get_single_flight().stats()['leaders']
+        with self.client:
+            self.assert200(self.client.get('/users'))
+        self.assertEqual(get_single_flight().stats()['leaders'], leaders)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,76 @@
+# ezasdf-users/project/tests/test_compression.py
+
+
+import gzip
+import json
+import zlib
+
+from flask import Response
+
+from project.api.utils import success_response
+from project.tests.base import BaseTestCase
+
+
+ROWS = 500
+
+
+class TestCompression(BaseTestCase):
+    """ Tests for response compression. """
+
+    def setUp(self):
+        """ Adds large buffered and streamed routes. """
+
+        super().setUp()
+
+        @self.app.route('/buffered')
+        def buffered():
+            return success_response('Rows.', data={'rows': ['row {n}'.format(n=n) for n in range(ROWS)]}), 200
+
+        @self.app.route('/streamed')
+        def streamed():
+            return Response(('row {n}\n'.format(n=n) for n in range(ROWS)), mimetype='text/plain')
+
+    def test_gzip_buffered(self):
+        """ Verify large buffered bodies are gzipped. """
+
+        with self.client:
+            response = self.client.get('/buffered', headers={'Accept-Encoding': 'gzip, deflate'})
+            self.assertEqual(response.headers['Content-Encoding'], 'gzip')
+            self.assertIn('Accept-Encoding', response.headers['Vary'])
+            self.assertEqual(int(response.headers['Content-Length']), len(response.data))
+            data = json.loads(gzip.decompress(response.data).decode())
+            self.assertEqual(len(data['data']['rows']), ROWS)
+
+    def test_deflate_preferred(self):
+        """ Verify the client's preferred encoding is used. """
+
+        with self.client:
+            response = self.client.get('/buffered', headers={'Accept-Encoding': 'gzip;q=0.5, deflate'})
+            self.assertEqual(response.headers['Content-Encoding'], 'deflate')
+            self.assertIn(b'row 499', zlib.decompress(response.data))
+
+    def test_gzip_streamed(self):
+        """ Verify streamed bodies are compressed incrementally. """
+
+        with self.client:
+            response = self.client.get('/streamed', headers={'Accept-Encoding': 'gzip'})
+            self.assertEqual(response.headers['Content-Encoding'], 'gzip')
+            self.assertNotIn('Content-Length', response.headers)
+            body = gzip.decompress(response.data).decode()
+            self.assertEqual(body.count('\n'), ROWS)
+
+    def test_small_body_not_compressed(self):
+        """ Verify bodies under the minimum size are sent as is. """
+
+        with self.client:
+            response = self.client.get('/users/ping', headers={'Accept-Encoding': 'gzip'})
+            self.assertNotIn('Content-Encoding', response.headers)
+            self.assertEqual(json.loads(response.data.decode())['message'], 'pong!')
+
+    def test_not_accepted(self):
+        """ Verify clients that do not accept compression get plain bodies. """
+
+        with self.client:
+            response = self.client.get('/buffered')
+            self.assertNotIn('Content-Encoding', response.headers)
+            self.assertEqual(len(json.loads(response.data.decode())['data']['rows']), ROWS)
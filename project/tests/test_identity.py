@@ -0,0 +1,185 @@
+# ezasdf-users/project/tests/test_identity.py
+
+
+import json
+import unittest
+
+from project import db
+from project.api.models import User
+from project.api.utils import add_user, add_admin, is_admin
+from project.tests.base import StatementCountingTestCase
+from project.tests.utils import (
+    USERNAME,
+    USERNAME2,
+    EMAIL,
+    EMAIL2,
+    PASSWORD,
+    mint_jwt
+)
+
+
+class TestIdentity(StatementCountingTestCase):
+    """ Tests for the request scoped identity and token claims. """
+
+    def test_claims(self):
+        """ Verify tokens carry the admin and active claims. """
+
+        admin = add_admin()
+        claims = User.decode_jwt_claims(admin.encode_jwt(admin.id))
+        self.assertEqual((claims['sub'], claims['admin'], claims['active']), (admin.id, True, True))
+
+    def test_profile_loads_user_once(self):
+        """ Verify protected endpoints load the user once. """
+
+        user = add_user(USERNAME, EMAIL, PASSWORD)
+        with self.client:
+            response, data = self.send('GET', '/auth/profile', user)
+            self.assertEqual(data['data']['username'], USERNAME)
+            self.assertEqual(len(self.statements), 1)
+            response, data = self.send('GET', '/auth/signout', user)
+            self.assert200(response)
+            self.assertEqual(len(self.statements), 1)
+
+    def test_admin_check_reuses_user(self):
+        """ Verify the admin check reuses the authenticated user. """
+
+        admin = add_admin()
+        with self.client:
+            response, data = self.send('PATCH', '/users/bulk', admin, {'set': {}})
+            self.assert400(response)
+            self.assertEqual(len(self.statements), 1)
+
+    def test_fresh_claims_skip_lookup(self):
+        """ Verify fresh claims satisfy the active and admin checks without a query. """
+
+        self.app.config['TOKEN_CLAIMS_MAX_AGE'] = 60
+        admin = add_admin()
+        user = add_user(USERNAME, EMAIL, PASSWORD)
+        with self.client:
+            response, data = self.send('PATCH', '/users/bulk', admin, {'set': {}})
+            self.assert400(response)
+            self.assertEqual(len(self.statements), 0)
+            response, data = self.send('PATCH', '/users/bulk', user, {'set': {}})
+            self.assertEqual(data['message'], 'You do not have permission to do that.')
+            self.assertEqual(len(self.statements), 0)
+            response, data = self.send('GET', '/auth/profile', user)
+            self.assert200(response)
+            self.assertEqual(len(self.statements), 1)
+
+    def test_fresh_claims_of_deleted_user(self):
+        """ Verify a deleted user's fresh token is rejected rather than failing. """
+
+        self.app.config['TOKEN_CLAIMS_MAX_AGE'] = 60
+        user = add_user(USERNAME, EMAIL, PASSWORD)
+        token = mint_jwt(user)
+        user_id = user.id
+        db.session.delete(user)
+        db.session.commit()
+        with self.client:
+            for url in ('/auth/profile', '/auth/signout'):
+                response = self.client.get(
+                    url,
+                    headers={
+                        'Authorization': 'Bearer ' + token
+                    }
+                )
+                data = json.loads(response.data.decode())
+                self.assertEqual(data['status'], 'error')
+                self.assertEqual(data['message'], 'Something went wrong. Please contact us.')
+                self.assert401(response)
+            with self.app.test_request_context():
+                self.assertFalse(is_admin(user_id))
+
+    def test_stale_claims_are_checked(self):
+        """ Verify claims are ignored without a staleness bound. """
+
+        user = add_user(USERNAME, EMAIL, PASSWORD)
+        token = mint_jwt(user)
+        user.active = False
+        db.session.commit()
+        with self.client:
+            response = self.client.get(
+                '/auth/profile',
+                headers={
+                    'Authorization': 'Bearer ' + token
+                }
+            )
+            data = json.loads(response.data.decode())
+            self.assertEqual(data['message'], 'Something went wrong. Please contact us.')
+            self.assert401(response)
+
+    def verify_batch(self, tokens):
+        """ Verifies tokens in one batch.
+
+        :param tokens:
+        :return: (response, data)
+        """
+
+        return self.send('POST', '/auth/verify-batch', body={'tokens': tokens})
+
+    def test_verify_batch(self):
+        """ Verify a batch resolves every referenced user with one query. """
+
+        admin = add_admin()
+        user = add_user(USERNAME, EMAIL, PASSWORD)
+        inactive = add_user(USERNAME2, EMAIL2, PASSWORD)
+        inactive.active = False
+        db.session.commit()
+        tokens = [mint_jwt(admin), mint_jwt(user), mint_jwt(inactive), 'invalid', mint_jwt(user)]
+        with self.client:
+            response, data = self.verify_batch(tokens)
+            self.assert200(response)
+            self.assertEqual(data['message'], 'Tokens verified.')
+            self.assertEqual(len(self.statements), 1)
+            results = data['data']['results']
+            self.assertEqual([result['valid'] for result in results], [True, True, False, False, True])
+            self.assertEqual([result['sub'] for result in results], [admin.id, user.id, inactive.id, None, user.id])
+            self.assertEqual([result['admin'] for result in results], [True, False, False, None, False])
+            self.assertFalse(results[2]['active'])
+            self.assertEqual(results[3]['error'], 'Invalid token. Signin again.')
+            self.assertEqual(results[0]['exp'], User.decode_jwt_claims(tokens[0])['exp'])
+
+    def test_verify_batch_full(self):
+        """ Verify a batch of VERIFY_BATCH_MAX_TOKENS tokens is verified in one request. """
+
+        count = self.app.config['VERIFY_BATCH_MAX_TOKENS']
+        user = add_user(USERNAME, EMAIL, PASSWORD)
+        with self.client:
+            response, data = self.verify_batch([mint_jwt(user)] * count)
+            self.assert200(response)
+            self.assertEqual(len(self.statements), 1)
+            self.assertEqual([result['valid'] for result in data['data']['results']], [True] * count)
+            response, data = self.verify_batch(['x' * 4096] * count)
+            self.assert200(response)
+            self.assertEqual(len(data['data']['results']), count)
+            response, data = self.verify_batch([mint_jwt(user)] * (count + 1))
+            self.assert400(response)
+
+    def test_verify_batch_fresh_claims(self):
+        """ Verify fresh claims are answered without a query. """
+
+        self.app.config['TOKEN_CLAIMS_MAX_AGE'] = 60
+        user = add_user(USERNAME, EMAIL, PASSWORD)
+        with self.client:
+            response, data = self.verify_batch([mint_jwt(user), 'invalid'])
+            self.assertEqual([result['valid'] for result in data['data']['results']], [True, False])
+            self.assertEqual(len(self.statements), 0)
+
+    def test_verify_batch_invalid(self):
+        """ Verify empty, oversized and malformed batches are rejected. """
+
+        self.app.config['VERIFY_BATCH_MAX_TOKENS'] = 2
+        with self.client:
+            for tokens, error in (
+                ([], 'Must be at least 1 items.'),
+                (['a', 'b', 'c'], 'Must be at most 2 tokens.'),
+                (['a', 1], 'Item 1: Must be a str.'),
+                ('a', 'Must be a list.')
+            ):
+                response, data = self.verify_batch(tokens)
+                self.assert400(response)
+                self.assertEqual(data['errors'], {'tokens': error})
+
+
+if __name__ == '__main__':
+    unittest.main()
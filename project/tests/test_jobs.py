@@ -0,0 +1,241 @@
+# ezasdf-users/project/tests/test_jobs.py
+
+
+import datetime
+import json
+import unittest
+
+from project import db
+from project.api.jobs import JOB_TYPES, enqueue_job, register_job, run_next_job
+from project.api.models import Job, OutboxEvent, User
+from project.api.utils import add_user, add_admin
+from project.tests.base import BaseTestCase
+from project.tests.utils import (
+    USERNAME,
+    EMAIL,
+    PASSWORD,
+    padded_json
+)
+
+
+class TestJobs(BaseTestCase):
+    """ Tests for the background job queue. """
+
+    def tearDown(self):
+        """ Unregisters the job types added by tests. """
+
+        for name in [name for name in JOB_TYPES if name.startswith('test_')]:
+            del JOB_TYPES[name]
+        super().tearDown()
+
+    def test_post_jobs(self):
+        """ Verify admins can queue jobs and fetch their status. """
+
+        admin = add_admin()
+        with self.client:
+            response, data = self.send('POST', '/jobs', admin, {'type': 'refresh_user_stats'})
+            self.assertEqual(response.status_code, 202)
+            self.assertEqual(data['data']['status'], 'queued')
+            self.assertEqual(data['data']['created_by'], admin.id)
+            job_id = data['data']['id']
+            self.assertEqual(data['message'], 'Job {job_id} queued.'.format(job_id=job_id))
+            run_next_job()
+            response, data = self.send('GET', '/jobs/{job_id}'.format(job_id=job_id), admin)
+            self.assert200(response)
+            self.assertEqual(data['data']['status'], 'succeeded')
+            self.assertEqual(data['data']['result']['total'], 1)
+            self.assertEqual(data['data']['attempts'], 1)
+
+    def test_post_jobs_invalid(self):
+        """ Verify unknown job types and bad payloads are rejected. """
+
+        admin = add_admin()
+        with self.client:
+            for body in (
+                {'type': 'unknown'},
+                {'type': 'import_users', 'payload': []},
+                {'type': 'import_users', 'max_attempts': 0}
+            ):
+                response, data = self.send('POST', '/jobs', admin, body)
+                self.assert400(response)
+            response, data = self.send('GET', '/jobs/999999', admin)
+            self.assert404(response)
+            self.assertEqual(data['message'], 'Job does not exist.')
+
+    def test_post_largest_import(self):
+        """ Verify an import of JOBS_IMPORT_MAX_USERS users of the longest fields is queued. """
+
+        count = self.app.config['JOBS_IMPORT_MAX_USERS']
+        size = self.app.config['JOBS_MAX_BODY_SIZE']
+        users = [
+            {
+                'username': 'u' + str(n).zfill(127),
+                'email': str(n).zfill(118) + '@email.com',
+                'password': 'p' * 128
+            } for n in range(count + 1)
+        ]
+        admin = add_admin()
+        with self.client:
+            body = {'type': 'import_users', 'payload': {'users': users[:count]}}
+            response, data = self.send('POST', '/jobs', admin, padded_json(body, size))
+            self.assertEqual(response.status_code, 202)
+            self.assertEqual(len(json.loads(Job.query.get(data['data']['id']).payload)['users']), count)
+            response, data = self.send('POST', '/jobs', admin, padded_json(body, size + 1))
+            self.assertEqual(response.status_code, 413)
+            body['payload']['users'] = users
+            response, data = self.send('POST', '/jobs', admin, body)
+            self.assert400(response)
+            self.assertEqual(data['errors'], {'users': 'Must be at most {count} users.'.format(count=count)})
+
+    def test_jobs_require_admin(self):
+        """ Verify users who are not admins cannot queue or view jobs. """
+
+        user = add_user(USERNAME, EMAIL, PASSWORD)
+        job = enqueue_job('refresh_user_stats', {})
+        with self.client:
+            response, data = self.send('POST', '/jobs', user, {'type': 'refresh_user_stats'})
+            self.assertEqual(data['message'], 'You do not have permission to do that.')
+            self.assert401(response)
+            response, data = self.send('GET', '/jobs/{job_id}'.format(job_id=job.id), user)
+            self.assert401(response)
+
+    def test_import_users(self):
+        """ Verify imports add new users and report skipped and invalid ones. """
+
+        self.app.config['JOBS_IMPORT_CHUNK_SIZE'] = 2
+        add_user(USERNAME, EMAIL, PASSWORD)
+        job = enqueue_job('import_users', {'users': [
+            {'username': 'new', 'email': 'new@email.com', 'password': PASSWORD},
+            {'username': USERNAME, 'email': 'other@email.com', 'password': PASSWORD},
+            {'username': 'bad', 'email': 'bad', 'password': PASSWORD},
+            {'username': 'new2', 'email': 'new2@email.com', 'password': PASSWORD},
+            {'username': 'new2', 'email': 'new3@email.com', 'password': PASSWORD}
+        ]})
+        run_next_job()
+        job = Job.query.get(job.id)
+        self.assertEqual(job.status, 'succeeded')
+        self.assertEqual((job.progress_done, job.progress_total), (5, 5))
+        result = json.loads(job.result)
+        self.assertEqual((result['imported'], result['skipped'], result['invalid']), (2, 2, 1))
+        self.assertEqual(result['errors'], {'2': {'email': 'Invalid format.'}})
+        self.assertEqual(User.query.filter(User.username.in_(['new', 'new2'])).count(), 2)
+        self.assertIsNone(job.payload)
+
+    def test_prune_outbox(self):
+        """ Verify only events finished before the retention window are deleted. """
+
+        add_user(USERNAME, EMAIL, PASSWORD)
+        old = datetime.datetime.utcnow() - datetime.timedelta(days=10)
+        event = OutboxEvent.query.first()
+        event.dispatched_at = old
+        db.session.add(OutboxEvent(user_id=event.user_id, type='user.updated', payload='{}'))
+        db.session.commit()
+        job = enqueue_job('prune_outbox', {'days': 7})
+        run_next_job()
+        self.assertEqual(json.loads(Job.query.get(job.id).result), {'deleted': 1})
+        self.assertEqual(OutboxEvent.query.count(), 1)
+
+    def test_retry_then_fail(self):
+        """ Verify failing jobs are retried with backoff until they run out of attempts. """
+
+        @register_job('test_fail')
+        def fail(context, payload):
+            raise RuntimeError('boom')
+
+        job = enqueue_job('test_fail', {}, max_attempts=2)
+        run_next_job()
+        job = Job.query.get(job.id)
+        self.assertEqual((job.status, job.attempts, job.last_error), ('queued', 1, 'boom'))
+        self.assertGreater(job.available_at, datetime.datetime.utcnow())
+        self.assertIsNone(run_next_job())
+        job.available_at = datetime.datetime.utcnow()
+        db.session.commit()
+        run_next_job()
+        job = Job.query.get(job.id)
+        self.assertEqual((job.status, job.attempts), ('failed', 2))
+        self.assertIsNotNone(job.finished_at)
+
+    def test_cancel_queued(self):
+        """ Verify queued jobs are cancelled before they run. """
+
+        admin = add_admin()
+        job = enqueue_job('refresh_user_stats', {})
+        with self.client:
+            url = '/jobs/{job_id}/cancel'.format(job_id=job.id)
+            response, data = self.send('POST', url, admin)
+            self.assert200(response)
+            self.assertEqual(data['data']['status'], 'cancelled')
+            self.assertIsNone(Job.query.get(job.id).payload)
+            self.assertIsNone(run_next_job())
+            response, data = self.send('POST', url, admin)
+            self.assert400(response)
+            self.assertEqual(data['message'], 'Job already finished.')
+
+    def test_cancel_running(self):
+        """ Verify running jobs stop at their next progress report. """
+
+        @register_job('test_cancelled')
+        def cancelled(context, payload):
+            Job.query.filter_by(id=context.job_id).update({'cancel_requested': True})
+            context.progress(1, 2)
+            add_user(USERNAME, EMAIL, PASSWORD)
+
+        job = enqueue_job('test_cancelled', {})
+        run_next_job()
+        job = Job.query.get(job.id)
+        self.assertEqual((job.status, job.progress_done, job.progress_total), ('cancelled', 1, 2))
+        self.assertIsNone(User.query.filter_by(username=USERNAME).first())
+
+    def test_stale_job_is_reclaimed(self):
+        """ Verify a running job whose worker died is claimed again. """
+
+        self.app.config['JOBS_STALE_SECONDS'] = 60
+        job = enqueue_job('refresh_user_stats', {})
+        job.status = 'running'
+        job.attempts = 1
+        job.heartbeat_at = datetime.datetime.utcnow() - datetime.timedelta(seconds=120)
+        db.session.commit()
+        run_next_job()
+        job = Job.query.get(job.id)
+        self.assertEqual((job.status, job.attempts), ('succeeded', 2))
+
+    def test_reclaimed_job_is_fenced(self):
+        """ Verify a worker whose job was claimed again writes nothing. """
+
+        @register_job('test_reclaimed')
+        def reclaimed(context, payload):
+            Job.query.filter_by(id=context.job_id).update({'attempts': 2})
+            db.session.commit()
+            db.session.add(User(USERNAME, EMAIL, PASSWORD))
+            if payload.get('progress'):
+                context.progress(1)
+            return 'done'
+
+        for payload in ({}, {'progress': True}):
+            job = enqueue_job('test_reclaimed', payload)
+            run_next_job()
+            job = Job.query.get(job.id)
+            self.assertEqual((job.status, job.attempts, job.result), ('running', 2, None))
+            self.assertIsNone(User.query.filter_by(username=USERNAME).first())
+            db.session.delete(job)
+            db.session.commit()
+
+    def test_heartbeat(self):
+        """ Verify long running jobs refresh their heartbeat between progress reports. """
+
+        self.app.config['JOBS_HEARTBEAT_SECONDS'] = 0
+        old = datetime.datetime.utcnow() - datetime.timedelta(seconds=120)
+
+        @register_job('test_heartbeat')
+        def heartbeat(context, payload):
+            Job.query.filter_by(id=context.job_id).update({'heartbeat_at': old})
+            context.heartbeat()
+            return Job.query.get(context.job_id).heartbeat_at > old
+
+        job = enqueue_job('test_heartbeat', {})
+        run_next_job()
+        self.assertEqual(json.loads(Job.query.get(job.id).result), True)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,124 @@
+# ezasdf-users/project/tests/test_memory.py
+
+
+import json
+import os
+import shutil
+import tempfile
+import tracemalloc
+import unittest
+
+from project.api.memory import frame_module, report
+from project.api.utils import add_user, add_admin
+from project.tests.base import BaseTestCase
+from project.tests.utils import (
+    USERNAME,
+    EMAIL,
+    PASSWORD
+)
+
+
+class TestMemory(BaseTestCase):
+    """ Tests for worker memory introspection. """
+
+    def tearDown(self):
+        """ Stops tracing and drops the tracker. """
+
+        tracemalloc.stop()
+        self.app.extensions.pop('memory_tracker', None)
+        super().tearDown()
+
+    def test_frame_module(self):
+        """ Verify only files under project/ are named as modules. """
+
+        self.assertEqual(frame_module(os.path.abspath(__file__)), 'project.tests.test_memory')
+        self.assertIsNone(frame_module(json.__file__))
+
+    def test_snapshot_growth(self):
+        """ Verify growth between snapshots is charged to the allocating project module. """
+
+        admin = add_admin()
+        with self.client:
+            response, data = self.send('POST', '/memory/tracing', admin, {'frames': 5})
+            self.assert200(response)
+            self.assertTrue(data['data']['tracing'])
+            self.assertEqual(data['data']['frames'], 5)
+            response, data = self.send('POST', '/memory/snapshots', admin)
+            self.assertEqual(response.status_code, 201)
+            before = data['data']['id']
+            self.assertEqual(data['data']['pid'], os.getpid())
+            self.assertEqual(before, '{pid}-1'.format(pid=os.getpid()))
+            blob = [bytearray(1000) for _ in range(1000)]
+            response, data = self.send('POST', '/memory/snapshots', admin)
+            after = data['data']['id']
+            response, data = self.send(
+                'GET',
+                '/memory/snapshots/{after}?since={before}&limit=5'.format(after=after, before=before),
+                admin
+            )
+            self.assert200(response)
+            modules = {row['module']: row for row in data['data']['modules']}
+            self.assertGreaterEqual(modules['project.tests.test_memory']['size_diff'], 1000 * len(blob))
+            self.assertLessEqual(len(data['data']['sites']), 5)
+            self.assertTrue(any(row['site'].startswith('project.tests.test_memory:') for row in data['data']['sites']))
+            response, data = self.send('GET', '/memory', admin)
+            self.assertEqual(data['data']['snapshots'], [before, after])
+            response, data = self.send('DELETE', '/memory/tracing', admin)
+            self.assertFalse(data['data']['tracing'])
+            self.assertEqual(data['data']['snapshots'], [])
+
+    def test_snapshot_dump(self):
+        """ Verify snapshots are written to MEMORY_DIR for offline reports. """
+
+        directory = tempfile.mkdtemp()
+        self.app.config['MEMORY_DIR'] = directory
+        admin = add_admin()
+        try:
+            with self.client:
+                self.send('POST', '/memory/tracing', admin)
+                response, data = self.send('POST', '/memory/snapshots', admin)
+                path = data['data']['path']
+                self.assertEqual(os.path.dirname(path), directory)
+                self.assertEqual(report(tracemalloc.Snapshot.load(path), 3)['total'], data['data']['total'])
+        finally:
+            shutil.rmtree(directory)
+
+    def test_snapshot_errors(self):
+        """ Verify snapshots need tracing and unknown snapshots
+        and those of other workers are not found.
+        """
+
+        admin = add_admin()
+        with self.client:
+            response, data = self.send('POST', '/memory/snapshots', admin)
+            self.assert400(response)
+            self.assertEqual(data['message'], 'Memory tracing is not started.')
+            self.send('POST', '/memory/tracing', admin)
+            response, data = self.send('POST', '/memory/snapshots', admin)
+            snapshot_id, missing, foreign = data['data']['id'], '{pid}-999'.format(pid=os.getpid()), '1-1'
+            for url, message in (
+                ('/memory/snapshots/{id}'.format(id=missing), 'Snapshot does not exist.'),
+                ('/memory/snapshots/{id}?since={since}'.format(id=snapshot_id, since=missing), 'Snapshot does not exist.'),
+                ('/memory/snapshots/{id}'.format(id=foreign), 'Snapshot was taken by another worker.'),
+                ('/memory/snapshots/{id}?since={since}'.format(id=snapshot_id, since=foreign),
+                 'Snapshot was taken by another worker.')
+            ):
+                response, data = self.send('GET', url, admin)
+                self.assert404(response)
+                self.assertEqual(data['message'], message)
+            response, data = self.send('POST', '/memory/tracing', admin, {'frames': 0})
+            self.assert400(response)
+
+    def test_memory_requires_admin(self):
+        """ Verify users who are not admins cannot trace memory. """
+
+        user = add_user(USERNAME, EMAIL, PASSWORD)
+        with self.client:
+            for method, url in (('GET', '/memory'), ('POST', '/memory/tracing'), ('POST', '/memory/snapshots')):
+                response, data = self.send(method, url, user)
+                self.assert401(response)
+            self.assertFalse(tracemalloc.is_tracing())
+
+
+if __name__ == '__main__':
+    unittest.main()
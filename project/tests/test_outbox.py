@@ -0,0 +1,150 @@
+# ezasdf-users/project/tests/test_outbox.py
+
+
+import datetime
+import unittest
+
+from project import db
+from project.api.models import OutboxEvent
+from project.api.outbox import Dispatcher, QueueSink
+from project.api.utils import add_user
+from project.tests.base import BaseTestCase
+from project.tests.utils import (
+    USERNAME,
+    USERNAME2,
+    EMAIL,
+    EMAIL2,
+    PASSWORD
+)
+
+
+class FlakySink(QueueSink):
+    """ Queue sink that fails for some users. """
+
+    def __init__(self, failing):
+        """ __init__
+
+        :param failing: user ids whose events fail
+        """
+
+        super().__init__()
+        self.failing = failing
+
+    def send(self, event):
+        if event['user_id'] in self.failing:
+            raise IOError('Receiver unavailable.')
+        super().send(event)
+
+
+class TestOutbox(BaseTestCase):
+    """ Tests for the outbox and its dispatcher. """
+
+    def dispatcher(self, sink=None, max_attempts=3):
+        """ Creates a dispatcher over a queue sink.
+
+        :param sink:
+        :param max_attempts:
+        :return: Dispatcher
+        """
+
+        return Dispatcher(sink or QueueSink(), 100, max_attempts, 1, 60)
+
+    def delivered(self, sink):
+        """ Drains the sink's queue.
+
+        :param sink:
+        :return: list of (type, user_id)
+        """
+
+        events = []
+        while not sink.events.empty():
+            event = sink.events.get()
+            events.append((event['type'], event['user_id']))
+        return events
+
+    def test_events_written_with_changes(self):
+        """ Verify creating, updating and deactivating users write events in their transaction. """
+
+        user = add_user(USERNAME, EMAIL, PASSWORD)
+        user.admin = True
+        db.session.commit()
+        user.active = False
+        db.session.commit()
+        events = OutboxEvent.query.order_by(OutboxEvent.id).all()
+        self.assertEqual(
+            [(event.type, event.user_id) for event in events],
+            [('user.created', user.id), ('user.updated', user.id), ('user.deactivated', user.id)]
+        )
+        self.assertEqual(events[0].to_json()['payload']['username'], USERNAME)
+        self.assertNotIn('password', events[0].to_json()['payload'])
+
+    def test_rolled_back_changes_write_no_events(self):
+        """ Verify events share the fate of their transaction. """
+
+        user = add_user(USERNAME, EMAIL, PASSWORD)
+        user.admin = True
+        db.session.flush()
+        db.session.rollback()
+        self.assertEqual(OutboxEvent.query.filter_by(type='user.updated').count(), 0)
+
+    def test_dispatch(self):
+        """ Verify events are delivered in order per user, one per user per batch. """
+
+        user = add_user(USERNAME, EMAIL, PASSWORD)
+        user2 = add_user(USERNAME2, EMAIL2, PASSWORD)
+        user.active = False
+        db.session.commit()
+        dispatcher = self.dispatcher()
+        self.assertEqual(dispatcher.dispatch(), (2, 0))
+        self.assertEqual(self.delivered(dispatcher.sink), [('user.created', user.id), ('user.created', user2.id)])
+        self.assertEqual(dispatcher.dispatch(), (1, 0))
+        self.assertEqual(self.delivered(dispatcher.sink), [('user.deactivated', user.id)])
+        self.assertEqual(dispatcher.dispatch(), (0, 0))
+
+    def test_dispatch_retries(self):
+        """ Verify failed events back off without holding up other users. """
+
+        user = add_user(USERNAME, EMAIL, PASSWORD)
+        user2 = add_user(USERNAME2, EMAIL2, PASSWORD)
+        user.active = False
+        db.session.commit()
+        dispatcher = self.dispatcher(FlakySink({user.id}))
+        self.assertEqual(dispatcher.dispatch(), (1, 1))
+        self.assertEqual(self.delivered(dispatcher.sink), [('user.created', user2.id)])
+        event = OutboxEvent.query.filter_by(user_id=user.id).order_by(OutboxEvent.id).first()
+        self.assertEqual(event.attempts, 1)
+        self.assertEqual(event.last_error, 'Receiver unavailable.')
+        self.assertGreater(event.available_at, datetime.datetime.utcnow())
+        self.assertEqual(dispatcher.dispatch(), (0, 0))
+        dispatcher.sink.failing.clear()
+        event.available_at = datetime.datetime.utcnow()
+        db.session.commit()
+        self.assertEqual(dispatcher.dispatch(), (1, 0))
+        self.assertEqual(dispatcher.dispatch(), (1, 0))
+        self.assertEqual(
+            self.delivered(dispatcher.sink),
+            [('user.created', user.id), ('user.deactivated', user.id)]
+        )
+
+    def test_dispatch_gives_up(self):
+        """ Verify events are marked failed after max attempts. """
+
+        user = add_user(USERNAME, EMAIL, PASSWORD)
+        dispatcher = self.dispatcher(FlakySink({user.id}), max_attempts=1)
+        self.assertEqual(dispatcher.dispatch(), (0, 1))
+        event = OutboxEvent.query.filter_by(user_id=user.id).first()
+        self.assertIsNotNone(event.failed_at)
+        self.assertIsNone(event.dispatched_at)
+
+    def test_backoff(self):
+        """ Verify backoff doubles up to its cap. """
+
+        dispatcher = Dispatcher(QueueSink(), 100, 10, 1, 5)
+        self.assertEqual(
+            [dispatcher.backoff(attempts).total_seconds() for attempts in range(1, 5)],
+            [1, 2, 4, 5]
+        )
+
+
+if __name__ == '__main__':
+    unittest.main()
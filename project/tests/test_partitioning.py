@@ -0,0 +1,122 @@
+# ezasdf-users/project/tests/test_partitioning.py
+
+
+import json
+import unittest
+
+from sqlalchemy import exc, text
+
+from project import db
+from project.api.jobs import enqueue_job, run_next_job
+from project.api.models import Job, User
+from project.api.partitioning import identity_clause, partition_statements
+from project.api.utils import add_user
+from project.tests.base import BaseTestCase
+from project.tests.utils import (
+    USERNAME,
+    USERNAME2,
+    EMAIL,
+    EMAIL2,
+    PASSWORD
+)
+
+
+class TestPartitioning(BaseTestCase):
+    """ Tests for the hash partitioned users table.
+    The migration runs inside the test transaction and is rolled back with it.
+    """
+
+    def partition(self, partitions=4):
+        """ Migrates users and routes lookups through user_identities.
+
+        :param partitions:
+        """
+
+        if db.engine.dialect.name != 'postgresql':
+            self.skipTest('Hash partitioning requires postgres')
+        db.session.execute(text(partition_statements(partitions)))
+        self.app.config['USERS_PARTITIONED'] = True
+
+    def test_partition_statements(self):
+        """ Verify one partition is created per remainder. """
+
+        statements = partition_statements(4)
+        self.assertEqual(statements.count('PARTITION OF users_partitioned'), 4)
+        self.assertIn('FOR VALUES WITH (MODULUS 4, REMAINDER 3)', statements)
+
+    def test_identity_clause(self):
+        """ Verify partitioned lookups resolve the id through user_identities. """
+
+        self.assertNotIn('user_identities', str(identity_clause('email', EMAIL)))
+        self.app.config['USERS_PARTITIONED'] = True
+        self.assertIn('user_identities', str(identity_clause('email', EMAIL)))
+
+    def test_migration_keeps_users(self):
+        """ Verify existing users and their identities survive the migration. """
+
+        user = add_user(USERNAME, EMAIL, PASSWORD)
+        self.partition()
+        self.assertEqual(User.query.filter(identity_clause('email', EMAIL)).one().id, user.id)
+        self.assertEqual(User.query.filter(identity_clause('username', USERNAME)).one().id, user.id)
+        self.assertIsNone(User.query.filter(identity_clause('email', EMAIL2)).first())
+
+    def test_identities_follow_writes(self):
+        """ Verify the trigger keeps identities unique and up to date. """
+
+        self.partition()
+        with self.client:
+            response = self.client.post(
+                '/auth/signup',
+                data=json.dumps({'username': USERNAME, 'email': EMAIL, 'password': PASSWORD}),
+                content_type='application/json'
+            )
+            self.assertEqual(response.status_code, 201)
+            response = self.client.post(
+                '/auth/signin',
+                data=json.dumps({'email': EMAIL, 'password': PASSWORD}),
+                content_type='application/json'
+            )
+            self.assert200(response)
+        user = User.query.filter(identity_clause('email', EMAIL)).one()
+        user.email = EMAIL2
+        db.session.commit()
+        self.assertIsNone(User.query.filter(identity_clause('email', EMAIL)).first())
+        self.assertEqual(User.query.filter(identity_clause('email', EMAIL2)).one().id, user.id)
+        with self.client:
+            response = self.client.post(
+                '/auth/signup',
+                data=json.dumps({'username': USERNAME2, 'email': EMAIL2, 'password': PASSWORD}),
+                content_type='application/json'
+            )
+            data = json.loads(response.data.decode())
+            self.assertEqual(data['message'], 'User already exists.')
+            self.assert400(response)
+
+    def test_identities_unique(self):
+        """ Verify duplicate emails are rejected across partitions. """
+
+        self.partition()
+        add_user(USERNAME, EMAIL, PASSWORD)
+        db.session.commit()
+        with self.assertRaises(exc.IntegrityError):
+            add_user(USERNAME2, EMAIL, PASSWORD)
+        db.session.rollback()
+
+    def test_import_skips_existing_identities(self):
+        """ Verify imports find existing users through user_identities. """
+
+        add_user(USERNAME, EMAIL, PASSWORD)
+        self.partition()
+        job = enqueue_job('import_users', {'users': [
+            {'username': USERNAME, 'email': 'other@email.com', 'password': PASSWORD},
+            {'username': 'other', 'email': EMAIL, 'password': PASSWORD},
+            {'username': USERNAME2, 'email': EMAIL2, 'password': PASSWORD}
+        ]})
+        run_next_job()
+        result = json.loads(Job.query.get(job.id).result)
+        self.assertEqual((result['imported'], result['skipped']), (1, 2))
+        self.assertEqual(User.query.filter(identity_clause('email', EMAIL2)).one().username, USERNAME2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,147 @@
+# ezasdf-users/project/tests/test_profiling.py
+
+
+import cProfile
+import json
+import os
+import pstats
+import shutil
+import tempfile
+import unittest
+
+from project.api.profiling import collapsed_stacks, prune_profiles
+from project.api.utils import add_user, add_admin
+from project.tests.base import BaseTestCase
+from project.tests.utils import (
+    USERNAME,
+    EMAIL,
+    PASSWORD,
+    mint_jwt
+)
+
+
+class TestProfiling(BaseTestCase):
+    """ Tests for on demand request profiling. """
+
+    def setUp(self):
+        """ Stores profiles in a scratch directory. """
+
+        super().setUp()
+        self.directory = tempfile.mkdtemp()
+        self.app.config['PROFILE_DIR'] = self.directory
+
+    def tearDown(self):
+        """ Deletes the scratch directory. """
+
+        shutil.rmtree(self.directory)
+        super().tearDown()
+
+    def get(self, url, user=None, profile=False, **params):
+        """ Sends a GET, optionally as user and with the profile flag.
+
+        :param url:
+        :param user:
+        :param profile:
+        :param params:
+        :return: response
+        """
+
+        headers = {}
+        if user is not None:
+            headers['Authorization'] = 'Bearer ' + mint_jwt(user)
+        if profile:
+            headers['X-Profile'] = '1'
+        return self.client.get(url, headers=headers, query_string=params)
+
+    def test_admin_profile(self):
+        """ Verify admins get a downloadable profile of the flagged request. """
+
+        admin = add_admin()
+        with self.client:
+            response = self.get('/users/ping', admin, profile=True)
+            self.assert200(response)
+            self.assertEqual(json.loads(response.data.decode())['message'], 'pong!')
+            profile_id = response.headers['X-Profile-Id']
+            response = self.get('/profiles/{profile_id}'.format(profile_id=profile_id), admin)
+            self.assert200(response)
+            self.assertEqual(response.content_type, 'application/octet-stream')
+            path = os.path.join(self.directory, 'download.pstats')
+            with open(path, 'wb') as f:
+                f.write(response.data)
+            functions = [name for filename, line, name in pstats.Stats(path).stats]
+            self.assertIn('get_users_ping', functions)
+            response = self.get('/profiles/{profile_id}'.format(profile_id=profile_id), admin, format='collapsed')
+            self.assert200(response)
+            lines = response.data.decode().splitlines()
+            self.assertTrue(any(line.split(' ')[0].endswith('users:get_users_ping') for line in lines))
+            self.assertTrue(all(line.rsplit(' ', 1)[1].isdigit() for line in lines))
+
+    def test_profile_requires_admin(self):
+        """ Verify the flag is ignored for anyone but admins. """
+
+        user = add_user(USERNAME, EMAIL, PASSWORD)
+        with self.client:
+            for response in (self.get('/users/ping', profile=True), self.get('/users/ping', user, profile=True)):
+                self.assert200(response)
+                self.assertNotIn('X-Profile-Id', response.headers)
+            self.assertEqual(os.listdir(self.directory), [])
+            response = self.get('/profiles/{profile_id}'.format(profile_id='0' * 32), user)
+            self.assert401(response)
+
+    def test_unflagged_request(self):
+        """ Verify requests without the flag are not profiled. """
+
+        admin = add_admin()
+        with self.client:
+            response = self.get('/users/ping', admin)
+            self.assertNotIn('X-Profile-Id', response.headers)
+            self.assertEqual(os.listdir(self.directory), [])
+
+    def test_missing_profile(self):
+        """ Verify unknown and malformed profile ids are not found. """
+
+        admin = add_admin()
+        with self.client:
+            for profile_id in ('0' * 32, '..%2Fetc%2Fpasswd', 'abc'):
+                response = self.get('/profiles/{profile_id}'.format(profile_id=profile_id), admin)
+                self.assert404(response)
+
+    def test_prune_profiles(self):
+        """ Verify only the newest profiles are kept. """
+
+        for n in range(3):
+            path = os.path.join(self.directory, '{n}.pstats'.format(n=n))
+            open(path, 'w').close()
+            os.utime(path, (n, n))
+        os.symlink(os.path.join(self.directory, 'deleted'), os.path.join(self.directory, 'deleted.pstats'))
+        prune_profiles(self.directory, 2)
+        self.assertEqual(sorted(os.listdir(self.directory)), ['1.pstats', '2.pstats', 'deleted.pstats'])
+
+    def test_save_failure(self):
+        """ Verify a profile that cannot be saved does not fail the request. """
+
+        admin = add_admin()
+        self.app.config['PROFILE_DIR'] = os.path.join(self.directory, 'file')
+        open(self.app.config['PROFILE_DIR'], 'w').close()
+        with self.client:
+            response = self.get('/users/ping', admin, profile=True)
+            self.assert200(response)
+            self.assertEqual(json.loads(response.data.decode())['message'], 'pong!')
+
+    def test_collapsed_stacks(self):
+        """ Verify nested calls are folded into root first stacks. """
+
+        def leaf():
+            return sum(range(10000))
+
+        def branch():
+            return leaf() + leaf()
+
+        profile = cProfile.Profile()
+        profile.runcall(branch)
+        lines = collapsed_stacks(pstats.Stats(profile))
+        self.assertTrue(any(line.split(' ')[0].endswith('test_profiling:branch;test_profiling:leaf') for line in lines))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,176 @@
+# ezasdf-users/project/tests/test_ratelimit.py
+
+
+import json
+import unittest
+
+from project.api.ratelimit import MemoryBackend, RedisBackend, SlidingWindowLimiter
+from project.api.utils import add_user
+from project.proxy import forwarded_address
+from project.tests.base import BaseTestCase
+from project.tests.utils import (
+    USERNAME,
+    EMAIL,
+    EMAIL2,
+    PASSWORD
+)
+
+
+class FakeRedis:
+    """ Stand-in for a redis client that speaks the commands the backend uses. """
+
+    def __init__(self):
+        self.values = {}
+        self.commands = []
+
+    def pipeline(self):
+        self.commands = []
+        return self
+
+    def incr(self, key):
+        self.commands.append(('incr', key))
+
+    def expire(self, key, seconds):
+        self.commands.append(('expire', key))
+
+    def execute(self):
+        results = []
+        for command, key in self.commands:
+            if command == 'incr':
+                self.values[key] = self.values.get(key, 0) + 1
+                results.append(self.values[key])
+            else:
+                results.append(True)
+        return results
+
+    def get(self, key):
+        value = self.values.get(key)
+        return str(value).encode() if value is not None else None
+
+
+class TestSlidingWindowLimiter(unittest.TestCase):
+    """ Tests for the sliding window limiter. """
+
+    def assert_limits(self, limiter):
+        """ Verify the limiter allows limit hits per key then rejects.
+
+        :param limiter:
+        """
+
+        self.assertEqual(limiter.hit('key', 2, 60), 0)
+        self.assertEqual(limiter.hit('key', 2, 60), 0)
+        retry_after = limiter.hit('key', 2, 60)
+        self.assertGreater(retry_after, 0)
+        self.assertLessEqual(retry_after, 60)
+        self.assertEqual(limiter.hit('other', 2, 60), 0)
+
+    def test_memory_backend(self):
+        """ Verify the in process backend limits hits. """
+
+        self.assert_limits(SlidingWindowLimiter(MemoryBackend()))
+
+    def test_redis_backend(self):
+        """ Verify the shared backend limits hits. """
+
+        self.assert_limits(SlidingWindowLimiter(RedisBackend(FakeRedis())))
+
+    def test_memory_backend_prunes_expired_keys(self):
+        """ Verify expired counters are dropped once the backend is full. """
+
+        backend = MemoryBackend(max_keys=2)
+        backend.incr('a', -1)
+        backend.incr('b', -1)
+        backend.incr('c', 60)
+        self.assertEqual(list(backend.counters), ['c'])
+
+
+class TestForwardedAddress(unittest.TestCase):
+    """ Tests for picking the client address behind trusted proxies. """
+
+    def test_forwarded_address(self):
+        """ Verify the hop added by the outermost trusted proxy is picked. """
+
+        forwarded_for = ['1.1.1.1', ' 2.2.2.2', '3.3.3.3 ']
+        self.assertEqual(forwarded_address(forwarded_for, 1), '3.3.3.3')
+        self.assertEqual(forwarded_address(forwarded_for, 2), '2.2.2.2')
+        self.assertIsNone(forwarded_address(forwarded_for, 4))
+        self.assertIsNone(forwarded_address(forwarded_for, 0))
+        self.assertIsNone(forwarded_address([''], 1))
+
+
+class TestSigninRateLimit(BaseTestCase):
+    """ Tests for signin rate limiting. """
+
+    def signin(self, email, forwarded_for=None):
+        """ Posts a signin attempt.
+
+        :param email:
+        :param forwarded_for: X-Forwarded-For header
+        :return: flask response
+        """
+
+        return self.client.post(
+            '/auth/signin',
+            data=json.dumps({
+                'email': email,
+                'password': 'wrong'
+            }),
+            content_type='application/json',
+            headers={'X-Forwarded-For': forwarded_for} if forwarded_for else {}
+        )
+
+    def test_post_signin_limited_per_email(self):
+        """ Verify repeated signins for one email are rejected with 429. """
+
+        self.app.config['RATELIMIT_SIGNIN_PER_EMAIL'] = (2, 60)
+        add_user(USERNAME, EMAIL, PASSWORD)
+        with self.client:
+            self.assert404(self.signin(EMAIL))
+            self.assert404(self.signin(EMAIL))
+            response = self.signin(EMAIL)
+            data = json.loads(response.data.decode())
+            self.assertEqual(data['status'], 'error')
+            self.assertEqual(data['message'], 'Too many signin attempts. Try again later.')
+            self.assertEqual(response.status_code, 429)
+            self.assertTrue(int(response.headers['Retry-After']) > 0)
+            self.assert404(self.signin(EMAIL2))
+
+    def test_post_signin_limited_per_client(self):
+        """ Verify one client signing in as many emails is rejected with 429. """
+
+        self.app.config['RATELIMIT_SIGNIN_PER_CLIENT'] = (1, 60)
+        with self.client:
+            self.assert404(self.signin(EMAIL))
+            self.assertEqual(self.signin(EMAIL2).status_code, 429)
+
+    def test_post_signin_limited_per_forwarded_client(self):
+        """ Verify clients behind a trusted proxy are limited separately. """
+
+        self.app.config['RATELIMIT_SIGNIN_PER_CLIENT'] = (1, 60)
+        self.app.config['TRUSTED_PROXY_COUNT'] = 1
+        with self.client:
+            self.assert404(self.signin(EMAIL, '10.0.0.1'))
+            self.assert404(self.signin(EMAIL2, '10.0.0.2'))
+            self.assert404(self.signin(EMAIL2, '10.0.0.1, 10.0.0.3'))
+            self.assertEqual(self.signin(EMAIL, '10.0.0.3, 10.0.0.1').status_code, 429)
+
+    def test_post_signin_forwarded_for_untrusted(self):
+        """ Verify X-Forwarded-For is ignored when no proxy is trusted. """
+
+        self.app.config['RATELIMIT_SIGNIN_PER_CLIENT'] = (1, 60)
+        with self.client:
+            self.assert404(self.signin(EMAIL, '10.0.0.1'))
+            self.assertEqual(self.signin(EMAIL2, '10.0.0.2').status_code, 429)
+
+    def test_post_signin_limit_disabled(self):
+        """ Verify signins are not limited when disabled. """
+
+        self.app.config['RATELIMIT_ENABLED'] = False
+        self.app.config['RATELIMIT_SIGNIN_PER_EMAIL'] = (1, 60)
+        with self.client:
+            self.assert404(self.signin(EMAIL))
+            self.assert404(self.signin(EMAIL))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,83 @@
+# ezasdf-users/project/tests/test_routing.py
+
+
+import json
+import time
+
+from project import db
+from project.api.models import User
+from project.routing import STICKY_COOKIE
+from project.tests.base import BaseTestCase
+from project.tests.utils import (
+    USERNAME,
+    EMAIL,
+    PASSWORD
+)
+
+
+REPLICA_URI = 'sqlite://'
+
+
+class TestReplicaRouting(BaseTestCase):
+    """ Tests for read replica routing. """
+
+    def setUp(self):
+        """ Creates database and configures a replica. """
+
+        super().setUp()
+        self.app.config['SQLALCHEMY_REPLICA_URIS'] = [REPLICA_URI]
+
+    def get_bind(self, method, headers=None):
+        """ Fetches the bind chosen for the users table in a request.
+
+        :param method:
+        :param headers:
+        :return: engine
+        """
+
+        with self.app.test_request_context('/users', method=method, headers=headers):
+            return self.app_session.get_bind(User.__mapper__)
+
+    def test_read_uses_replica(self):
+        """ Verify read-only requests are routed to a replica. """
+
+        self.assertEqual(str(self.get_bind('GET').url), REPLICA_URI)
+
+    def test_write_uses_primary(self):
+        """ Verify write requests are routed to the primary. """
+
+        self.assertIs(self.get_bind('POST'), db.engine)
+
+    def test_no_replicas_uses_primary(self):
+        """ Verify reads go to the primary when no replica is configured. """
+
+        self.app.config['SQLALCHEMY_REPLICA_URIS'] = []
+        self.assertIs(self.get_bind('GET'), db.engine)
+
+    def test_sticky_client_uses_primary(self):
+        """ Verify a client that just wrote reads from the primary. """
+
+        cookie = '{name}={until}'.format(name=STICKY_COOKIE, until=time.time() + 5)
+        self.assertIs(self.get_bind('GET', headers={'Cookie': cookie}), db.engine)
+
+    def test_expired_sticky_client_uses_replica(self):
+        """ Verify the sticky window expires. """
+
+        cookie = '{name}={until}'.format(name=STICKY_COOKIE, until=time.time() - 1)
+        self.assertEqual(str(self.get_bind('GET', headers={'Cookie': cookie}).url), REPLICA_URI)
+
+    def test_post_signup_sets_sticky_cookie(self):
+        """ Verify signing up pins the client to the primary. """
+
+        with self.client:
+            response = self.client.post(
+                '/auth/signup',
+                data=json.dumps({
+                    'username': USERNAME,
+                    'email': EMAIL,
+                    'password': PASSWORD
+                }),
+                content_type='application/json'
+            )
+            self.assertEqual(response.status_code, 201)
+            self.assertIn(STICKY_COOKIE, response.headers.get('Set-Cookie'))
@@ -0,0 +1,54 @@
+# ezasdf-users/project/tests/test_runner.py
+
+
+import os
+import unittest
+
+from project.tests.runner import configured_database, partition, worker_database_url
+
+
+class TestParallelRunner(unittest.TestCase):
+    """ Tests for the parallel test runner. """
+
+    def test_partition_balances_tests(self):
+        """ Verify test classes are spread over the workers by test count. """
+
+        class_ids = ['a'] * 4 + ['b'] * 2 + ['c', 'd']
+        buckets = partition(class_ids, 2)
+        self.assertEqual(buckets, [['a'], ['b', 'c', 'd']])
+
+    def test_partition_skips_empty_buckets(self):
+        """ Verify workers without tests are not started. """
+
+        self.assertEqual(partition(['a', 'a'], 3), [['a']])
+
+    def test_worker_database_url_postgres(self):
+        """ Verify each postgres worker gets its own database. """
+
+        url = worker_database_url('postgresql://postgres@localhost/users_test', 2)
+        self.assertEqual(url, 'postgresql://postgres@localhost/users_test_2')
+
+    def test_worker_database_url_sqlite(self):
+        """ Verify each sqlite worker gets its own file. """
+
+        url = worker_database_url('sqlite:////tmp/users_test.db', 1)
+        self.assertEqual(url, 'sqlite:////tmp/users_test_1.db')
+
+    def test_database_url_follows_test_settings(self):
+        """ Verify worker databases derive from the active test config. """
+
+        previous = os.environ.get('TEST_SETTINGS')
+        os.environ['TEST_SETTINGS'] = 'project.config.EmbeddedTestingConfig'
+        try:
+            url, variable = configured_database()
+            self.assertTrue(url.startswith('sqlite:///'))
+            self.assertEqual(variable, 'EMBEDDED_DATABASE_TEST_URL')
+        finally:
+            if previous is None:
+                del os.environ['TEST_SETTINGS']
+            else:
+                os.environ['TEST_SETTINGS'] = previous
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,69 @@
+# ezasdf-users/project/tests/test_serialization.py
+
+
+import datetime
+import json
+import unittest
+
+import msgpack
+
+from project.api.utils import add_user, encode_msgpack
+from project.tests.base import BaseTestCase
+from project.tests.utils import (
+    USERNAME,
+    EMAIL,
+    PASSWORD
+)
+
+
+class TestEncodeMsgpack(unittest.TestCase):
+    """ Tests for msgpack encoding. """
+
+    def test_naive_datetime_is_utc(self):
+        """ Verify naive datetimes are encoded as UTC timestamps. """
+
+        timestamp = encode_msgpack(datetime.datetime(2018, 1, 2, 3, 4, 5, 678))
+        self.assertEqual(timestamp, msgpack.Timestamp(1514862245, 678000))
+
+    def test_unknown_type(self):
+        """ Verify unknown types are rejected. """
+
+        self.assertRaises(TypeError, encode_msgpack, object())
+
+
+class TestMsgpackNegotiation(BaseTestCase):
+    """ Tests for msgpack content negotiation. """
+
+    def test_get_users_msgpack(self):
+        """ Verify clients that accept msgpack get msgpack with native timestamps. """
+
+        created = datetime.datetime(2018, 1, 2, 3, 4, 5)
+        add_user(USERNAME, EMAIL, PASSWORD, created)
+        with self.client:
+            response = self.client.get('/users', headers={'Accept': 'application/msgpack'})
+            self.assertEqual(response.content_type, 'application/msgpack')
+            self.assertIn('Accept', response.headers['Vary'])
+            data = msgpack.unpackb(response.data, raw=False, timestamp=3)
+            self.assertEqual(data['status'], 'success')
+            user, = data['data']['users']
+            self.assertEqual(user['username'], USERNAME)
+            self.assertEqual(user['created_at'], created.replace(tzinfo=datetime.timezone.utc))
+            self.assert200(response)
+
+    def test_error_response_msgpack(self):
+        """ Verify errors are negotiated too. """
+
+        with self.client:
+            response = self.client.get('/users/999', headers={'Accept': 'application/x-msgpack'})
+            data = msgpack.unpackb(response.data, raw=False)
+            self.assertEqual(data['message'], 'User does not exist.')
+            self.assert404(response)
+
+    def test_json_default(self):
+        """ Verify json is used without an Accept header or when preferred. """
+
+        with self.client:
+            for headers in ({}, {'Accept': '*/*'}, {'Accept': 'application/json, application/msgpack;q=0.5'}):
+                response = self.client.get('/users/ping', headers=headers)
+                self.assertEqual(response.content_type, 'application/json')
+                self.assertEqual(json.loads(response.data.decode())['message'], 'pong!')
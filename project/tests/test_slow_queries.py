@@ -0,0 +1,139 @@
+# ezasdf-users/project/tests/test_slow_queries.py
+
+
+import json
+import os
+import tempfile
+import unittest
+
+from project import db
+from project.api.slow_queries import claim_explain, explained, get_explainer, normalize, params_shape, summarize
+from project.tests.base import BaseTestCase
+
+
+class TestSlowQueryHelpers(unittest.TestCase):
+    """ Tests for the slow query log helpers. """
+
+    def test_params_shape(self):
+        """ Verify parameters are described without their values. """
+
+        self.assertEqual(params_shape({'email': 'a@b.c', 'id': 1}), {'email': 'str', 'id': 'int'})
+        self.assertEqual(params_shape(('a', 1)), ['str', 'int'])
+        self.assertEqual(params_shape([{'id': 1}, {'id': 2}], True), {'rows': 2, 'row': {'id': 'int'}})
+
+    def test_claim_explain(self):
+        """ Verify statements are explained once and only the most recently seen are remembered. """
+
+        explained.clear()
+        self.assertTrue(claim_explain('SELECT 1', 2))
+        self.assertFalse(claim_explain('SELECT 1', 2))
+        self.assertTrue(claim_explain('SELECT 2', 2))
+        self.assertFalse(claim_explain('SELECT 1', 2))
+        self.assertTrue(claim_explain('SELECT 3', 2))
+        self.assertEqual(list(explained), ['SELECT 1', 'SELECT 3'])
+        self.assertTrue(claim_explain('SELECT 2', 2))
+        explained.clear()
+
+    def test_normalize(self):
+        """ Verify literals and whitespace are collapsed. """
+
+        self.assertEqual(
+            normalize("SELECT *\n  FROM users WHERE id = 12 AND email = 'it''s'"),
+            'SELECT * FROM users WHERE id = ? AND email = ?'
+        )
+
+
+class TestSlowQueryLog(BaseTestCase):
+    """ Tests for the slow query log. """
+
+    def setUp(self):
+        """ Logs every statement to a temporary file once the worker has booted. """
+
+        super().setUp()
+        self.client.get('/users/ping')
+        handle, self.path = tempfile.mkstemp(suffix='.ndjson')
+        os.close(handle)
+        self.app.config['SLOW_QUERY_LOG_ENABLED'] = True
+        self.app.config['SLOW_QUERY_THRESHOLD_MS'] = 0
+        self.app.config['SLOW_QUERY_LOG'] = self.path
+
+    def tearDown(self):
+        """ Removes the slow query log. """
+
+        os.remove(self.path)
+        super().tearDown()
+
+    def records(self):
+        """ Reads the slow query log.
+
+        :return: list of dicts
+        """
+
+        with open(self.path) as f:
+            return [json.loads(line) for line in f]
+
+    def test_logs_slow_query_with_route(self):
+        """ Verify slow statements are logged with their route and parameter shape. """
+
+        with self.client:
+            self.client.get('/users/1')
+        record, = self.records()
+        self.assertIn('FROM users', record['statement'])
+        self.assertEqual(record['route'], '/users/<user_id>')
+        self.assertEqual(record['method'], 'GET')
+        self.assertIn('int', json.dumps(record['params']))
+        self.assertNotIn('explain', record)
+
+    def test_disabled(self):
+        """ Verify nothing is logged when disabled. """
+
+        self.app.config['SLOW_QUERY_LOG_ENABLED'] = False
+        with self.client:
+            self.client.get('/users/1')
+        self.assertEqual(self.records(), [])
+
+    def test_explain_top_offenders(self):
+        """ Verify slow selects above the explain threshold are explained once, out of band. """
+
+        if db.engine.dialect.name != 'postgresql':
+            self.skipTest('EXPLAIN (ANALYZE, BUFFERS) requires postgres')
+        self.app.config['SLOW_QUERY_EXPLAIN'] = True
+        self.app.config['SLOW_QUERY_EXPLAIN_THRESHOLD_MS'] = 0
+        explained.clear()
+        with self.client:
+            self.client.get('/users/1')
+            self.client.get('/users/1')
+        get_explainer().queue.join()
+        records = self.records()
+        self.assertEqual(len(records), 2)
+        self.assertEqual(len([record for record in records if 'explain' in record]), 1)
+        self.assertTrue(any('Scan' in line for record in records for line in record.get('explain', [])))
+
+    def test_explain_on_own_connection(self):
+        """ Verify statements are explained on another connection and
+        a failing explain leaves the request's transaction usable.
+        """
+
+        if db.engine.dialect.name != 'postgresql':
+            self.skipTest('EXPLAIN (ANALYZE, BUFFERS) requires postgres')
+        self.app.config['SLOW_QUERY_EXPLAIN'] = True
+        self.app.config['SLOW_QUERY_EXPLAIN_THRESHOLD_MS'] = 0
+        explained.clear()
+        db.session.execute('CREATE TEMP TABLE explain_probe (id integer)')
+        db.session.execute('SELECT id FROM explain_probe')
+        self.assertEqual(db.session.execute('SELECT count(*) FROM explain_probe').scalar(), 0)
+        get_explainer().queue.join()
+        records = [record for record in self.records() if record['statement'].startswith('SELECT')]
+        self.assertEqual(len(records), 2)
+        self.assertTrue(all('explain_probe' in record['explain_error'] for record in records))
+
+    def test_summarize(self):
+        """ Verify the log is grouped by statement. """
+
+        with self.client:
+            self.client.get('/users/1')
+            self.client.get('/users/2')
+        group, = summarize(self.path)
+        self.assertEqual(group['count'], 2)
+        self.assertEqual(group['routes'], ['/users/<user_id>'])
+        self.assertGreaterEqual(group['max_ms'], group['mean_ms'])
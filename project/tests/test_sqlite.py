@@ -0,0 +1,40 @@
+# ezasdf-users/project/tests/test_sqlite.py
+
+
+import os
+import sqlite3
+import tempfile
+import unittest
+
+from project.sqlite import configure_connection
+
+
+class TestSQLite(unittest.TestCase):
+    """ Tests for the embedded database connection setup. """
+
+    def test_configure_connection(self):
+        """ Verify SQLite connections use WAL and leave transactions to SQLAlchemy. """
+
+        handle, path = tempfile.mkstemp(suffix='.db')
+        os.close(handle)
+        connection = sqlite3.connect(path)
+        try:
+            configure_connection(connection, None)
+            self.assertIsNone(connection.isolation_level)
+            self.assertEqual(connection.execute('PRAGMA journal_mode').fetchone()[0], 'wal')
+            self.assertEqual(connection.execute('PRAGMA busy_timeout').fetchone()[0], 5000)
+        finally:
+            connection.close()
+            for suffix in ('', '-wal', '-shm'):
+                if os.path.exists(path + suffix):
+                    os.remove(path + suffix)
+
+    def test_other_connections_untouched(self):
+        """ Verify connections of other drivers are ignored. """
+
+        connection = object()
+        configure_connection(connection, None)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,55 @@
+# ezasdf-users/project/tests/test_startup.py
+
+
+import json
+import os
+import subprocess
+import sys
+import unittest
+
+
+STARTUP_BUDGET_SECONDS = 2.0
+MODULE_BUDGET = 600
+FORBIDDEN_MODULES = ('coverage', 'flask_script', 'flask_migrate')
+
+PROBE = '''
+import json, sys, time
+start = time.time()
+import wsgi
+print(json.dumps({
+    'seconds': time.time() - start,
+    'modules': len(sys.modules),
+    'forbidden': [name for name in %r if name in sys.modules]
+}))
+''' % (FORBIDDEN_MODULES,)
+
+
+class TestStartup(unittest.TestCase):
+    """ Tests for the production entry point. """
+
+    @classmethod
+    def setUpClass(cls):
+        """ Imports the wsgi module in a fresh interpreter. """
+
+        root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+        output = subprocess.check_output([sys.executable, '-c', PROBE], cwd=root)
+        cls.stats = json.loads(output.decode().splitlines()[-1])
+
+    def test_wsgi_skips_dev_tooling(self):
+        """ Verify the wsgi module never imports coverage or cli tooling. """
+
+        self.assertEqual(self.stats['forbidden'], [])
+
+    def test_wsgi_cold_start_time(self):
+        """ Verify the wsgi module starts within the time budget. """
+
+        self.assertLess(self.stats['seconds'], STARTUP_BUDGET_SECONDS)
+
+    def test_wsgi_import_count(self):
+        """ Verify the wsgi module stays within the import budget. """
+
+        self.assertLess(self.stats['modules'], MODULE_BUDGET)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,128 @@
+# ezasdf-users/project/tests/test_stats.py
+
+
+import datetime
+import json
+import unittest
+
+from project import db
+from project.api.models import User, UserStats, refresh_user_stats
+from project.api.utils import add_user, add_admin, bulk_update_users
+from project.tests.base import BaseTestCase
+from project.tests.utils import (
+    USERNAME,
+    USERNAME2,
+    EMAIL,
+    EMAIL2,
+    PASSWORD
+)
+
+
+class TestStats(BaseTestCase):
+    """ Tests for the maintained user stats and paged listings. """
+
+    def get(self, url, **params):
+        """ Sends a GET request.
+
+        :param url:
+        :param params:
+        :return: (response, data)
+        """
+
+        response = self.client.get(url, query_string=params)
+        return response, json.loads(response.data.decode())
+
+    def stats(self):
+        """ Fetches the stats through the endpoint.
+
+        :return: dict
+        """
+
+        response, data = self.get('/users/stats')
+        self.assertEqual(data['status'], 'success')
+        self.assertEqual(data['message'], 'User stats fetched.')
+        self.assert200(response)
+        return {key: data['data'][key] for key in ('total', 'active', 'inactive', 'admin')}
+
+    def test_get_stats_seeds(self):
+        """ Verify stats are counted from the table on first use. """
+
+        add_user(USERNAME, EMAIL, PASSWORD)
+        add_admin()
+        db.session.query(UserStats).delete()
+        db.session.commit()
+        with self.client:
+            self.assertEqual(self.stats(), {'total': 2, 'active': 2, 'inactive': 0, 'admin': 1})
+
+    def test_stats_maintained_on_write(self):
+        """ Verify inserts, updates, deletes and bulk changes adjust the stats. """
+
+        refresh_user_stats(db.session)
+        db.session.commit()
+        admin = add_admin()
+        user = add_user(USERNAME, EMAIL, PASSWORD)
+        user2 = add_user(USERNAME2, EMAIL2, PASSWORD)
+        user.active = False
+        db.session.commit()
+        with self.client:
+            self.assertEqual(self.stats(), {'total': 3, 'active': 2, 'inactive': 1, 'admin': 1})
+        bulk_update_users([User.id.in_([admin.id, user2.id])], {'admin': True, 'active': False})
+        db.session.commit()
+        with self.client:
+            self.assertEqual(self.stats(), {'total': 3, 'active': 0, 'inactive': 3, 'admin': 2})
+        db.session.delete(User.query.get(user2.id))
+        db.session.commit()
+        with self.client:
+            self.assertEqual(self.stats(), {'total': 2, 'active': 0, 'inactive': 2, 'admin': 1})
+        counted = refresh_user_stats(db.session).to_json()
+        self.assertEqual(counted['total'], 2)
+        self.assertEqual(counted['admin'], 1)
+
+    def test_get_users_paged(self):
+        """ Verify listings page by keyset, newest first. """
+
+        now = datetime.datetime.utcnow()
+        for n in range(5):
+            add_user('user{n}'.format(n=n), 'user{n}@test.com'.format(n=n), PASSWORD, now - datetime.timedelta(days=n % 3))
+        with self.client:
+            usernames, cursor = [], None
+            while True:
+                params = {'limit': 2}
+                if cursor:
+                    params['cursor'] = cursor
+                response, data = self.get('/users', **params)
+                self.assert200(response)
+                self.assertLessEqual(len(data['data']['users']), 2)
+                usernames += [user['username'] for user in data['data']['users']]
+                cursor = data['data']['cursor']
+                if not data['data']['has_more']:
+                    self.assertIsNone(cursor)
+                    break
+            self.assertEqual(usernames, ['user3', 'user0', 'user4', 'user1', 'user2'])
+
+    def test_get_users_total_count(self):
+        """ Verify listings report the total count on request. """
+
+        add_user(USERNAME, EMAIL, PASSWORD)
+        add_user(USERNAME2, EMAIL2, PASSWORD)
+        with self.client:
+            response, data = self.get('/users', limit=1, count='exact')
+            self.assertEqual(response.headers['X-Total-Count'], '2')
+            self.assertEqual(len(data['data']['users']), 1)
+            response, data = self.get('/users', count='estimated')
+            self.assertGreaterEqual(int(response.headers['X-Total-Count']), 0)
+            response, data = self.get('/users')
+            self.assertNotIn('X-Total-Count', response.headers)
+
+    def test_get_users_invalid_page(self):
+        """ Verify malformed limits, cursors and counts are rejected. """
+
+        with self.client:
+            for params in ({'limit': 0}, {'limit': 'a'}, {'cursor': 'abc'}, {'cursor': '2020-01-01_x'}, {'count': 'all'}):
+                response, data = self.get('/users', **params)
+                self.assertEqual(data['message'], 'Invalid payload.')
+                self.assert400(response)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,123 @@
+# ezasdf-users/project/tests/test_tracing.py
+
+
+import json
+import os
+import tempfile
+import unittest
+
+from project.api.tracing import format_traceparent, parse_traceparent
+from project.tests.base import BaseTestCase
+from project.api.utils import add_user
+from project.tests.utils import (
+    USERNAME,
+    EMAIL,
+    PASSWORD
+)
+
+
+TRACE_ID = '4bf92f3577b34da6a3ce929d0e0e4736'
+PARENT_ID = '00f067aa0ba902b7'
+
+
+class TestTraceparent(unittest.TestCase):
+    """ Tests for traceparent propagation. """
+
+    def test_parse_traceparent(self):
+        """ Verify a valid traceparent is parsed. """
+
+        header = '00-{trace}-{parent}-01'.format(trace=TRACE_ID, parent=PARENT_ID)
+        self.assertEqual(parse_traceparent(header), (TRACE_ID, PARENT_ID, True))
+
+    def test_parse_traceparent_invalid(self):
+        """ Verify malformed and all zero traceparents are ignored. """
+
+        self.assertIsNone(parse_traceparent(None))
+        self.assertIsNone(parse_traceparent('garbage'))
+        self.assertIsNone(parse_traceparent('00-{trace}-{parent}-01'.format(trace='0' * 32, parent=PARENT_ID)))
+
+    def test_format_traceparent(self):
+        """ Verify traceparents are formatted as sampled. """
+
+        self.assertEqual(
+            format_traceparent(TRACE_ID, PARENT_ID),
+            '00-{trace}-{parent}-01'.format(trace=TRACE_ID, parent=PARENT_ID)
+        )
+
+
+class TestTracing(BaseTestCase):
+    """ Tests for request tracing. """
+
+    def setUp(self):
+        """ Enables tracing to a temporary file. """
+
+        super().setUp()
+        handle, self.path = tempfile.mkstemp(suffix='.ndjson')
+        os.close(handle)
+        self.app.config['TRACING_ENABLED'] = True
+        self.app.config['TRACING_FILE'] = self.path
+
+    def tearDown(self):
+        """ Removes the trace file. """
+
+        os.remove(self.path)
+        super().tearDown()
+
+    def spans(self):
+        """ Reads the exported spans.
+
+        :return: list of dicts
+        """
+
+        with open(self.path) as f:
+            return [json.loads(line) for line in f]
+
+    def test_post_signin_spans(self):
+        """ Verify signin is broken down into lookup, verify and encode spans. """
+
+        add_user(USERNAME, EMAIL, PASSWORD)
+        with self.client:
+            response = self.client.post(
+                '/auth/signin',
+                data=json.dumps({
+                    'email': EMAIL,
+                    'password': PASSWORD
+                }),
+                content_type='application/json',
+                headers={
+                    'traceparent': '00-{trace}-{parent}-01'.format(trace=TRACE_ID, parent=PARENT_ID)
+                }
+            )
+            self.assert200(response)
+        spans = {span['name']: span for span in self.spans()}
+        root = spans['POST /auth/signin']
+        self.assertEqual(root['parent_id'], PARENT_ID)
+        self.assertEqual(root['attributes']['http.status_code'], 200)
+        self.assertEqual(response.headers['traceparent'], format_traceparent(TRACE_ID, root['span_id']))
+        self.assertEqual(spans['db.user_lookup']['parent_id'], root['span_id'])
+        self.assertEqual(spans['db.query']['parent_id'], spans['db.user_lookup']['span_id'])
+        self.assertEqual(spans['bcrypt.verify']['parent_id'], root['span_id'])
+        self.assertEqual(spans['jwt.encode']['parent_id'], root['span_id'])
+        self.assertTrue(all(span['trace_id'] == TRACE_ID for span in spans.values()))
+
+    def test_unsampled_parent(self):
+        """ Verify requests whose caller did not sample are not traced. """
+
+        with self.client:
+            response = self.client.get(
+                '/users/ping',
+                headers={
+                    'traceparent': '00-{trace}-{parent}-00'.format(trace=TRACE_ID, parent=PARENT_ID)
+                }
+            )
+            self.assertNotIn('traceparent', response.headers)
+        self.assertEqual(self.spans(), [])
+
+    def test_disabled(self):
+        """ Verify nothing is traced when disabled. """
+
+        self.app.config['TRACING_ENABLED'] = False
+        with self.client:
+            response = self.client.get('/users/ping')
+            self.assertNotIn('traceparent', response.headers)
+        self.assertEqual(self.spans(), [])
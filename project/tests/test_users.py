@@ -8,15 +8,15 @@ from project import db
 from project.tests.base import BaseTestCase
 from project.api.utils import (
     add_user,
-    add_admin,
-    get_jwt
+    add_admin
 )
 from project.tests.utils import (
     USERNAME,
     USERNAME2,
     EMAIL,
     EMAIL2,
-    PASSWORD
+    PASSWORD,
+    mint_jwt
 )
 
 
@@ -63,7 +63,7 @@ class TestUsersBlueprint(BaseTestCase):
 
         user = add_user(USERNAME, EMAIL, 'password')
         with self.client:
-            token = get_jwt(self.client, user.email)
+            token = mint_jwt(user)
             response = self.client.post(
                 '/users',
                 data=json.dumps({
@@ -86,7 +86,7 @@ class TestUsersBlueprint(BaseTestCase):
 
         admin = add_admin()
         with self.client:
-            token = get_jwt(self.client, admin.email)
+            token = mint_jwt(admin)
             response = self.client.post(
                 '/users',
                 data=json.dumps({
@@ -110,7 +110,7 @@ class TestUsersBlueprint(BaseTestCase):
 
         admin = add_admin()
         with self.client:
-            token = get_jwt(self.client, admin.email)
+            token = mint_jwt(admin)
             response = self.client.post(
                 '/users',
                 data=json.dumps({}),
@@ -130,7 +130,7 @@ class TestUsersBlueprint(BaseTestCase):
 
         admin = add_admin()
         with self.client:
-            token = get_jwt(self.client, admin.email)
+            token = mint_jwt(admin)
             response = self.client.post(
                 '/users',
                 data=json.dumps({
@@ -153,7 +153,7 @@ class TestUsersBlueprint(BaseTestCase):
 
         admin = add_admin()
         with self.client:
-            token = get_jwt(self.client, admin.email)
+            token = mint_jwt(admin)
             response = self.client.post(
                 '/users',
                 data=json.dumps({
@@ -176,7 +176,7 @@ class TestUsersBlueprint(BaseTestCase):
 
         admin = add_admin()
         with self.client:
-            token = get_jwt(self.client, admin.email)
+            token = mint_jwt(admin)
             response = self.client.post(
                 '/users',
                 data=json.dumps({
@@ -200,7 +200,7 @@ class TestUsersBlueprint(BaseTestCase):
         admin = add_admin()
         user = add_user(USERNAME, EMAIL, PASSWORD)
         with self.client:
-            token = get_jwt(self.client, admin.email)
+            token = mint_jwt(admin)
             response = self.client.post(
                 '/users',
                 data=json.dumps({
@@ -225,7 +225,7 @@ class TestUsersBlueprint(BaseTestCase):
         admin = add_admin()
         user = add_user(USERNAME, EMAIL, PASSWORD)
         with self.client:
-            token = get_jwt(self.client, admin.email)
+            token = mint_jwt(admin)
             response = self.client.post(
                 '/users',
                 data=json.dumps({
@@ -250,7 +250,7 @@ class TestUsersBlueprint(BaseTestCase):
         admin = add_admin()
         user = add_user(USERNAME, EMAIL, PASSWORD)
         with self.client:
-            token = get_jwt(self.client, admin.email)
+            token = mint_jwt(admin)
             response = self.client.post(
                 '/users',
                 data=json.dumps({
@@ -276,7 +276,7 @@ class TestUsersBlueprint(BaseTestCase):
         user.active = False
         db.session.commit()
         with self.client:
-            token = get_jwt(self.client, user.email)
+            token = mint_jwt(user)
             response = self.client.post(
                 '/users',
                 data=json.dumps({
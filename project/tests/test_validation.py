@@ -0,0 +1,110 @@
+# ezasdf-users/project/tests/test_validation.py
+
+
+import json
+import unittest
+
+from project.api.utils import add_admin
+from project.api.validation import SIGNUP
+from project.tests.base import StatementCountingTestCase
+from project.tests.utils import (
+    USERNAME,
+    EMAIL,
+    PASSWORD,
+    padded_json
+)
+
+
+class TestSchema(unittest.TestCase):
+    """ Tests for the payload schemas. """
+
+    def test_valid(self):
+        """ Verify valid payloads have no errors. """
+
+        self.assertEqual(SIGNUP.validate({'username': USERNAME, 'email': EMAIL, 'password': PASSWORD}), {})
+
+    def test_invalid(self):
+        """ Verify each field reports its own error. """
+
+        self.assertEqual(
+            SIGNUP.validate({'username': 5, 'email': 'not an email', 'password': 'x' * 129}),
+            {
+                'username': 'Must be a str.',
+                'email': 'Invalid format.',
+                'password': 'Must be at most 128 characters.'
+            }
+        )
+        self.assertEqual(SIGNUP.validate({'username': USERNAME}), {'email': 'Required.', 'password': 'Required.'})
+        self.assertEqual(SIGNUP.validate(['username']), {'payload': 'Must be an object.'})
+
+
+class TestValidation(StatementCountingTestCase):
+    """ Tests for validating request payloads. """
+
+    def test_signup_invalid(self):
+        """ Verify invalid signups are rejected with field errors before any query. """
+
+        with self.client:
+            response, data = self.send('POST', '/auth/signup', body=json.dumps({
+                'username': USERNAME,
+                'email': 'not an email',
+                'password': 'x' * 1000
+            }))
+            self.assertEqual(data['status'], 'error')
+            self.assertEqual(data['message'], 'Invalid payload.')
+            self.assertEqual(data['errors'], {
+                'email': 'Invalid format.',
+                'password': 'Must be at most 128 characters.'
+            })
+            self.assert400(response)
+            self.assertEqual(self.statements, [])
+
+    def test_signin_invalid(self):
+        """ Verify invalid signins are rejected before any query or hash. """
+
+        with self.client:
+            response, data = self.send('POST', '/auth/signin', body=json.dumps({'email': EMAIL, 'password': ['x']}))
+            self.assertEqual(data['errors'], {'password': 'Must be a str.'})
+            self.assert400(response)
+            self.assertEqual(self.statements, [])
+
+    def test_malformed_json(self):
+        """ Verify bodies that are not JSON are rejected. """
+
+        with self.client:
+            response, data = self.send('POST', '/auth/signup', body='{"username": ')
+            self.assertEqual(data['message'], 'Invalid payload.')
+            self.assert400(response)
+
+    def test_body_too_large(self):
+        """ Verify oversized bodies are rejected before they are read. """
+
+        with self.client:
+            response, data = self.send('POST', '/auth/signin', body=json.dumps({'email': EMAIL, 'password': 'x' * 2 ** 20}))
+            self.assertEqual(data['status'], 'error')
+            self.assertEqual(data['message'], 'Payload too large.')
+            self.assertEqual(response.status_code, 413)
+            self.assertEqual(self.statements, [])
+
+    def test_max_body_size(self):
+        """ Verify signup, signin and user bodies up to MAX_BODY_SIZE are accepted and larger ones are not. """
+
+        size = self.app.config['MAX_BODY_SIZE']
+        admin = add_admin()
+        longest = {'username': 'u' * 128, 'email': 'e' * 118 + '@email.com', 'password': 'p' * 128}
+        other = dict(longest, username='v' * 128, email='f' * 118 + '@email.com')
+        signin = {'email': longest['email'], 'password': longest['password']}
+        with self.client:
+            for url, user, payload, status in (
+                ('/auth/signup', None, longest, 201),
+                ('/auth/signin', None, signin, 200),
+                ('/users', admin, other, 201)
+            ):
+                response, data = self.send('POST', url, user, padded_json(payload, size))
+                self.assertEqual(response.status_code, status, url)
+                response, data = self.send('POST', url, user, padded_json(payload, size + 1))
+                self.assertEqual(response.status_code, 413, url)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,6 +1,35 @@
+# ezasdf-users/project/tests/utils.py
+
+
+import json
+
+
 # test user variables
 USERNAME = 'test'
 USERNAME2 = 'test2'
 EMAIL = 'test@email.com'
 EMAIL2 = 'test2@email.com'
-PASSWORD = 'password'
\ No newline at end of file
+PASSWORD = 'password'
+
+
+def mint_jwt(user):
+    """ Mints the given user's token without signing in.
+
+    :param user:
+    :return: str
+    """
+
+    return user.encode_jwt(user.id).decode()
+
+
+def padded_json(payload, size):
+    """ Dumps payload padded with whitespace to exactly size bytes.
+
+    :param payload:
+    :param size:
+    :return: str
+    """
+
+    body = json.dumps(payload)
+    assert len(body.encode()) <= size
+    return body + ' ' * (size - len(body.encode()))
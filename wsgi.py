@@ -0,0 +1,7 @@
+# ezasdf-users/wsgi.py
+
+
+from project import create_app
+
+
+app = create_app()